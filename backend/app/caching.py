@@ -0,0 +1,119 @@
+import sys
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+def normalize_query(text: str) -> str:
+    """
+    Cache key for a query: whitespace-collapsed and case-folded
+
+    Case folding is safe for the default uncased MiniLM model, whose
+    tokenizer lower-cases its input anyway.
+    """
+    return " ".join(text.split()).casefold()
+
+def _deep_size(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_deep_size(k) + _deep_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_deep_size(item) for item in value)
+    return sys.getsizeof(value)
+
+def estimate_size(key: Hashable, value: Any) -> int:
+    """Approximate bytes held by a cache entry, following nested containers"""
+    return _deep_size(key) + _deep_size(value)
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by total size in bytes
+
+    Entry sizes are computed with `sizeof` (estimate_size by default) and the
+    least recently used entries are evicted until the total fits `max_bytes`.
+    With `ttl_seconds` set, entries older than the TTL are treated as misses
+    and dropped on access. Hit, miss, eviction and expiration counters are
+    kept for reporting.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[Hashable, Any], int] = estimate_size,
+        ttl_seconds: Optional[float] = None
+    ):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._expires: Dict[Hashable, float] = {}
+        self._sizes: Dict[Hashable, int] = {}
+        self._lock = Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            if key in self._expires and self._expires[key] <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        size = self._sizeof(key, value)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._entries[key] = value
+            self._sizes[key] = size
+            if self.ttl_seconds is not None:
+                self._expires[key] = time.monotonic() + self.ttl_seconds
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: Hashable) -> None:
+        del self._entries[key]
+        self._expires.pop(key, None)
+        self.current_bytes -= self._sizes.pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._expires.clear()
+            self.current_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,76 @@
+import re
+from typing import Any, List, Optional, Sequence, Tuple
+
+from .utils.logger import rag_logger
+
+# Rough subword tokens per whitespace-separated word for English text with a
+# WordPiece vocabulary, used when the model tokenizer cannot be loaded
+APPROX_TOKENS_PER_WORD = 1.3
+
+def load_tokenizer(model_name: str) -> Optional[Any]:
+    """Load the embedding model's fast tokenizer, or None if it is unavailable"""
+    try:
+        from transformers import AutoTokenizer
+        return AutoTokenizer.from_pretrained(model_name)
+    except Exception as e:
+        rag_logger.warning(f"Tokenizer for {model_name} unavailable, approximating tokens by words: {str(e)}")
+        return None
+
+class TextChunker:
+    """
+    Splits long texts into overlapping windows of embedding-model tokens
+
+    Texts of at most `window_tokens` tokens are returned whole. Longer texts
+    become windows of `window_tokens` tokens that start every
+    `window_tokens - overlap_tokens` tokens, so a sentence cut at one
+    boundary appears whole in the neighbouring chunk. Windows are widened
+    to word boundaries so subword pieces are never split, and each chunk is
+    the exact slice of the original text its tokens cover.
+
+    `tokenizer` is a Hugging Face fast tokenizer (offset mappings are
+    required). Without one, whitespace words are used with the window scaled
+    by APPROX_TOKENS_PER_WORD.
+    """
+
+    def __init__(self, window_tokens: int = 200, overlap_tokens: int = 40, tokenizer: Optional[Any] = None):
+        if not 0 <= overlap_tokens < window_tokens:
+            raise ValueError("overlap_tokens must be at least 0 and smaller than window_tokens")
+        self.tokenizer = tokenizer
+        if tokenizer is None:
+            window_tokens = max(1, int(window_tokens / APPROX_TOKENS_PER_WORD))
+            overlap_tokens = min(int(overlap_tokens / APPROX_TOKENS_PER_WORD), window_tokens - 1)
+        self.window = window_tokens
+        self.step = window_tokens - overlap_tokens
+
+    def _spans(self, text: str) -> Sequence[Tuple[int, int]]:
+        """Character (start, end) of each token"""
+        if self.tokenizer is not None:
+            encoding = self.tokenizer(
+                text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+            )
+            return encoding["offset_mapping"]
+        return [match.span() for match in re.finditer(r"\S+", text)]
+
+    @staticmethod
+    def _word_boundary(spans: Sequence[Tuple[int, int]], index: int) -> int:
+        """First token index at or after `index` that does not continue the previous token's word"""
+        while 0 < index < len(spans) and spans[index][0] == spans[index - 1][1]:
+            index += 1
+        return index
+
+    def chunk(self, text: str) -> List[str]:
+        spans = self._spans(text)
+        if len(spans) <= self.window:
+            return [text]
+
+        chunks = []
+        start = 0
+        while start < len(spans):
+            end = self._word_boundary(spans, min(start + self.window, len(spans)))
+            chunks.append(text[spans[start][0]:spans[end - 1][1]])
+            if end >= len(spans):
+                break
+            next_start = self._word_boundary(spans, start + self.step)
+            # A single unbroken "word" longer than the window still advances
+            start = next_start if next_start < end else end
+        return chunks
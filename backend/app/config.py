@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Optional
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
@@ -18,13 +18,105 @@ class Settings(BaseSettings):
 
     # Application Settings
     MAX_CONVERSATION_HISTORY: int = 10
+    # Token budget for the assembled chat prompt (system prompt, recent
+    # turns, then retrieved examples). PROMPT_TOKENIZER names a local
+    # Hugging Face tokenizer to count with; empty uses a fast approximation.
+    PROMPT_TOKEN_BUDGET: int = 2048
+    PROMPT_TOKENIZER: str = ""
     SESSION_TIMEOUT_HOURS: int = 24
     CORS_ORIGINS: List[str] = ["http://localhost:3000"]
     LOG_LEVEL: str = "INFO"
 
     # RAG System Settings
+    # Vector index backend: "chroma" (HNSW collection) or "numpy" (memory-mapped brute force)
+    VECTOR_STORE_BACKEND: str = "chroma"
+    # Storage precision for the numpy backend: "float32", "float16" or "int8"
+    VECTOR_STORE_DTYPE: str = "float32"
+    # Re-rank quantized candidates against a float32 copy (n_results * factor candidates)
+    VECTOR_STORE_RESCORE: bool = True
+    VECTOR_STORE_RESCORE_FACTOR: int = 4
+    # HNSW parameters of the chroma backend by named profile. HNSW_PROFILE is
+    # applied when a collection is created; HNSW_SEARCH_EF overrides the
+    # profile's search_ef and is applied to existing collections when the
+    # ingest worker opens them.
+    HNSW_PROFILES: Dict[str, Dict[str, int]] = {
+        "fast": {"M": 8, "construction_ef": 64, "search_ef": 20},
+        # Chroma's own defaults, so existing collections keep their behaviour
+        "balanced": {"M": 16, "construction_ef": 100, "search_ef": 100},
+        "accurate": {"M": 32, "construction_ef": 200, "search_ef": 200}
+    }
+    HNSW_PROFILE: str = "balanced"
+    HNSW_SEARCH_EF: Optional[int] = None
+    # One collection per source group ("partition" in DATASET_CONFIGS) instead of one shared collection
+    PARTITIONED_INDEX: bool = False
     RAG_N_RESULTS: int = 3
+    # "vector", "lexical" (BM25) or "hybrid" (both, fused by reciprocal rank)
+    RETRIEVAL_MODE: str = "vector"
+    # Each retriever returns n_results * factor candidates before fusion
+    HYBRID_CANDIDATE_FACTOR: int = 4
+    RRF_K: int = 60
+    # Diversify results by maximal marginal relevance over n_results * factor candidates
+    MMR_ENABLED: bool = False
+    MMR_CANDIDATE_FACTOR: int = 5
+    # 1.0 ranks by relevance only, 0.0 by diversity only
+    MMR_LAMBDA: float = 0.5
+    # Memory budget for cached query embeddings
+    QUERY_EMBEDDING_CACHE_BYTES: int = 8 * 1024 * 1024
+    # Memory budget and lifetime for cached retrieval results
+    RETRIEVAL_CACHE_BYTES: int = 16 * 1024 * 1024
+    RETRIEVAL_CACHE_TTL_SECONDS: int = 600
+    # Thread pool that runs query encoding and vector search off the event loop
+    RETRIEVAL_WORKERS: int = 4
+    RETRIEVAL_MAX_CONCURRENCY: int = 4
+    # Retrievals allowed to wait for a slot before new ones are rejected
+    RETRIEVAL_MAX_QUEUE: int = 64
+    # Concurrent queries arriving within this window are encoded as one batch (0 disables)
+    QUERY_BATCH_WINDOW_MS: float = 3.0
+    QUERY_BATCH_MAX_SIZE: int = 32
     BATCH_SIZE: int = 100
+    # Split long documents into overlapping windows of embedding-model tokens
+    CHUNKING_ENABLED: bool = True
+    CHUNK_TOKENS: int = 200
+    CHUNK_OVERLAP_TOKENS: int = 40
+    # Extra candidates fetched per result so several chunks of one parent can collapse to its best
+    CHUNK_CANDIDATE_FACTOR: int = 2
+    # Longest string value kept in a document's projected metadata
+    METADATA_MAX_STRING_LENGTH: int = 256
+    # Max batches buffered between indexing pipeline stages
+    PIPELINE_QUEUE_SIZE: int = 4
+    # Persistent cache of document embeddings by model and text hash, kept outside
+    # VECTOR_DB_PATH so rebuilds with an unchanged model skip encoding. Query
+    # embeddings are looked up in it but only stored with EMBEDDING_CACHE_QUERIES,
+    # since that writes user messages to disk.
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_PATH: str = "./embedding_cache"
+    EMBEDDING_CACHE_QUERIES: bool = False
+    # Worker processes used to encode batches during bulk indexing (1 = in-process)
+    EMBEDDING_WORKERS: int = 1
+    # Worker processes that download and clean datasets concurrently ahead of embedding (1 = in-process)
+    PREP_WORKERS: int = 1
+    # Processes each dataset's batched cleaning map is split over (None = the loading process)
+    PREP_NUM_PROC: Optional[int] = None
+    # Ingestion jobs run in a separate worker process fed by this SQLite queue
+    INGEST_QUEUE_PATH: str = "./ingest_jobs.sqlite3"
+    # Start the worker with the API; disable when it runs on its own (scripts/ingest_worker.py).
+    # Only the worker writes the index; the API opens chroma collections read-only.
+    INGEST_WORKER_ENABLED: bool = True
+    INGEST_POLL_SECONDS: float = 1.0
+    # Rebuilds index a new version and only swap it live when it passes validation:
+    # at least this share of the live version's documents, and stored vectors
+    # found among their own top K neighbours for this share of a sample
+    INDEX_MIN_COUNT_RATIO: float = 0.9
+    INDEX_VALIDATION_SAMPLES: int = 100
+    INDEX_VALIDATION_K: int = 10
+    INDEX_MIN_SAMPLE_RECALL: float = 0.9
+
+    # Cross-dataset deduplication before embedding
+    DEDUP_ENABLED: bool = True
+    # Estimated Jaccard similarity above which documents count as near duplicates
+    DEDUP_SIMILARITY_THRESHOLD: float = 0.85
+    DEDUP_NUM_PERM: int = 64
+    DEDUP_SHINGLE_SIZE: int = 5
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,303 @@
+import json
+import multiprocessing
+import os
+import re
+import shutil
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+from datasets import Dataset, Features, Value, concatenate_datasets, load_dataset, load_from_disk
+
+from .chunking import TextChunker, load_tokenizer
+from .config import settings
+from .index_manifest import document_id
+from .utils.logger import rag_logger
+
+class TherapyDatasetProcessor:
+    """Handles processing and standardization of various therapy datasets"""
+    
+    # Dataset configurations with verified column names
+    # "text_column": single column containing text
+    # "text_columns": list of columns to combine (e.g., Context + Response)
+    DATASET_CONFIGS = {
+        # Verified working datasets with correct column mappings
+        "Amod/mental_health_counseling_conversations": {
+            "text_columns": ["Context", "Response"], "partition": "counseling"
+        },
+        "LuangMV97/Empathetic_counseling_Dataset": {"text_column": "input", "partition": "counseling"},
+        "ShenLab/MentalChat16K": {"text_columns": ["instruction", "input", "output"], "partition": "dialogue"},
+        "IINOVAII/therapy-conversations-combined": {
+            "text_columns": ["instruction", "input", "output"], "partition": "dialogue"
+        },
+        "anirudh2403/therapy-conversation-synthetic": {"text_column": "Conversations", "partition": "dialogue"},
+        "MeetX/mental-health-dataset-mistral7b": {"text_column": "text", "partition": "dialogue"},
+        "marmikpandya/mental-health": {"text_columns": ["instruction", "output"], "partition": "counseling"},
+        "dair-ai/emotion": {"text_column": "text", "metadata_fields": {"label": int}, "partition": "emotion"},
+    }
+    # Every document keeps "source" and "split"; "metadata_fields" maps any
+    # further raw columns to keep onto the type they are stored as. Other
+    # columns are dropped so they are not stored and deserialized per query.
+    METADATA_TYPES = (str, int, float, bool)
+    # Set by _chunk_document and always kept, so chunks stay linked to their parent
+    CHUNK_FIELDS = ("parent_id", "chunk_index", "chunk_count")
+    # Columns of a prepared dataset: one row per document (or chunk), metadata as JSON
+    PREPARED_FEATURES = Features({"text": Value("string"), "metadata": Value("string"), "row": Value("int64")})
+
+    @classmethod
+    def partition_routes(cls) -> Dict[str, str]:
+        """Map each dataset to its index partition (the dataset itself when none is declared)"""
+        return {name: config.get("partition", name) for name, config in cls.DATASET_CONFIGS.items()}
+
+    def __init__(self):
+        self.logger = rag_logger.getChild("DatasetProcessor")
+        self._chunker: Optional[TextChunker] = None
+
+    @property
+    def chunker(self) -> TextChunker:
+        """Chunker using the embedding model's tokenizer, loaded on first use"""
+        if self._chunker is None:
+            self._chunker = TextChunker(
+                window_tokens=settings.CHUNK_TOKENS,
+                overlap_tokens=settings.CHUNK_OVERLAP_TOKENS,
+                tokenizer=load_tokenizer(settings.EMBEDDING_MODEL)
+            )
+        return self._chunker
+
+    def load_dataset(self, dataset_name: str) -> List[Dict[str, Any]]:
+        """Load and process a dataset from Hugging Face into memory"""
+        processed_data = list(self.iter_documents(dataset_name))
+        self.logger.info(f"Processed {len(processed_data)} entries from {dataset_name}")
+        return processed_data
+
+    def iter_documents(
+        self,
+        dataset_name: str,
+        start_row: int = 0,
+        num_proc: Optional[int] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Stream processed documents from a dataset one row at a time
+
+        The dataset is cleaned by `prepare` into memory-mapped Arrow files
+        and read back in blocks, so callers that consume the generator in
+        fixed-size batches never hold more than a block of documents in
+        memory. Errors are logged and end the stream.
+        """
+        try:
+            prepared = self.prepare(dataset_name, start_row=start_row, num_proc=num_proc)
+        except Exception as e:
+            self.logger.error(f"Error processing dataset {dataset_name}: {str(e)}")
+            return
+        if prepared is not None:
+            yield from self.iter_prepared(prepared)
+
+    def prepare(self, dataset_name: str, start_row: int = 0, num_proc: Optional[int] = None) -> Optional[Dataset]:
+        """
+        Load a dataset and clean it into one table of documents
+
+        Each split is cleaned with a batched `map` (over `num_proc`
+        processes when given) into PREPARED_FEATURES columns. Each document
+        carries its `row` position across all splits; rows before
+        `start_row` are skipped without being processed, which is used to
+        resume indexing. With CHUNKING_ENABLED, a long row becomes one
+        document per chunk, all with the same `row`. Returns None when
+        every row is skipped.
+        """
+        config = self.DATASET_CONFIGS[dataset_name]
+        dataset = load_dataset(dataset_name)
+
+        parts, row = [], 0
+        for split in dataset.keys():
+            data = dataset[split]
+            offset, row = row, row + len(data)
+            skip = min(max(start_row - offset, 0), len(data))
+            if skip == len(data):
+                continue
+            if skip:
+                data = data.select(range(skip, len(data)))
+            parts.append(data.map(
+                self._process_batch,
+                batched=True,
+                with_indices=True,
+                num_proc=num_proc,
+                remove_columns=data.column_names,
+                features=self.PREPARED_FEATURES,
+                # The settings read by _process_batch are not part of the cache fingerprint
+                load_from_cache_file=False,
+                fn_kwargs={"config": config, "dataset_name": dataset_name, "split": split, "offset": offset + skip},
+                desc=f"Cleaning {dataset_name} [{split}]"
+            ))
+        return concatenate_datasets(parts) if parts else None
+
+    @staticmethod
+    def iter_prepared(prepared: Dataset, block_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Yield the documents of a prepared table in order"""
+        for block in prepared.iter(batch_size=block_size):
+            for text, metadata, row in zip(block["text"], block["metadata"], block["row"]):
+                yield {"text": text, "metadata": json.loads(metadata), "row": row}
+
+    def _process_batch(
+        self,
+        batch: Dict[str, List[Any]],
+        indices: List[int],
+        config: Dict[str, Any],
+        dataset_name: str,
+        split: str,
+        offset: int
+    ) -> Dict[str, List[Any]]:
+        """Batched `map` function: clean a block of raw rows into document columns"""
+        size = len(indices)
+        # Handle single column or multiple columns to combine
+        if "text_column" in config:
+            raw_texts = batch.get(config["text_column"], [""] * size)
+        elif "text_columns" in config:
+            # Combine multiple columns (e.g., Context + Response)
+            columns = [(col, batch.get(col, [None] * size)) for col in config["text_columns"]]
+            raw_texts = [
+                "\n".join(f"{col}: {values[i]}" for col, values in columns if values[i])
+                for i in range(size)
+            ]
+        else:
+            raw_texts = [None] * size
+
+        fields = [field for field in config.get("metadata_fields", {}) if field in batch]
+        output: Dict[str, List[Any]] = {"text": [], "metadata": [], "row": []}
+        for i, raw_text in enumerate(raw_texts):
+            processed_text = self._process_text(raw_text)
+            if not processed_text:
+                continue
+            item = {field: batch[field][i] for field in fields}
+            document = {
+                "text": processed_text,
+                "metadata": self.project_metadata(item, config, dataset_name, split)
+            }
+            for chunk in self._chunk_document(document):
+                output["text"].append(chunk["text"])
+                output["metadata"].append(json.dumps(chunk["metadata"]))
+                output["row"].append(offset + indices[i])
+        return output
+
+    @classmethod
+    def project_metadata(
+        cls,
+        item: Dict[str, Any],
+        config: Dict[str, Any],
+        dataset_name: str,
+        split: str
+    ) -> Dict[str, Any]:
+        """
+        Keep only the metadata fields declared in the dataset config
+
+        Values are cast to their declared type and strings are truncated to
+        METADATA_MAX_STRING_LENGTH characters; values that are missing or
+        cannot be cast are left out. CHUNK_FIELDS are kept as they are.
+        """
+        metadata = {"source": dataset_name, "split": split}
+        metadata.update((field, item[field]) for field in cls.CHUNK_FIELDS if item.get(field) is not None)
+        for field, field_type in config.get("metadata_fields", {}).items():
+            if field_type not in cls.METADATA_TYPES:
+                raise ValueError(f"Unsupported metadata type for {dataset_name}.{field}: {field_type}")
+            value = item.get(field)
+            if value is None:
+                continue
+            try:
+                value = field_type(value)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(value, str):
+                value = value[:settings.METADATA_MAX_STRING_LENGTH]
+            metadata[field] = value
+        return metadata
+
+    def _chunk_document(self, document: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Split a long document into chunk documents linked to their parent
+
+        Chunks carry the parent's metadata plus "parent_id" (the id the
+        whole document would have had), "chunk_index" and "chunk_count".
+        """
+        # Every token covers at least one character, so short texts need no tokenizing
+        if not settings.CHUNKING_ENABLED or len(document["text"]) <= settings.CHUNK_TOKENS:
+            return [document]
+        chunks = self.chunker.chunk(document["text"])
+        if len(chunks) == 1:
+            return [document]
+        metadata = document["metadata"]
+        parent_id = document_id(document["text"], metadata["source"])
+        return [
+            {
+                "text": chunk,
+                "metadata": {**metadata, "parent_id": parent_id, "chunk_index": i, "chunk_count": len(chunks)}
+            }
+            for i, chunk in enumerate(chunks)
+        ]
+
+    def _process_text(self, text: str) -> Optional[str]:
+        """Clean and standardize text data"""
+        if not isinstance(text, str):
+            return None
+        
+        # Basic cleaning
+        text = text.strip()
+        text = " ".join(text.split())  # Normalize whitespace
+        
+        # Filter out empty or very short texts
+        if len(text) < 10:
+            return None
+            
+        return text
+
+def _prepare_in_worker(dataset_name: str, start_row: int, num_proc: Optional[int], path: str) -> Optional[str]:
+    """Prepare a dataset in a worker process and save it under `path`"""
+    prepared = TherapyDatasetProcessor().prepare(dataset_name, start_row=start_row, num_proc=num_proc)
+    if prepared is None:
+        return None
+    prepared.save_to_disk(path)
+    return path
+
+class DatasetPrepPool:
+    """
+    Multi-process download and cleaning of datasets ahead of embedding
+
+    Each submitted dataset is loaded and cleaned by `prepare` in one of
+    `workers` processes (its `map` further split over `num_proc`), and the
+    prepared table is saved under `work_dir`. Datasets prepare concurrently,
+    so while the first is being embedded the rest are already downloading
+    and cleaning, and the prepare time of a full rebuild approaches that of
+    the slowest dataset. Results are memory-mapped back with `result`.
+    """
+
+    def __init__(self, workers: int, work_dir: str, num_proc: Optional[int] = None):
+        self.logger = rag_logger.getChild("DatasetPrepPool")
+        self.workers = max(1, workers)
+        self.work_dir = work_dir
+        self.num_proc = num_proc
+        shutil.rmtree(work_dir, ignore_errors=True)
+        os.makedirs(work_dir)
+        # spawn, like EmbeddingPool, so workers never inherit a parent's threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.logger.info(f"Started dataset prep pool with {self.workers} workers")
+
+    def submit(self, dataset_name: str, start_row: int = 0) -> Future:
+        """Load and clean one dataset in a worker process"""
+        path = os.path.join(self.work_dir, re.sub(r"[^a-zA-Z0-9_-]+", "_", dataset_name))
+        return self._executor.submit(_prepare_in_worker, dataset_name, start_row, self.num_proc, path)
+
+    @staticmethod
+    def result(future: Future) -> Optional[Dataset]:
+        """Wait for a submitted dataset and open its prepared table (None if it had no rows to prepare)"""
+        path = future.result()
+        return load_from_disk(path) if path else None
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def __enter__(self) -> "DatasetPrepPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
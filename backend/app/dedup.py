@@ -0,0 +1,229 @@
+import hashlib
+import os
+import re
+import zlib
+from itertools import repeat
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .utils.logger import rag_logger
+
+# MinHash permutations are computed modulo a Mersenne prime so that
+# a * x + b stays within uint64 for 32-bit shingle hashes
+_MERSENNE_PRIME = np.uint64((1 << 31) - 1)
+_TOKEN_RE = re.compile(r"\w+")
+
+def _lsh_params(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Pick (bands, rows) with bands * rows == num_perm whose S-curve
+    threshold (1 / bands) ** (1 / rows) is the highest one not above
+    `threshold`, favouring recall since candidates are verified afterwards
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold:
+            best = (bands, rows)
+    return best
+
+class Deduplicator:
+    """
+    Exact and near-duplicate filter for documents streamed into the index
+
+    Exact duplicates are caught with a hash of the case- and
+    whitespace-normalized text. Near duplicates are caught with MinHash
+    signatures over word shingles and banded LSH: documents sharing a band
+    bucket with an already kept document are dropped when their estimated
+    Jaccard similarity reaches `threshold`. The first occurrence wins, so the
+    order of DATASET_CONFIGS decides which source keeps a shared example.
+    Registered documents can be saved and loaded again, so a later run does
+    not recompute the signatures of everything already indexed.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.85,
+        num_perm: int = 64,
+        shingle_size: int = 5,
+        seed: int = 1
+    ):
+        self.logger = rag_logger.getChild("Deduplicator")
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _lsh_params(num_perm, threshold)
+        self._params = [threshold, num_perm, shingle_size, seed]
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+        self._b = rng.integers(0, int(_MERSENNE_PRIME), size=num_perm, dtype=np.uint64)[:, None]
+
+        self._exact_hashes: set = set()
+        self._buckets: List[Dict[int, int]] = [{} for _ in range(self.bands)]
+        # Per registered document, in registration order
+        self._exact_keys: List[bytes] = []
+        self._signatures: List[np.ndarray] = []
+        self._sources: List[Optional[str]] = []
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def _normalize(self, text: str) -> List[str]:
+        return _TOKEN_RE.findall(text.lower())
+
+    def _signature(self, tokens: List[str]) -> np.ndarray:
+        k = self.shingle_size
+        if len(tokens) <= k:
+            shingles = [" ".join(tokens)]
+        else:
+            shingles = [" ".join(tokens[i:i + k]) for i in range(len(tokens) - k + 1)]
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode("utf-8")) for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        ) % _MERSENNE_PRIME
+        return ((self._a * hashes[None, :] + self._b) % _MERSENNE_PRIME).min(axis=1).astype(np.uint32)
+
+    def _match(self, text: str) -> Tuple[Optional[str], bytes, np.ndarray, List[int]]:
+        """Classify a text against registered documents without registering it"""
+        tokens = self._normalize(text)
+        exact_key = hashlib.blake2b(" ".join(tokens).encode("utf-8"), digest_size=8).digest()
+        if exact_key in self._exact_hashes:
+            return "exact", exact_key, None, []
+
+        signature = self._signature(tokens)
+        band_keys = self._band_keys(signature)
+        candidates = {
+            self._buckets[band][key]
+            for band, key in enumerate(band_keys)
+            if key in self._buckets[band]
+        }
+        for candidate in candidates:
+            if np.mean(self._signatures[candidate] == signature) >= self.threshold:
+                return "near", exact_key, signature, band_keys
+        return None, exact_key, signature, band_keys
+
+    def _band_keys(self, signature: np.ndarray) -> List[int]:
+        return [
+            hash(signature[band * self.rows:(band + 1) * self.rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def _register(
+        self,
+        exact_key: bytes,
+        signature: np.ndarray,
+        band_keys: List[int],
+        source: Optional[str] = None
+    ) -> None:
+        doc_index = len(self._signatures)
+        self._signatures.append(signature)
+        self._exact_keys.append(exact_key)
+        self._sources.append(source)
+        self._exact_hashes.add(exact_key)
+        for band, key in enumerate(band_keys):
+            self._buckets[band].setdefault(key, doc_index)
+
+    def check(self, text: str, source: str) -> Optional[str]:
+        """
+        Register a document and classify it
+
+        Returns "exact" or "near" for duplicates of an earlier document, or
+        None if the document is new (and now kept).
+        """
+        counts = self.stats.setdefault(source, {"kept": 0, "exact": 0, "near": 0})
+        kind, exact_key, signature, band_keys = self._match(text)
+        if kind:
+            counts[kind] += 1
+            return kind
+        self._register(exact_key, signature, band_keys, source)
+        counts["kept"] += 1
+        return None
+
+    def seed(self, texts: Iterable[str], sources: Optional[Iterable[Optional[str]]] = None) -> int:
+        """
+        Register documents that are already indexed, so later duplicates of
+        them are dropped; they are not counted in the stats. `sources` gives
+        each text's source, which `save` keeps. Returns how many were
+        registered.
+        """
+        seeded = 0
+        for text, source in zip(texts, repeat(None) if sources is None else sources):
+            kind, exact_key, signature, band_keys = self._match(text)
+            if kind is None:
+                self._register(exact_key, signature, band_keys, source)
+                seeded += 1
+        return seeded
+
+    def save(self, path: str, indexed: int) -> None:
+        """
+        Persist the registered documents' hashes, signatures and sources,
+        recording that they stand for the `indexed` documents of a store
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                params=np.array(self._params, dtype=np.float64),
+                indexed=np.array(indexed, dtype=np.int64),
+                exact_keys=np.frombuffer(b"".join(self._exact_keys), dtype=np.uint64),
+                signatures=np.array(self._signatures, dtype=np.uint32).reshape(-1, self.num_perm),
+                sources=np.array([source or "" for source in self._sources], dtype=str)
+            )
+        os.replace(tmp_path, path)
+
+    def load(self, path: str, indexed: int, exclude_sources: Iterable[str] = ()) -> Optional[int]:
+        """
+        Register the documents saved at `path` without recomputing their
+        signatures, leaving out those of `exclude_sources`
+
+        Nothing is registered, and None returned, when there is no saved
+        state, it was saved with other parameters or it does not stand for
+        exactly `indexed` documents. Otherwise returns how many were
+        registered.
+        """
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as state:
+                if state["params"].tolist() != self._params or int(state["indexed"]) != indexed:
+                    return None
+                exact_keys, signatures, sources = state["exact_keys"], state["signatures"], state["sources"]
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning(f"Ignoring unreadable deduplication state {path}: {e}")
+            return None
+
+        excluded = set(exclude_sources)
+        loaded = 0
+        for exact_key, signature, source in zip(exact_keys, signatures, sources.tolist()):
+            if source in excluded:
+                continue
+            self._register(exact_key.tobytes(), signature, self._band_keys(signature), source or None)
+            loaded += 1
+        return loaded
+
+    def filter(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Return only the documents that are not duplicates of earlier ones"""
+        return [
+            doc for doc in documents
+            if self.check(doc["text"], doc["metadata"]["source"]) is None
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-source counts of kept and dropped documents"""
+        return {
+            "threshold": self.threshold,
+            "bands": self.bands,
+            "rows": self.rows,
+            "sources": {source: dict(counts) for source, counts in self.stats.items()}
+        }
+
+    def log_report(self) -> None:
+        for source, counts in self.stats.items():
+            dropped = counts["exact"] + counts["near"]
+            self.logger.info(
+                f"{source}: kept {counts['kept']}, dropped {dropped} "
+                f"({counts['exact']} exact, {counts['near']} near-duplicate)"
+            )
@@ -0,0 +1,349 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .utils.logger import rag_logger
+
+def text_key(text: str) -> str:
+    """Cache key of a text: a hash of its exact content"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed cache of embeddings for one model
+
+    Layout under `path/<model>`:
+      - vectors-<n>.f32: append-only row-major float32 matrix of embeddings,
+        memory-mapped for lookups
+      - cache.sqlite3: text hash -> matrix row, plus the current matrix
+        file, row count, dimension and cumulative hit/miss counters
+
+    Entries are keyed by (model name, text hash), so a cached vector is
+    exactly what the model returns for that text, and any rebuild that
+    encodes the same texts with the same model (new store settings,
+    chunking of other datasets, a lost VECTOR_DB_PATH) reads them back
+    instead of encoding again. Appends hold an SQLite write transaction, so
+    several processes can share a cache; rows written before a crash but
+    never committed are truncated by the next append. `compact` rewrites
+    the matrix into a new file, keeping only the entries still wanted.
+    """
+
+    DB_FILE = "cache.sqlite3"
+    # Seconds between writes of the cumulative hit/miss counters
+    STATS_FLUSH_SECONDS = 10.0
+
+    def __init__(self, path: str, model_name: str):
+        self.logger = rag_logger.getChild("EmbeddingCache")
+        self.model_name = model_name
+        self.path = os.path.join(path, re.sub(r"[^a-zA-Z0-9_.-]+", "_", model_name))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # (file name, rows, memory map) of the last matrix read
+        self._matrix: Optional[Tuple[str, int, np.ndarray]] = None
+        self.hits = 0
+        self.misses = 0
+        self._unflushed = [0, 0]
+        self._flushed_at = time.monotonic()
+
+    def _connect(self, create: bool = True) -> Optional[sqlite3.Connection]:
+        """The cache database, created by the first append (None before that unless `create`)"""
+        if self._conn is not None:
+            return self._conn
+        if not create and not os.path.exists(os.path.join(self.path, self.DB_FILE)):
+            return None
+        os.makedirs(self.path, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(self.path, self.DB_FILE), check_same_thread=False, timeout=60, isolation_level=None
+        )
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, row INTEGER) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER);
+            """
+        )
+        self._conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('model', ?)", (self.model_name,))
+        stored_model = self._conn.execute("SELECT value FROM meta WHERE name = 'model'").fetchone()[0]
+        if stored_model != self.model_name:
+            raise ValueError(f"Embedding cache at {self.path} belongs to model {stored_model}")
+        return self._conn
+
+    def _meta(self) -> Dict[str, Any]:
+        meta = dict(self._conn.execute("SELECT name, value FROM meta"))
+        return {
+            "file": meta.get("file", "vectors-0.f32"),
+            "rows": int(meta.get("rows", 0)),
+            "dim": int(meta["dim"]) if "dim" in meta else None
+        }
+
+    def _read_matrix(self, meta: Dict[str, Any]) -> Optional[np.ndarray]:
+        """Memory map of the committed rows, remapped when the file or row count changed"""
+        if not meta["rows"]:
+            return None
+        if self._matrix is None or self._matrix[:2] != (meta["file"], meta["rows"]):
+            matrix = np.memmap(
+                os.path.join(self.path, meta["file"]), dtype=np.float32, mode="r", shape=(meta["rows"], meta["dim"])
+            )
+            self._matrix = (meta["file"], meta["rows"], matrix)
+        return self._matrix[2]
+
+    def lookup(self, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """Cached embedding of each text, or None for texts not in the cache"""
+        keys = [text_key(text) for text in texts]
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            conn = self._connect(create=False)
+            if conn is None:
+                self._record(0, len(keys))
+                return [None] * len(keys)
+            while True:
+                # One read transaction, so rows and the matrix file are a consistent snapshot
+                conn.execute("BEGIN")
+                try:
+                    meta = self._meta()
+                    rows: Dict[str, int] = {}
+                    for start in range(0, len(unique), 500):
+                        chunk = unique[start:start + 500]
+                        rows.update(conn.execute(
+                            f"SELECT key, row FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                        ))
+                finally:
+                    conn.execute("COMMIT")
+                try:
+                    matrix = self._read_matrix(meta) if rows else None
+                    break
+                except FileNotFoundError:
+                    # Compacted by another process since the snapshot; read the new file
+                    continue
+            embeddings = [np.array(matrix[rows[key]]) if key in rows else None for key in keys]
+            hits = sum(embedding is not None for embedding in embeddings)
+            self._record(hits, len(keys) - hits)
+        return embeddings
+
+    def put(self, texts: List[str], embeddings: Any) -> int:
+        """Append embeddings of texts not cached yet; returns how many were added"""
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._meta()
+                if meta["dim"] is None:
+                    meta["dim"] = int(vectors.shape[1])
+                    conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(meta["dim"]),))
+                elif vectors.shape[1] != meta["dim"]:
+                    raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match cache dimension {meta['dim']}")
+
+                new: Dict[str, int] = {}
+                for i, text in enumerate(texts):
+                    new.setdefault(text_key(text), i)
+                keys = list(new)
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start:start + 500]
+                    for (key,) in conn.execute(
+                        f"SELECT key FROM entries WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                    ):
+                        del new[key]
+
+                if new:
+                    path = os.path.join(self.path, meta["file"])
+                    # Rows past the committed count were never committed; drop them before appending
+                    with open(path, "ab") as f:
+                        f.truncate(meta["rows"] * meta["dim"] * 4)
+                        f.write(vectors[list(new.values())].tobytes())
+                    conn.executemany(
+                        "INSERT INTO entries (key, row) VALUES (?, ?)",
+                        [(key, meta["rows"] + offset) for offset, key in enumerate(new)]
+                    )
+                    conn.execute(
+                        "INSERT OR REPLACE INTO meta (name, value) VALUES ('rows', ?)", (str(meta["rows"] + len(new)),)
+                    )
+                    conn.execute("INSERT OR IGNORE INTO meta (name, value) VALUES ('file', ?)", (meta["file"],))
+                self._flush_counters()
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return len(new)
+
+    def encode(self, texts: List[str], encoder: Callable[[List[str]], Any], store: bool = True) -> Any:
+        """
+        Embed texts, encoding only cache misses with `encoder`
+
+        `encoder` may return the embeddings or a Future of them (e.g.
+        EmbeddingPool.submit); the result is then a Future too. New
+        embeddings are added to the cache unless `store` is False.
+        """
+        cached = self.lookup(texts)
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+        if not missing:
+            return np.stack(cached)
+        result = encoder([texts[i] for i in missing])
+        if not isinstance(result, Future):
+            return self._merge(texts, cached, missing, result, store)
+
+        merged: Future = Future()
+
+        def finish(future: Future) -> None:
+            if not merged.set_running_or_notify_cancel():
+                return
+            try:
+                merged.set_result(self._merge(texts, cached, missing, future.result(), store))
+            except BaseException as e:
+                merged.set_exception(e)
+
+        result.add_done_callback(finish)
+        merged.add_done_callback(lambda future: result.cancel() if future.cancelled() else None)
+        return merged
+
+    def _merge(
+        self,
+        texts: List[str],
+        cached: List[Optional[np.ndarray]],
+        missing: List[int],
+        encoded: Any,
+        store: bool
+    ) -> np.ndarray:
+        encoded = np.asarray(encoded, dtype=np.float32)
+        if store:
+            self.put([texts[i] for i in missing], encoded)
+        for i, embedding in zip(missing, encoded):
+            cached[i] = embedding
+        return np.stack(cached)
+
+    def _record(self, hits: int, misses: int) -> None:
+        """Count lookups; cumulative counters are written with appends or every STATS_FLUSH_SECONDS (lock held)"""
+        self.hits += hits
+        self.misses += misses
+        self._unflushed[0] += hits
+        self._unflushed[1] += misses
+        if self._conn is not None and time.monotonic() - self._flushed_at >= self.STATS_FLUSH_SECONDS:
+            self._flush_counters()
+
+    def _flush_counters(self) -> None:
+        hits, misses = self._unflushed
+        if self._conn is None:
+            return
+        if hits or misses:
+            self._conn.executemany(
+                "INSERT INTO counters (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                [("hits", hits), ("misses", misses)]
+            )
+        self._unflushed = [0, 0]
+        self._flushed_at = time.monotonic()
+
+    def flush(self) -> None:
+        """Write pending hit/miss counts"""
+        with self._lock:
+            if self._conn is not None:
+                self._flush_counters()
+
+    def compact(self, keep_texts: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        """
+        Rewrite the matrix into a new file without unreferenced rows
+
+        With `keep_texts`, only their entries are kept (e.g. the documents
+        of the index versions still on disk); otherwise every entry is.
+        Appends wait while the rewrite runs; readers keep using the old
+        file until they next look up.
+        """
+        keep = {text_key(text) for text in keep_texts} if keep_texts is not None else None
+        with self._lock:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                meta = self._meta()
+                old_path = os.path.join(self.path, meta["file"])
+                bytes_before = os.path.getsize(old_path) if os.path.exists(old_path) else 0
+                entries = conn.execute("SELECT key, row FROM entries ORDER BY row").fetchall()
+                kept = [(key, row) for key, row in entries if keep is None or key in keep]
+
+                generation = int(meta["file"].split("-")[1].split(".")[0]) + 1
+                new_file = f"vectors-{generation}.f32"
+                matrix = self._read_matrix(meta)
+                with open(os.path.join(self.path, new_file), "wb") as f:
+                    for start in range(0, len(kept), 4096):
+                        rows = [row for _, row in kept[start:start + 4096]]
+                        f.write(np.ascontiguousarray(matrix[rows]).tobytes())
+                conn.execute("DELETE FROM entries")
+                conn.executemany(
+                    "INSERT INTO entries (key, row) VALUES (?, ?)", [(key, i) for i, (key, _) in enumerate(kept)]
+                )
+                conn.executemany(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES (?, ?)",
+                    [("file", new_file), ("rows", str(len(kept)))]
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self._matrix = None
+            if os.path.exists(old_path):
+                os.remove(old_path)
+        report = {
+            "entries_before": len(entries),
+            "entries": len(kept),
+            "bytes_before": bytes_before,
+            "bytes": len(kept) * (meta["dim"] or 0) * 4
+        }
+        self.logger.info(f"Compacted embedding cache for {self.model_name}: {report}")
+        return report
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Hit rate of this process and since the cache was created, and its size"""
+        with self._lock:
+            conn = self._connect(create=False)
+            self._flush_counters()
+            meta = self._meta() if conn else {"file": "vectors-0.f32", "rows": 0, "dim": None}
+            counters = dict(conn.execute("SELECT name, value FROM counters")) if conn else {}
+        path = os.path.join(self.path, meta["file"])
+        total_hits, total_misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "model": self.model_name,
+            "entries": meta["rows"],
+            "dim": meta["dim"],
+            "size_mb": round(os.path.getsize(path) / (1024 * 1024), 2) if os.path.exists(path) else 0.0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / (self.hits + self.misses), 4) if self.hits + self.misses else 0.0,
+            "total_hits": total_hits,
+            "total_misses": total_misses,
+            "total_hit_rate": round(total_hits / (total_hits + total_misses), 4) if total_hits + total_misses else 0.0
+        }
+
+    @classmethod
+    def models(cls, path: str) -> Dict[str, str]:
+        """Model name of every cache under `path`, by directory"""
+        models = {}
+        if not os.path.isdir(path):
+            return models
+        for name in sorted(os.listdir(path)):
+            db_path = os.path.join(path, name, cls.DB_FILE)
+            if os.path.exists(db_path):
+                conn = sqlite3.connect(db_path)
+                try:
+                    row = conn.execute("SELECT value FROM meta WHERE name = 'model'").fetchone()
+                finally:
+                    conn.close()
+                if row:
+                    models[os.path.join(path, name)] = row[0]
+        return models
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._flush_counters()
+                self._conn.close()
+                self._conn = None
+            self._matrix = None
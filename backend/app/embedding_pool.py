@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from .utils.logger import rag_logger
+
+# Model instance owned by each worker process
+_worker_model = None
+
+def _init_worker(model_name: str, torch_threads: int) -> None:
+    """Load a private copy of the embedding model in a worker process"""
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except ImportError:
+        pass
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+def _encode_in_worker(texts: List[str]) -> np.ndarray:
+    return _worker_model.encode(texts)
+
+class EmbeddingPool:
+    """
+    Multi-process SentenceTransformer encoder for bulk indexing
+
+    Text batches are sharded across `workers` processes, each holding its own
+    copy of the model. CPU threads are split evenly between workers so the
+    processes do not oversubscribe the cores. Results come back as futures
+    (or an ordered iterator via `map`), so callers can reassemble embeddings
+    in submission order.
+    """
+
+    def __init__(self, model_name: str, workers: int, torch_threads: Optional[int] = None):
+        self.logger = rag_logger.getChild("EmbeddingPool")
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        if torch_threads is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // self.workers)
+
+        # spawn avoids forking a parent that may already hold torch threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_name, torch_threads)
+        )
+        self.logger.info(
+            f"Started embedding pool with {self.workers} workers "
+            f"({torch_threads} torch threads each) for {model_name}"
+        )
+
+    def submit(self, texts: List[str]) -> Future:
+        """Encode one batch of texts in a worker process"""
+        return self._executor.submit(_encode_in_worker, list(texts))
+
+    def map(self, batches: Iterable[List[str]]) -> Iterator[np.ndarray]:
+        """Encode many batches in parallel, yielding embeddings in input order"""
+        return self._executor.map(_encode_in_worker, batches)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "EmbeddingPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
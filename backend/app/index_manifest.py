@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from .utils.logger import rag_logger
+
+def document_id(text: str, source: str) -> str:
+    """Content-addressed document id: a hash of the source and normalized text"""
+    normalized = " ".join(text.split())
+    return hashlib.sha1(f"{source}\x00{normalized}".encode("utf-8")).hexdigest()
+
+def config_fingerprint(*parts: Any) -> str:
+    """Stable hash of the settings that determine what a dataset indexes to"""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+class IndexManifest:
+    """
+    Persisted per-dataset indexing checkpoints
+
+    Stored as JSON next to the vector store. Each dataset entry records the
+    fingerprint of the config it was indexed with, how many source rows have
+    been persisted and whether the dataset finished, which lets a rebuild
+    skip unchanged datasets and resume a partially indexed one mid-stream.
+    Writes go to a temp file and are swapped in atomically.
+    """
+
+    def __init__(self, path: str):
+        self.logger = rag_logger.getChild("IndexManifest")
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: Dict[str, Any] = {"datasets": {}}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._data = json.load(f)
+            self._data.setdefault("datasets", {})
+        except Exception as e:
+            self.logger.warning(f"Ignoring unreadable index manifest {self.path}: {e}")
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, dataset_name: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data["datasets"].get(dataset_name)
+            return dict(entry) if entry else None
+
+    def resume_row(self, dataset_name: str, fingerprint: str) -> Optional[int]:
+        """
+        Return the source row to resume indexing from, or None if the dataset
+        is already fully indexed with the same fingerprint
+        """
+        entry = self.get(dataset_name)
+        if not entry or entry.get("fingerprint") != fingerprint:
+            self.start(dataset_name, fingerprint)
+            return 0
+        if entry.get("completed"):
+            return None
+        return entry.get("rows_done", 0)
+
+    def start(self, dataset_name: str, fingerprint: str) -> None:
+        with self._lock:
+            self._data["datasets"][dataset_name] = {
+                "fingerprint": fingerprint,
+                "rows_done": 0,
+                "documents": 0,
+                "completed": False,
+                "updated_at": datetime.now().isoformat()
+            }
+            self._save()
+
+    def checkpoint(self, dataset_name: str, rows_done: int, documents: int, completed: bool = False) -> None:
+        """Record that all source rows before `rows_done` are persisted"""
+        with self._lock:
+            entry = self._data["datasets"].setdefault(dataset_name, {"documents": 0})
+            entry["rows_done"] = max(rows_done, entry.get("rows_done", 0))
+            entry["documents"] = entry.get("documents", 0) + documents
+            entry["completed"] = completed
+            entry["updated_at"] = datetime.now().isoformat()
+            self._save()
+
+    def forget(self, dataset_name: str) -> None:
+        """Drop one dataset's checkpoint so it is indexed again from the start"""
+        with self._lock:
+            if self._data["datasets"].pop(dataset_name, None) is not None:
+                self._save()
+
+    def restore(self, data: Dict[str, Any]) -> None:
+        """Replace every checkpoint, e.g. with those of an imported snapshot"""
+        with self._lock:
+            self._data = {**data, "datasets": dict(data.get("datasets", {}))}
+            self._save()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._data = {"datasets": {}}
+            self._save()
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps(self._data))
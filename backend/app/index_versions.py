@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from .utils.logger import rag_logger
+
+# The unversioned collection indexed before versions existed
+LEGACY_VERSION = "legacy"
+
+class IndexValidationError(Exception):
+    """A newly built index version failed validation; `report` holds the checks"""
+
+    def __init__(self, report: Dict[str, Any]):
+        super().__init__("Index validation failed: " + "; ".join(report["failures"]))
+        self.report = report
+
+class IndexAliases:
+    """
+    The alias naming the live index version, persisted as JSON next to the vector store
+
+    Holds the `live` version that retrieval resolves, the `previous` live
+    version kept for rollback, and the version being `building` with the
+    datasets it re-indexes, so an interrupted build can resume. Versions
+    are named v1, v2, ...; LEGACY_VERSION is the unversioned collection.
+    Every change rewrites the file with an atomic rename, so readers in any
+    process see either the old or the new alias, and it is re-read on every
+    access, so a swap made by another process is seen at once.
+    """
+
+    def __init__(self, path: str):
+        self.logger = rag_logger.getChild("IndexAliases")
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> Dict[str, Any]:
+        data = {"live": LEGACY_VERSION, "previous": None, "building": None, "next": 1}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data.update(json.load(f))
+        return data
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        data["updated_at"] = datetime.now().isoformat()
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    @property
+    def live(self) -> str:
+        return self._read()["live"]
+
+    @property
+    def previous(self) -> Optional[str]:
+        return self._read()["previous"]
+
+    @property
+    def building(self) -> Optional[Dict[str, Any]]:
+        return self._read()["building"]
+
+    def start_build(self, datasets: List[str]) -> str:
+        """Allocate a new version and record it as building"""
+        with self._lock:
+            data = self._read()
+            version = f"v{data['next']}"
+            data["next"] += 1
+            data["building"] = {"version": version, "datasets": sorted(datasets)}
+            self._write(data)
+        return version
+
+    def abandon_build(self) -> None:
+        with self._lock:
+            data = self._read()
+            data["building"] = None
+            self._write(data)
+
+    def swap(self, version: str) -> Optional[str]:
+        """
+        Point the alias at `version`, keeping the live version as previous
+
+        Returns the version that is now neither live nor previous (to be
+        deleted), if any.
+        """
+        with self._lock:
+            data = self._read()
+            retired = data["previous"]
+            data["previous"], data["live"] = data["live"], version
+            if data["building"] and data["building"]["version"] == version:
+                data["building"] = None
+            self._write(data)
+        self.logger.info(f"Index alias now points at {version} (previous {data['previous']})")
+        return retired if retired not in (version, data["previous"]) else None
+
+    def rollback(self) -> str:
+        """Swap live and previous; returns the version now live"""
+        with self._lock:
+            data = self._read()
+            if data["previous"] is None:
+                raise ValueError("There is no previous index version to roll back to")
+            data["live"], data["previous"] = data["previous"], data["live"]
+            self._write(data)
+        self.logger.info(f"Index alias rolled back to {data['live']} (previous {data['previous']})")
+        return data["live"]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return self._read()
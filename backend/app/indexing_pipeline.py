@@ -0,0 +1,219 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .utils.logger import rag_logger
+
+# Marks the end of the stream on a stage queue
+_DONE = object()
+
+class IndexingCancelled(Exception):
+    """Raised by IndexingPipeline.run after `cancel`"""
+
+@dataclass
+class DocumentBatch:
+    """A batch of cleaned documents from a single dataset"""
+    dataset_name: str
+    documents: List[Dict[str, Any]]
+    embeddings: Any = None
+    # Source rows of the dataset consumed up to and including this batch
+    rows_end: int = 0
+    # Set on the final batch of a dataset
+    completed: bool = False
+
+@dataclass
+class StageStats:
+    """Throughput counters for one pipeline stage"""
+    name: str
+    batches: int = 0
+    items: int = 0
+    busy_seconds: float = 0.0
+    wait_seconds: float = 0.0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.busy_seconds if self.busy_seconds else 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "wait_seconds": round(self.wait_seconds, 3),
+            "items_per_second": round(self.items_per_second, 1)
+        }
+
+class IndexingPipeline:
+    """
+    Overlapped clean -> embed -> persist pipeline running on worker threads
+
+    Each stage runs on its own thread and hands batches to the next stage
+    through a bounded queue, so batch N+1 is being cleaned and embedded while
+    batch N is being written. The bounded queues keep memory proportional to
+    `queue_size` batches and apply back-pressure to the faster stages.
+
+    `encode` may return the embeddings directly or a Future (e.g. from an
+    EmbeddingPool); with `max_in_flight` > 1 the embed stage keeps that many
+    batches encoding concurrently and forwards them in submission order.
+    `cancel` stops every stage after the batch it is working on; batches
+    already persisted stay persisted.
+    """
+
+    def __init__(
+        self,
+        encode: Callable[[List[str]], Any],
+        write: Callable[[DocumentBatch], None],
+        queue_size: int = 4,
+        max_in_flight: int = 1
+    ):
+        self.logger = rag_logger.getChild("IndexingPipeline")
+        self._encode = encode
+        self._write = write
+        self._queue_size = queue_size
+        self._max_in_flight = max(1, max_in_flight)
+        self._stop = threading.Event()
+        self._error: Optional[BaseException] = None
+        self.stats = {
+            name: StageStats(name) for name in ("clean", "embed", "persist")
+        }
+
+    def run(self, batches: Iterable[DocumentBatch]) -> Dict[str, StageStats]:
+        """Push all batches through the pipeline and block until they are persisted"""
+        embed_queue: "queue.Queue" = queue.Queue(maxsize=self._queue_size)
+        persist_queue: "queue.Queue" = queue.Queue(maxsize=self._queue_size)
+
+        threads = [
+            threading.Thread(target=self._clean_stage, args=(batches, embed_queue), name="index-clean", daemon=True),
+            threading.Thread(target=self._embed_stage, args=(embed_queue, persist_queue), name="index-embed", daemon=True),
+            threading.Thread(target=self._persist_stage, args=(persist_queue,), name="index-persist", daemon=True),
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if self._error is not None:
+            raise self._error
+
+        elapsed = time.perf_counter() - started
+        persisted = self.stats["persist"].items
+        self.logger.info(
+            f"Pipeline indexed {persisted} documents in {elapsed:.1f}s "
+            f"({persisted / elapsed if elapsed else 0:.1f} docs/s); "
+            + ", ".join(f"{name}: {stats.items_per_second:.1f} docs/s" for name, stats in self.stats.items())
+        )
+        return self.stats
+
+    def cancel(self) -> None:
+        """Stop the pipeline from any thread; `run` then raises IndexingCancelled"""
+        self._fail(IndexingCancelled("Indexing was cancelled"))
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-stage throughput counters"""
+        return {name: stats.to_dict() for name, stats in self.stats.items()}
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, target: "queue.Queue", item: Any) -> bool:
+        """Put with back-pressure, giving up if another stage has failed"""
+        while not self._stop.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, source: "queue.Queue", stats: StageStats) -> Any:
+        """Get the next item, returning _DONE if another stage has failed"""
+        started = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+            return _DONE
+        finally:
+            stats.wait_seconds += time.perf_counter() - started
+
+    def _clean_stage(self, batches: Iterable[DocumentBatch], output: "queue.Queue") -> None:
+        stats = self.stats["clean"]
+        try:
+            iterator = iter(batches)
+            while True:
+                started = time.perf_counter()
+                batch = next(iterator, _DONE)
+                stats.busy_seconds += time.perf_counter() - started
+                if batch is _DONE:
+                    break
+                stats.batches += 1
+                stats.items += len(batch.documents)
+                if not self._put(output, batch):
+                    return
+        except Exception as e:
+            self.logger.error(f"Error in clean stage: {str(e)}")
+            self._fail(e)
+        finally:
+            self._put(output, _DONE)
+
+    def _embed_stage(self, source: "queue.Queue", output: "queue.Queue") -> None:
+        stats = self.stats["embed"]
+        pending: deque = deque()
+
+        def forward_oldest() -> bool:
+            batch, result = pending.popleft()
+            started = time.perf_counter()
+            batch.embeddings = result.result() if isinstance(result, Future) else result
+            stats.busy_seconds += time.perf_counter() - started
+            stats.batches += 1
+            stats.items += len(batch.documents)
+            return self._put(output, batch)
+
+        try:
+            while True:
+                batch = self._get(source, stats)
+                if batch is _DONE:
+                    break
+                started = time.perf_counter()
+                texts = [doc["text"] for doc in batch.documents]
+                pending.append((batch, self._encode(texts) if texts else None))
+                stats.busy_seconds += time.perf_counter() - started
+                while len(pending) >= self._max_in_flight:
+                    if not forward_oldest():
+                        return
+            while pending and not self._stop.is_set():
+                if not forward_oldest():
+                    return
+        except Exception as e:
+            self.logger.error(f"Error in embed stage: {str(e)}")
+            self._fail(e)
+        finally:
+            for _, result in pending:
+                if isinstance(result, Future):
+                    result.cancel()
+            self._put(output, _DONE)
+
+    def _persist_stage(self, source: "queue.Queue") -> None:
+        stats = self.stats["persist"]
+        try:
+            while True:
+                batch = self._get(source, stats)
+                if batch is _DONE:
+                    break
+                started = time.perf_counter()
+                self._write(batch)
+                stats.busy_seconds += time.perf_counter() - started
+                stats.batches += 1
+                stats.items += len(batch.documents)
+        except Exception as e:
+            self.logger.error(f"Error in persist stage: {str(e)}")
+            self._fail(e)
@@ -0,0 +1,177 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from .utils.logger import rag_logger
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+JOB_KINDS = ("index", "rebuild_partition", "search_ef")
+
+class IngestJobQueue:
+    """
+    Persistent queue of ingestion jobs in SQLite, shared by the API and the ingest worker
+
+    A job is a `kind` ("index", "rebuild_partition" or "search_ef") with
+    JSON `params`.
+    Submitting a job identical to one that is still queued or running
+    returns that job instead of a new one (single flight); a partial unique
+    index on the job key enforces this across processes. The worker claims
+    the oldest queued job, reports progress into it and finishes it. A
+    running job can be cancelled by setting a flag the worker polls; a
+    queued one is cancelled at once. Jobs left running by a worker that
+    died are put back in the queue by `requeue_running`, and resume from
+    the index manifest.
+    """
+
+    def __init__(self, path: str):
+        self.logger = rag_logger.getChild("IngestJobQueue")
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT,
+                params TEXT,
+                job_key TEXT,
+                status TEXT,
+                cancel_requested INTEGER DEFAULT 0,
+                progress TEXT,
+                error TEXT,
+                created_at TEXT,
+                started_at TEXT,
+                finished_at TEXT
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_single_flight
+                ON jobs (job_key) WHERE status IN ('queued', 'running');
+            CREATE INDEX IF NOT EXISTS jobs_by_status ON jobs (status, created_at);
+            """
+        )
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Tuple[Dict[str, Any], bool]:
+        """Queue a job, or return the identical active one; the flag is True for a new job"""
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind: {kind}")
+        params = params or {}
+        job_key = json.dumps([kind, params], sort_keys=True)
+        with self._lock:
+            # Retried if the active job finishes between the insert and the lookup
+            while True:
+                try:
+                    job_id = uuid.uuid4().hex
+                    self._conn.execute(
+                        "INSERT INTO jobs (id, kind, params, job_key, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                        (job_id, kind, json.dumps(params), job_key, QUEUED, datetime.now().isoformat())
+                    )
+                    created = True
+                    break
+                except sqlite3.IntegrityError:
+                    row = self._conn.execute(
+                        "SELECT id FROM jobs WHERE job_key = ? AND status IN (?, ?)", (job_key, *ACTIVE_STATUSES)
+                    ).fetchone()
+                    if row is not None:
+                        job_id, created = row["id"], False
+                        break
+        return self.get(job_id), created
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def list(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """Most recently created jobs first"""
+        rows = self._conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Mark the oldest queued job running and return it, or None if the queue is empty"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, started_at = ? WHERE id = ?",
+                        (RUNNING, datetime.now().isoformat(), row["id"])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(row["id"]) if row is not None else None
+
+    def update_progress(self, job_id: str, progress: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+
+    def finish(self, job_id: str, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, error, datetime.now().isoformat(), job_id)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued job, or ask the worker to stop a running one; None if there is no such job"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, datetime.now().isoformat(), job_id, QUEUED)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING)
+            )
+        return self.get(job_id)
+
+    def cancel_requested(self, job_id: str) -> bool:
+        row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def requeue_running(self) -> int:
+        """Put jobs left running by a stopped worker back in the queue (cancelled ones are finished)"""
+        with self._lock:
+            now = datetime.now().isoformat()
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE status = ? AND cancel_requested = 1",
+                (CANCELLED, now, RUNNING)
+            )
+            requeued = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING)
+            ).rowcount
+        if requeued:
+            self.logger.info(f"Requeued {requeued} interrupted ingest jobs")
+        return requeued
+
+    def finished_since(self, since: str) -> List[Dict[str, Any]]:
+        """Jobs finished after the ISO timestamp `since`, oldest first"""
+        rows = self._conn.execute(
+            "SELECT * FROM jobs WHERE finished_at > ? ORDER BY finished_at", (since,)
+        ).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        del job["job_key"]
+        job["params"] = json.loads(job["params"] or "{}")
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,132 @@
+import asyncio
+import multiprocessing
+import time
+from typing import Any, Dict, Optional
+
+from .config import settings
+from .indexing_pipeline import IndexingCancelled
+from .ingest_jobs import CANCELLED, FAILED, QUEUED, SUCCEEDED, IngestJobQueue
+from .utils.logger import rag_logger
+
+class IngestWorker:
+    """
+    Runs ingestion jobs from an IngestJobQueue, one at a time
+
+    Meant to run in its own process (see `start_ingest_worker`), so the
+    CPU-heavy cleaning and encoding never shares an interpreter with the
+    API, and so the worker is the only process that writes the index. While
+    a job runs, its progress (rows and documents per dataset,
+    per-stage throughput) is written to the queue every
+    `progress_seconds`, and a cancel request or `stop` event cancels the
+    indexing pipeline. A job stopped by `stop` goes back to the queue and
+    resumes from the index manifest on the next start.
+    """
+
+    def __init__(
+        self,
+        queue: IngestJobQueue,
+        rag: Optional[Any] = None,
+        poll_seconds: float = 1.0,
+        progress_seconds: float = 2.0
+    ):
+        self.logger = rag_logger.getChild("IngestWorker")
+        self.queue = queue
+        self._rag = rag
+        self.poll_seconds = poll_seconds
+        self.progress_seconds = progress_seconds
+
+    @property
+    def rag(self):
+        """The worker's own TherapyRAG, created on the first job"""
+        if self._rag is None:
+            from .rag_system import TherapyRAG
+            self._rag = TherapyRAG()
+        return self._rag
+
+    def run(self, stop: Optional[Any] = None) -> None:
+        """Process jobs until `stop` (a threading or multiprocessing Event) is set"""
+        self.queue.requeue_running()
+        self.logger.info(f"Ingest worker polling {self.queue.path}")
+        while stop is None or not stop.is_set():
+            job = self.queue.claim()
+            if job is None:
+                time.sleep(self.poll_seconds)
+                continue
+            asyncio.run(self.run_job(job, stop))
+
+    async def run_job(self, job: Dict[str, Any], stop: Optional[Any] = None) -> str:
+        """Run one claimed job to completion, cancellation or failure and record the outcome"""
+        rag = self.rag
+        if rag.index_version != rag.index_aliases.live:
+            # Another process swapped or rolled back the live version
+            rag.reload()
+        started = time.perf_counter()
+        self.logger.info(f"Starting ingest job {job['id']} ({job['kind']} {job['params']})")
+        if job["kind"] == "rebuild_partition":
+            task = asyncio.create_task(rag.rebuild_partition(job["params"]["partition"]))
+        elif job["kind"] == "search_ef":
+            # Collection config is written here only; the API picks it up when it reloads
+            task = asyncio.create_task(asyncio.to_thread(rag.set_search_ef, job["params"]["search_ef"]))
+        else:
+            task = asyncio.create_task(rag.rebuild(datasets=job["params"].get("datasets")))
+
+        stopping = False
+        while not task.done():
+            await asyncio.wait({task}, timeout=self.progress_seconds)
+            # Rebuilds index into a staging system for the new version
+            pipeline = rag.building.indexing_pipeline if rag.building is not None else None
+            self.queue.update_progress(job["id"], self._progress(pipeline, started))
+            cancel = self.queue.cancel_requested(job["id"])
+            stopping = stopping or bool(stop is not None and stop.is_set())
+            if (cancel or stopping) and pipeline is not None and not task.done():
+                pipeline.cancel()
+
+        try:
+            task.result()
+            status, error = SUCCEEDED, None
+        except IndexingCancelled:
+            # A cancel request wins over a shutdown, which leaves the job to resume
+            status, error = (QUEUED if stopping and not self.queue.cancel_requested(job["id"]) else CANCELLED), None
+        except Exception as e:
+            status, error = FAILED, str(e)
+            self.logger.error(f"Ingest job {job['id']} failed: {error}")
+
+        if status == QUEUED:
+            # Still marked running; requeue_running puts it back on the next start
+            self.logger.info(f"Ingest job {job['id']} interrupted; it resumes on the next start")
+            return status
+        self.queue.finish(job["id"], status, error)
+        self.logger.info(f"Ingest job {job['id']} {status} in {time.perf_counter() - started:.1f}s")
+        return status
+
+    def _progress(self, pipeline: Optional[Any], started: float) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - started
+        documents = pipeline.stats["persist"].items if pipeline is not None else 0
+        manifest = (self.rag.building or self.rag).manifest.to_dict().get("datasets", {})
+        return {
+            "elapsed_seconds": round(elapsed, 1),
+            "documents_indexed": documents,
+            "documents_per_second": round(documents / elapsed, 1) if elapsed else 0.0,
+            "stages": pipeline.get_stats() if pipeline is not None else None,
+            "datasets": {
+                name: {key: entry.get(key) for key in ("rows_done", "documents", "completed")}
+                for name, entry in manifest.items()
+            }
+        }
+
+def run_ingest_worker(stop: Optional[Any] = None) -> None:
+    """Process entry point: serve the queue at INGEST_QUEUE_PATH until `stop` is set"""
+    queue = IngestJobQueue(settings.INGEST_QUEUE_PATH)
+    try:
+        IngestWorker(queue, poll_seconds=settings.INGEST_POLL_SECONDS).run(stop)
+    finally:
+        queue.close()
+
+def start_ingest_worker():
+    """Start the ingest worker in a new process; returns (process, stop event)"""
+    # spawn, like EmbeddingPool; not a daemon, since it starts its own pools
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    process = context.Process(target=run_ingest_worker, args=(stop,), name="ingest-worker")
+    process.start()
+    return process, stop
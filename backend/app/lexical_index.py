@@ -0,0 +1,347 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .utils.logger import rag_logger
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:['-][a-z0-9]+)*")
+MAX_TERM_LENGTH = 40
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have he her his i if in into is it its "
+    "me my not of on or our she so that the their them they this to was we were what when "
+    "which who will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word tokens with stopwords and overlong tokens removed"""
+    return [
+        token for token in TOKEN_PATTERN.findall(text.casefold())
+        if token not in STOPWORDS and len(token) <= MAX_TERM_LENGTH
+    ]
+
+class LexicalIndex:
+    """
+    Okapi BM25 search over an inverted index stored in SQLite
+
+    Tables under `path`:
+      - terms: term -> id and document frequency
+      - postings: one row per term per added batch holding packed int32
+        document numbers and term frequencies, clustered by term so a
+        term's postings list is one range scan over a few blobs
+      - documents: dense document number -> external id, token length and
+        source, which `search` can filter on
+
+    Documents are numbered densely in insertion order, so a query scores
+    into a NumPy array indexed by document number. When a query also has
+    rarer terms, terms that appear in more than `max_df_ratio` of documents
+    are skipped; their IDF is close to zero and their postings are the most
+    expensive to read.
+    Adding an id that is already indexed is a no-op. The database file is
+    only created by the first add. `remove_sources` deletes documents and
+    renumbers the rest, so numbering stays dense.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75, max_df_ratio: float = 0.5):
+        self.logger = rag_logger.getChild("LexicalIndex")
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.max_df_ratio = max_df_ratio
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._doc_count = 0
+        self._total_length = 0
+        self._lengths: Optional[np.ndarray] = None
+        self._source_masks: Dict[Tuple[str, ...], np.ndarray] = {}
+        self.queries = 0
+        if os.path.exists(path):
+            self._connect()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is not None:
+            return self._conn
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS terms (
+                id INTEGER PRIMARY KEY,
+                term TEXT UNIQUE,
+                df INTEGER
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term_id INTEGER,
+                first_doc INTEGER,
+                docs BLOB,
+                tfs BLOB,
+                PRIMARY KEY (term_id, first_doc)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS documents (
+                doc INTEGER PRIMARY KEY,
+                id TEXT UNIQUE,
+                length INTEGER,
+                source TEXT
+            );
+            """
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if "source" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN source TEXT")
+        self._conn.commit()
+        self._doc_count, self._total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents"
+        ).fetchone()
+        return self._conn
+
+    def count(self) -> int:
+        return self._doc_count
+
+    def add(self, ids: List[str], texts: List[str], sources: Optional[List[str]] = None) -> None:
+        """Index a batch of documents"""
+        with self._lock:
+            self._connect()
+            placeholders = ",".join("?" * len(ids))
+            existing = {
+                row[0] for row in self._conn.execute(
+                    f"SELECT id FROM documents WHERE id IN ({placeholders})", ids
+                )
+            } if ids else set()
+
+            documents, term_counts = [], []
+            seen = set(existing)
+            for doc_id, text, source in zip(ids, texts, sources or [None] * len(ids)):
+                if doc_id in seen:
+                    continue
+                seen.add(doc_id)
+                tokens = tokenize(text)
+                documents.append((self._doc_count + len(documents), doc_id, len(tokens), source))
+                term_counts.append(Counter(tokens))
+            if not documents:
+                return
+
+            document_frequency = Counter(term for counts in term_counts for term in counts)
+            try:
+                self._conn.executemany(
+                    "INSERT INTO terms (term, df) VALUES (?, ?) "
+                    "ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                    document_frequency.items()
+                )
+                term_ids = self._term_ids(list(document_frequency))
+                postings: Dict[str, Tuple[List[int], List[int]]] = {}
+                for (doc, _, _, _), counts in zip(documents, term_counts):
+                    for term, tf in counts.items():
+                        docs, tfs = postings.setdefault(term, ([], []))
+                        docs.append(doc)
+                        tfs.append(tf)
+                first_doc = documents[0][0]
+                self._conn.executemany(
+                    "INSERT INTO postings (term_id, first_doc, docs, tfs) VALUES (?, ?, ?, ?)",
+                    [
+                        (
+                            term_ids[term],
+                            first_doc,
+                            np.asarray(docs, dtype=np.int32).tobytes(),
+                            np.asarray(tfs, dtype=np.int32).tobytes()
+                        )
+                        for term, (docs, tfs) in postings.items()
+                    ]
+                )
+                self._conn.executemany(
+                    "INSERT INTO documents (doc, id, length, source) VALUES (?, ?, ?, ?)", documents
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._doc_count += len(documents)
+            self._total_length += sum(length for _, _, length, _ in documents)
+            self._lengths = None
+            self._source_masks.clear()
+
+    def remove_sources(self, sources: List[str]) -> int:
+        """
+        Delete every document whose source is in `sources`, returning how many
+
+        Postings are rewritten without the removed documents and with the
+        remaining ones renumbered, and document frequencies are recounted,
+        so BM25 statistics match an index that never held them.
+        """
+        with self._lock:
+            if self._conn is None or not sources:
+                return 0
+            placeholders = ",".join("?" * len(sources))
+            removed = np.fromiter(
+                (row[0] for row in self._conn.execute(
+                    f"SELECT doc FROM documents WHERE source IN ({placeholders})", sources
+                )),
+                dtype=np.int64
+            )
+            if not len(removed):
+                return 0
+
+            # Old document number -> new one, -1 for removed documents
+            keep = np.ones(self._doc_count, dtype=bool)
+            keep[removed] = False
+            mapping = np.where(keep, np.cumsum(keep) - 1, -1).astype(np.int32)
+            try:
+                self._conn.execute(f"DELETE FROM documents WHERE source IN ({placeholders})", sources)
+                # Ascending order never collides: every lower number has already moved down
+                self._conn.executemany(
+                    "UPDATE documents SET doc = ? WHERE doc = ?",
+                    ((int(mapping[doc]), int(doc)) for doc in np.flatnonzero(keep) if mapping[doc] != doc)
+                )
+                # Not executescript: that would commit the deletes above
+                self._conn.execute("DROP TABLE IF EXISTS postings_new")
+                self._conn.execute(
+                    "CREATE TABLE postings_new ("
+                    "term_id INTEGER, first_doc INTEGER, docs BLOB, tfs BLOB, "
+                    "PRIMARY KEY (term_id, first_doc)) WITHOUT ROWID"
+                )
+                document_frequency: Counter = Counter()
+                rows = []
+                for term_id, _, docs_blob, tfs_blob in self._conn.execute(
+                    "SELECT term_id, first_doc, docs, tfs FROM postings"
+                ):
+                    docs = mapping[np.frombuffer(docs_blob, dtype=np.int32)]
+                    kept = docs >= 0
+                    if not kept.any():
+                        continue
+                    docs = docs[kept]
+                    tfs = np.frombuffer(tfs_blob, dtype=np.int32)[kept]
+                    document_frequency[term_id] += len(docs)
+                    rows.append((term_id, int(docs[0]), docs.tobytes(), tfs.tobytes()))
+                    if len(rows) >= 10000:
+                        self._conn.executemany("INSERT INTO postings_new VALUES (?, ?, ?, ?)", rows)
+                        rows = []
+                self._conn.executemany("INSERT INTO postings_new VALUES (?, ?, ?, ?)", rows)
+                self._conn.execute("DROP TABLE postings")
+                self._conn.execute("ALTER TABLE postings_new RENAME TO postings")
+                self._conn.execute("UPDATE terms SET df = 0")
+                self._conn.executemany(
+                    "UPDATE terms SET df = ? WHERE id = ?",
+                    ((df, term_id) for term_id, df in document_frequency.items())
+                )
+                self._conn.execute("DELETE FROM terms WHERE df = 0")
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._doc_count, self._total_length = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM documents"
+            ).fetchone()
+            self._lengths = None
+            self._source_masks.clear()
+        self.logger.info(f"Removed {len(removed)} documents from sources {', '.join(sources)}")
+        return len(removed)
+
+    def _term_ids(self, terms: List[str]) -> Dict[str, int]:
+        term_ids = {}
+        for start in range(0, len(terms), 500):
+            chunk = terms[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            term_ids.update(
+                (term, term_id) for term_id, term in self._conn.execute(
+                    f"SELECT id, term FROM terms WHERE term IN ({placeholders})", chunk
+                )
+            )
+        return term_ids
+
+    def _source_mask(self, sources: List[str]) -> np.ndarray:
+        """Boolean mask over document numbers whose source is in `sources` (lock held)"""
+        key = tuple(sorted(set(sources)))
+        mask = self._source_masks.get(key)
+        if mask is None:
+            placeholders = ",".join("?" * len(key))
+            mask = np.zeros(self._doc_count, dtype=bool)
+            mask[[row[0] for row in self._conn.execute(
+                f"SELECT doc FROM documents WHERE source IN ({placeholders})", key
+            )]] = True
+            self._source_masks[key] = mask
+        return mask
+
+    def search(self, query: str, n_results: int, sources: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Return up to `n_results` (id, BM25 score) pairs, best first, optionally limited to `sources`"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or not self._doc_count or n_results <= 0:
+            return []
+
+        with self._lock:
+            self.queries += 1
+            if self._lengths is None:
+                self._lengths = np.fromiter(
+                    (row[0] for row in self._conn.execute("SELECT length FROM documents ORDER BY doc")),
+                    dtype=np.float32,
+                    count=self._doc_count
+                )
+            lengths = self._lengths
+            doc_count = self._doc_count
+            average_length = self._total_length / doc_count or 1.0
+
+            placeholders = ",".join("?" * len(terms))
+            term_rows = self._conn.execute(
+                f"SELECT id, df FROM terms WHERE term IN ({placeholders})", terms
+            ).fetchall()
+            rare_rows = [row for row in term_rows if row[1] <= self.max_df_ratio * doc_count]
+
+            scores = np.zeros(doc_count, dtype=np.float32)
+            for term_id, df in rare_rows or term_rows:
+                blobs = self._conn.execute(
+                    "SELECT docs, tfs FROM postings WHERE term_id = ?", (term_id,)
+                ).fetchall()
+                docs = np.concatenate([np.frombuffer(blob, dtype=np.int32) for blob, _ in blobs])
+                tf = np.concatenate([np.frombuffer(blob, dtype=np.int32) for _, blob in blobs]).astype(np.float32)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                norm = 1 - self.b + self.b * lengths[docs] / average_length
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+
+            if sources:
+                scores[~self._source_mask(sources)] = 0
+            matched = np.flatnonzero(scores)
+            if not len(matched):
+                return []
+            k = min(n_results, len(matched))
+            top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+            top = top[np.argsort(-scores[top])]
+
+            placeholders = ",".join("?" * len(top))
+            ids = dict(self._conn.execute(
+                f"SELECT doc, id FROM documents WHERE doc IN ({placeholders})", top.tolist()
+            ))
+        return [(ids[int(doc)], float(scores[doc])) for doc in top]
+
+    def copy_to(self, path: str) -> None:
+        """Write a consistent copy of the index to `path` (nothing when the index is empty)"""
+        with self._lock:
+            if self._conn is None:
+                return
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            target = sqlite3.connect(path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            terms = self._conn.execute("SELECT COUNT(*) FROM terms").fetchone()[0] if self._conn else 0
+        return {
+            "documents": self._doc_count,
+            "terms": terms,
+            "avg_document_length": round(self._total_length / self._doc_count, 2) if self._doc_count else 0.0,
+            "queries": self.queries,
+            "size_mb": round(os.path.getsize(self.path) / (1024 * 1024), 2) if os.path.exists(self.path) else 0.0
+        }
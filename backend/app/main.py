@@ -1,6 +1,9 @@
 from fastapi import FastAPI, HTTPException, Depends
+import asyncio
 import re
+from datetime import datetime
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from typing import List, Optional
 
 from app.config import settings
@@ -12,9 +15,13 @@ from app.models import (
     ConversationHistory,
     SummaryRequest,
     SummaryResponse,
-    RAGStats
+    RAGStats,
+    IngestJob,
+    IngestJobSubmitted
 )
-from app.rag_system import TherapyRAG
+from app.ingest_jobs import ACTIVE_STATUSES, IngestJobQueue
+from app.ingest_worker import start_ingest_worker
+from app.rag_system import TherapyDatasetProcessor, TherapyRAG
 from app.session_manager import SessionManager
 from app.utils.logger import api_logger
 
@@ -30,16 +37,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize components
-session_manager = SessionManager()
-rag_system = TherapyRAG()
+# Initialize components (the RAG model and index load in the startup warm-up).
+# The API only reads the index; the ingest worker process writes it.
+rag_system = TherapyRAG(read_only=True)
+session_manager = SessionManager(rag_system=rag_system)
 logger = api_logger.getChild("main")
+_ingest_queue: Optional[IngestJobQueue] = None
+
+def get_ingest_queue() -> IngestJobQueue:
+    """Queue of ingestion jobs run by the ingest worker process, opened on first use"""
+    global _ingest_queue
+    if _ingest_queue is None:
+        _ingest_queue = IngestJobQueue(settings.INGEST_QUEUE_PATH)
+    return _ingest_queue
 
 # Health check endpoint
 @app.get("/api/health")
 async def health_check():
     return {"status": "healthy"}
 
+# Readiness check: the RAG system has finished warming up
+@app.get("/api/ready")
+async def readiness_check():
+    if not rag_system.ready:
+        return JSONResponse(
+            status_code=503,
+            content={"status": rag_system.warm_up_state, "error": rag_system.warm_up_error}
+        )
+    return {"status": "ready", "warm_up_seconds": rag_system.warm_up_seconds}
+
 # Session management endpoints
 @app.post("/api/sessions/create", response_model=SessionResponse)
 async def create_session(request: SessionCreate):
@@ -67,6 +93,10 @@ async def delete_session(session_id: str):
 # Chat endpoints
 @app.post("/api/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
+    unknown_sources = set(request.sources or []) - set(TherapyDatasetProcessor.DATASET_CONFIGS)
+    if unknown_sources:
+        raise HTTPException(status_code=400, detail=f"Unknown sources: {', '.join(sorted(unknown_sources))}")
+
     try:
         # Get session
         therapist = session_manager.get_session(request.session_id)
@@ -76,8 +106,10 @@ async def chat(request: ChatRequest):
         # Generate response
         response = await therapist.chat(
             user_message=request.message,
-            use_rag=request.use_rag,
-            n_examples=request.n_examples
+            # Answer without retrieval rather than wait for the warm-up
+            use_rag=request.use_rag and rag_system.ready,
+            n_examples=request.n_examples,
+            sources=request.sources
         )
 
         # Update session
@@ -87,7 +119,8 @@ async def chat(request: ChatRequest):
             response=response["response"],
             session_id=request.session_id,
             timestamp=response["timestamp"],
-            sources_used=response["sources_used"]
+            sources_used=response["sources_used"],
+            prompt_tokens=response.get("prompt_tokens")
         )
 
     except Exception as e:
@@ -143,17 +176,41 @@ async def get_session_summary(session_id: str, request: SummaryRequest):
         raise HTTPException(status_code=500, detail="Failed to generate summary")
 
 # RAG system endpoints
-from fastapi import BackgroundTasks
-
-@app.post("/api/rag/initialize")
-async def initialize_rag(background_tasks: BackgroundTasks):
+@app.post("/api/rag/initialize", response_model=IngestJobSubmitted)
+async def initialize_rag(partition: Optional[str] = None):
+    """Queue indexing of every dataset (or a rebuild of one partition) for the ingest worker"""
+    if partition is not None and partition not in set(TherapyDatasetProcessor.partition_routes().values()) | {"default"}:
+        raise HTTPException(status_code=400, detail=f"Unknown partition: {partition}")
     try:
-        background_tasks.add_task(rag_system.load_and_index_datasets)
-        return {"status": "success", "message": "RAG system initialization started in background"}
+        if partition is None:
+            job, created = get_ingest_queue().submit("index")
+        else:
+            job, created = get_ingest_queue().submit("rebuild_partition", {"partition": partition})
+        return {"job": job, "created": created}
     except Exception as e:
-        logger.error(f"Error starting RAG initialization: {str(e)}")
+        logger.error(f"Error queueing RAG initialization: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to start RAG initialization")
 
+@app.get("/api/rag/jobs", response_model=List[IngestJob])
+async def list_ingest_jobs(limit: int = 20):
+    return get_ingest_queue().list(limit)
+
+@app.get("/api/rag/jobs/{job_id}", response_model=IngestJob)
+async def get_ingest_job(job_id: str):
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/api/rag/jobs/{job_id}/cancel", response_model=IngestJob)
+async def cancel_ingest_job(job_id: str):
+    job = get_ingest_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ACTIVE_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return get_ingest_queue().cancel(job_id)
+
 @app.get("/api/rag/stats", response_model=RAGStats)
 async def get_rag_stats():
     try:
@@ -163,6 +220,42 @@ async def get_rag_stats():
         raise HTTPException(status_code=500, detail="Failed to get RAG statistics")
 
 
+@app.post("/api/rag/search-ef", response_model=IngestJobSubmitted)
+async def set_search_ef(search_ef: int):
+    """
+    Queue a change of HNSW search ef of the live index (chroma backend) without rebuilding it
+
+    The ingest worker writes the collection config; the API applies it when
+    it reloads the index after the job finishes.
+    """
+    if search_ef < 1:
+        raise HTTPException(status_code=400, detail="search_ef must be positive")
+    if settings.VECTOR_STORE_BACKEND != "chroma":
+        raise HTTPException(status_code=400, detail=f"The {settings.VECTOR_STORE_BACKEND} backend has no search ef")
+    try:
+        job, created = get_ingest_queue().submit("search_ef", {"search_ef": search_ef})
+        return {"job": job, "created": created}
+    except Exception as e:
+        logger.error(f"Error queueing search ef change: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to set search ef")
+
+@app.get("/api/rag/index/versions")
+async def get_index_versions():
+    """The live, previous and building index versions"""
+    return rag_system.index_aliases.to_dict()
+
+@app.post("/api/rag/index/rollback")
+async def rollback_index():
+    """Make the previous index version live again"""
+    try:
+        version = await asyncio.to_thread(rag_system.rollback)
+        return {"status": "success", "live": version}
+    except (ValueError, RuntimeError) as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error rolling back index: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to roll back index")
+
 @app.get("/api/rag/debug")
 async def rag_debug(n: int = 3):
     """Debug endpoint: return RAG stats and a small sample of indexed documents.
@@ -173,29 +266,14 @@ async def rag_debug(n: int = 3):
     try:
         stats = rag_system.get_stats()
 
-        # Try to get a small sample safely using the Chroma collection API
+        # Try to get a small sample safely from the vector store
         safe_sample = None
         try:
-            coll = rag_system.collection
-            # prefer peek which is intended for small samples
-            try:
-                peek = coll.peek(n, include=["documents", "metadatas", "ids"])
-            except TypeError:
-                # some chromadb versions may not accept include for peek
-                peek = coll.peek(n)
-
-            # Build a JSON-serializable sample that excludes embeddings/binary blobs
-            if isinstance(peek, dict):
-                safe_sample = {}
-                for key in ("ids", "documents", "metadatas"):
-                    if key in peek:
-                        safe_sample[key] = peek[key]
-            else:
-                # Fallback: represent peek in a simple, serializable way
-                safe_sample = {"peek": str(peek)}
+            # peek returns only ids, documents and metadatas (no embeddings)
+            safe_sample = rag_system.vector_store.peek(n)
 
         except Exception as exc:
-            logger.warning(f"Could not retrieve sample from Chroma collection: {exc}")
+            logger.warning(f"Could not retrieve sample from vector store: {exc}")
 
         return {"stats": stats, "sample": safe_sample}
     except Exception as e:
@@ -218,6 +296,35 @@ async def startup_event():
     
     logger.info("API configuration verified")
 
+    # Load the embedding model and open the vector store off the event loop
+    app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(rag_system.warm_up))
+
+    # Indexing runs in its own process; this one only reloads what it wrote
+    app.state.ingest_worker = start_ingest_worker() if settings.INGEST_WORKER_ENABLED else None
+    app.state.ingest_watch_task = asyncio.create_task(watch_ingest_jobs())
+
+async def watch_ingest_jobs():
+    """Reload the index whenever the ingest worker finishes a job (partial runs write too)"""
+    since = datetime.now().isoformat()
+    while True:
+        await asyncio.sleep(settings.INGEST_POLL_SECONDS)
+        try:
+            finished = await asyncio.to_thread(get_ingest_queue().finished_since, since)
+            if finished:
+                since = finished[-1]["finished_at"]
+                await asyncio.to_thread(rag_system.reload)
+                logger.info(f"Reloaded the index after ingest job {finished[-1]['id']} {finished[-1]['status']}")
+        except Exception as e:
+            logger.error(f"Error reloading the index after an ingest job: {str(e)}")
+
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Shutting down AI Therapist API")
+    app.state.ingest_watch_task.cancel()
+    if app.state.ingest_worker is not None:
+        process, stop = app.state.ingest_worker
+        # The running job is cancelled after its current batch and resumes on the next start
+        stop.set()
+        await asyncio.to_thread(process.join, 60)
+        if process.is_alive():
+            process.terminate()
@@ -7,12 +7,15 @@ class ChatRequest(BaseModel):
     session_id: str
     use_rag: bool = True
     n_examples: int = Field(default=3, ge=1, le=10)
+    # Limit retrieved examples to these datasets (all when omitted)
+    sources: Optional[List[str]] = None
 
 class ChatResponse(BaseModel):
     response: str
     session_id: str
     timestamp: datetime = Field(default_factory=datetime.now)
     sources_used: Optional[List[str]] = None
+    prompt_tokens: Optional[int] = None
 
 class SessionCreate(BaseModel):
     user_id: Optional[str] = None
@@ -38,5 +41,34 @@ class SummaryResponse(BaseModel):
 class RAGStats(BaseModel):
     total_documents: int
     collection_name: str
+    index_version: Optional[str] = None
     embedding_model: str
-    last_updated: Optional[datetime] = None
\ No newline at end of file
+    vector_store: Optional[str] = None
+    partitions: Optional[Dict[str, int]] = None
+    last_updated: Optional[datetime] = None
+    indexing_pipeline: Optional[Dict[str, Dict[str, Any]]] = None
+    deduplication: Optional[Dict[str, Any]] = None
+    query_embedding_cache: Optional[Dict[str, Any]] = None
+    embedding_cache: Optional[Dict[str, Any]] = None
+    retrieval_cache: Optional[Dict[str, Any]] = None
+    retrieval_executor: Optional[Dict[str, Any]] = None
+    query_batcher: Optional[Dict[str, Any]] = None
+    lexical_index: Optional[Dict[str, Any]] = None
+class IngestJob(BaseModel):
+    id: str
+    kind: str
+    params: Dict[str, Any]
+    # "queued", "running", "succeeded", "failed" or "cancelled"
+    status: str
+    cancel_requested: bool = False
+    # Rows and documents per dataset, documents per second and per-stage throughput
+    progress: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class IngestJobSubmitted(BaseModel):
+    job: IngestJob
+    # False when an identical job was already queued or running and is returned instead
+    created: bool
@@ -0,0 +1,126 @@
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from .chunking import load_tokenizer
+
+TokenCounter = Callable[[str], int]
+
+# Average characters per token of BPE/SentencePiece vocabularies on English
+# prose, used when no local tokenizer is configured
+APPROX_CHARS_PER_TOKEN = 4
+
+HISTORY_HEADER = "Conversation History:"
+# Between sections and context examples, and between history lines
+SECTION_SEPARATOR = "\n\n"
+LINE_SEPARATOR = "\n"
+
+def approximate_token_count(text: str) -> int:
+    """Estimate the token count of `text` from its length"""
+    return -(-len(text) // APPROX_CHARS_PER_TOKEN)
+
+def load_token_counter(tokenizer_name: Optional[str] = None) -> TokenCounter:
+    """
+    Token counter backed by a local Hugging Face tokenizer, falling back to
+    approximate_token_count when no name is given or it cannot be loaded
+    """
+    tokenizer = load_tokenizer(tokenizer_name) if tokenizer_name else None
+    if tokenizer is None:
+        return approximate_token_count
+    return lambda text: len(tokenizer(text, add_special_tokens=False, verbose=False)["input_ids"])
+
+@dataclass
+class PackedPrompt:
+    """An assembled prompt and what the budget let into it"""
+    text: str
+    tokens: int
+    history_used: int
+    history_dropped: int
+    context_used: List[int]
+    context_dropped: int
+
+class PromptPacker:
+    """
+    Assembles a chat prompt within a token budget
+
+    Sections are admitted in priority order: the system prompt, closing
+    instruction and user message are always kept; then recent conversation
+    turns, newest first, until the next turn no longer fits; then context
+    examples in rank order, skipping any that do not fit so a shorter,
+    lower-ranked example can still use the remaining budget. The prompt is
+    laid out as system, context, history, instruction, user message, and
+    its reported size is the count of the final text. Separators and the
+    history header are charged with the section they join; if the final
+    text still counts over budget (tokenizers are not additive across
+    joins), the lowest-ranked example, then the oldest turn, is dropped
+    until it fits.
+
+    `count_tokens` is any callable returning the token count of a string.
+    """
+
+    def __init__(self, budget_tokens: int, count_tokens: TokenCounter = approximate_token_count):
+        self.budget_tokens = budget_tokens
+        self.count_tokens = count_tokens
+
+    def pack(
+        self,
+        system: str,
+        user_message: str,
+        history: List[str],
+        context: List[str],
+        instruction: str = ""
+    ) -> PackedPrompt:
+        user_line = f"User: {user_message}"
+        fixed = [system, instruction, user_line] if instruction else [system, user_line]
+        section_cost = self.count_tokens(SECTION_SEPARATOR)
+        remaining = self.budget_tokens - sum(self.count_tokens(part) for part in fixed) \
+            - section_cost * (len(fixed) - 1)
+
+        turns = []
+        for turn in reversed(history):
+            cost = self.count_tokens(turn) + self.count_tokens(LINE_SEPARATOR)
+            if not turns:
+                cost += self.count_tokens(HISTORY_HEADER) + section_cost
+            if cost > remaining:
+                break
+            turns.append(turn)
+            remaining -= cost
+        turns.reverse()
+
+        context_used = []
+        for index, example in enumerate(context):
+            # The first example's separator joins the context section, later ones join examples
+            cost = self.count_tokens(example) + section_cost
+            if cost <= remaining:
+                context_used.append(index)
+                remaining -= cost
+
+        text = self._layout(system, instruction, user_line, turns, [context[index] for index in context_used])
+        tokens = self.count_tokens(text)
+        while tokens > self.budget_tokens and (context_used or turns):
+            if context_used:
+                context_used.pop()
+            else:
+                turns.pop(0)
+            text = self._layout(system, instruction, user_line, turns, [context[index] for index in context_used])
+            tokens = self.count_tokens(text)
+
+        return PackedPrompt(
+            text=text,
+            tokens=tokens,
+            history_used=len(turns),
+            history_dropped=len(history) - len(turns),
+            context_used=context_used,
+            context_dropped=len(context) - len(context_used)
+        )
+
+    @staticmethod
+    def _layout(system: str, instruction: str, user_line: str, turns: List[str], examples: List[str]) -> str:
+        sections = [system]
+        if examples:
+            sections.append(SECTION_SEPARATOR.join(examples))
+        if turns:
+            sections.append(HISTORY_HEADER + LINE_SEPARATOR + LINE_SEPARATOR.join(turns))
+        if instruction:
+            sections.append(instruction)
+        sections.append(user_line)
+        return SECTION_SEPARATOR.join(sections)
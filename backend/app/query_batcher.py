@@ -0,0 +1,93 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .utils.logger import rag_logger
+
+class QueryBatcher:
+    """
+    Coalesces concurrent single-query encodes into batched encode calls
+
+    A query that arrives while no encode is running is encoded immediately
+    on its own, so an idle server adds no latency. Under contention, a query
+    arriving while a batch is encoding opens a window of `window_ms`; every
+    query that arrives before it closes, the running batch finishes, or
+    `max_batch_size` queries are waiting is encoded in one `encode_batch`
+    call and the vectors are fanned back out to the waiting coroutines.
+    Identical texts within a batch are encoded once. A window of 0 encodes
+    each query immediately on its own.
+    """
+
+    def __init__(
+        self,
+        encode_batch: Callable[[List[str]], Awaitable[np.ndarray]],
+        window_ms: float = 3.0,
+        max_batch_size: int = 32
+    ):
+        self.logger = rag_logger.getChild("QueryBatcher")
+        self._encode_batch = encode_batch
+        self.window_seconds = window_ms / 1000
+        self.max_batch_size = max(1, max_batch_size)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Strong references to the running batches; the loop only keeps weak ones
+        self._running: Set[asyncio.Task] = set()
+
+        self.batches = 0
+        self.queries = 0
+        self.largest_batch = 0
+
+    async def encode(self, text: str) -> np.ndarray:
+        """Encode one query, sharing a batch with concurrent callers"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if not self._running or len(self._pending) >= self.max_batch_size or self.window_seconds <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._running.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task) -> None:
+        self._running.discard(task)
+        # Queries that waited on this batch go now rather than at the end of their window
+        if self._pending and not self._running:
+            self._flush()
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        unique_texts = list(dict.fromkeys(text for text, _ in batch))
+        self.batches += 1
+        self.queries += len(batch)
+        self.largest_batch = max(self.largest_batch, len(batch))
+        try:
+            embeddings = await self._encode_batch(unique_texts)
+            by_text = dict(zip(unique_texts, embeddings))
+            for text, future in batch:
+                if not future.done():
+                    future.set_result(by_text[text])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "window_ms": self.window_seconds * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "queries": self.queries,
+            "avg_batch_size": round(self.queries / self.batches, 2) if self.batches else 0.0,
+            "largest_batch": self.largest_batch
+        }
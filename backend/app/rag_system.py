@@ -1,195 +1,906 @@
+import asyncio
 import os
-from typing import List, Dict, Any, Optional
+import re
+import threading
+import time
+from functools import partial
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Tuple
 from datetime import datetime
 
 import chromadb
+import numpy as np
 from chromadb.config import Settings as ChromaSettings
-from datasets import load_dataset
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
+from app.caching import LRUCache, normalize_query
+from app.dataset_processor import DatasetPrepPool, TherapyDatasetProcessor
+from app.dedup import Deduplicator
+from app.embedding_cache import EmbeddingCache
+from app.embedding_pool import EmbeddingPool
+from app.index_manifest import IndexManifest, config_fingerprint, document_id
+from app.index_versions import LEGACY_VERSION, IndexAliases, IndexValidationError
+from app.indexing_pipeline import DocumentBatch, IndexingPipeline
+from app.lexical_index import LexicalIndex
+from app.query_batcher import QueryBatcher
+from app.ranking import collapse_chunks, maximal_marginal_relevance, reciprocal_rank_fusion
+from app.retrieval_executor import RetrievalExecutor, RetrievalOverloadedError
+from app.vector_store import PartitionedVectorStore, VectorStore, create_vector_store, delete_vector_store
 from app.utils.logger import rag_logger
+from app.utils.memory import peak_rss_mb
 from app.config import settings
 
-class TherapyDatasetProcessor:
-    """Handles processing and standardization of various therapy datasets"""
-    
-    # Dataset configurations with verified column names
-    # "text_column": single column containing text
-    # "text_columns": list of columns to combine (e.g., Context + Response)
-    DATASET_CONFIGS = {
-        # Verified working datasets with correct column mappings
-        "Amod/mental_health_counseling_conversations": {"text_columns": ["Context", "Response"]},
-        "LuangMV97/Empathetic_counseling_Dataset": {"text_column": "input"},
-        "ShenLab/MentalChat16K": {"text_columns": ["instruction", "input", "output"]},
-        "IINOVAII/therapy-conversations-combined": {"text_columns": ["instruction", "input", "output"]},
-        "anirudh2403/therapy-conversation-synthetic": {"text_column": "Conversations"},
-        "MeetX/mental-health-dataset-mistral7b": {"text_column": "text"},
-        "marmikpandya/mental-health": {"text_columns": ["instruction", "output"]},
-        "dair-ai/emotion": {"text_column": "text"},
-    }
-
-    def __init__(self):
-        self.logger = rag_logger.getChild("DatasetProcessor")
-
-    def load_dataset(self, dataset_name: str) -> List[Dict[str, Any]]:
-        """Load and process a dataset from Hugging Face"""
-        try:
-            config = self.DATASET_CONFIGS[dataset_name]
-            dataset = load_dataset(dataset_name)
-            processed_data = []
-
-            for split in dataset.keys():
-                data = dataset[split]
-                for item in data:
-                    # Handle single column or multiple columns to combine
-                    if "text_column" in config:
-                        raw_text = item.get(config["text_column"], "")
-                        used_cols = [config["text_column"]]
-                    elif "text_columns" in config:
-                        # Combine multiple columns (e.g., Context + Response)
-                        parts = []
-                        for col in config["text_columns"]:
-                            if col in item and item[col]:
-                                parts.append(f"{col}: {item[col]}")
-                        raw_text = "\n".join(parts)
-                        used_cols = config["text_columns"]
-                    else:
-                        continue
-                    
-                    processed_text = self._process_text(raw_text)
-                    if processed_text:
-                        processed_data.append({
-                            "text": processed_text,
-                            "metadata": {
-                                "source": dataset_name,
-                                "split": split,
-                                **{k: v for k, v in item.items() if k not in used_cols}
-                            }
-                        })
-
-            self.logger.info(f"Processed {len(processed_data)} entries from {dataset_name}")
-            return processed_data
-        except Exception as e:
-            self.logger.error(f"Error processing dataset {dataset_name}: {str(e)}")
-            return []
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    """Yield successive lists of at most `size` items from an iterable"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
 
-    def _process_text(self, text: str) -> Optional[str]:
-        """Clean and standardize text data"""
-        if not isinstance(text, str):
-            return None
-        
-        # Basic cleaning
-        text = text.strip()
-        text = " ".join(text.split())  # Normalize whitespace
-        
-        # Filter out empty or very short texts
-        if len(text) < 10:
-            return None
-            
-        return text
+def _slug(name: str) -> str:
+    """Collection-name-safe form of a partition name"""
+    return re.sub(r"[^a-zA-Z0-9_-]+", "_", name).strip("_") or "default"
 
 class TherapyRAG:
     """Main RAG system for therapy conversations"""
     
-    def __init__(self, vector_db_path: str = None):
+    def __init__(self, vector_db_path: str = None, index_version: Optional[str] = None, read_only: bool = False):
         self.logger = rag_logger.getChild("TherapyRAG")
         self.vector_db_path = vector_db_path or settings.VECTOR_DB_PATH
-        self.collection_name = "therapy_conversations"
+        # A read-only system (the API's) only queries and reloads what the
+        # ingest worker wrote; it never creates or modifies Chroma collections
+        self.read_only = read_only
+        self.base_collection_name = "therapy_conversations"
+        # Retrieval reads the version the alias names live (or `index_version`)
+        self.index_aliases = IndexAliases(os.path.join(self.vector_db_path, "index_aliases.json"))
         
-        # Initialize ChromaDB
-        self.chroma_client = chromadb.PersistentClient(
-            path=self.vector_db_path,
-            settings=ChromaSettings(
-                anonymized_telemetry=False,
-                allow_reset=True
-            )
-        )
-        
-        # Initialize sentence transformer
-        self.embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
-        
-        # Get or create collection
-        self.collection = self.chroma_client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}
-        )
+        # The Chroma client, vector store and embedding model are opened on
+        # first use or by warm_up, so constructing the system is cheap
+        self._store_lock = threading.RLock()
+        self._model_lock = threading.Lock()
+        self._chroma_client = None
+        self._vector_store: Optional[VectorStore] = None
+        self._embedding_model: Optional[SentenceTransformer] = None
+        self.warm_up_state = "pending"
+        self.warm_up_error: Optional[str] = None
+        self.warm_up_seconds: Optional[float] = None
+        self.search_ef = settings.HNSW_SEARCH_EF
         
+        self.lexical_fallbacks = 0
+
         self.dataset_processor = TherapyDatasetProcessor()
+        self.query_embedding_cache = LRUCache(settings.QUERY_EMBEDDING_CACHE_BYTES)
+        # Encodes go through the persistent cache, so unchanged texts are never encoded twice
+        self.embedding_cache = EmbeddingCache(
+            settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_MODEL
+        ) if settings.EMBEDDING_CACHE_ENABLED else None
+        # Advances on every index write; retrieval cache entries are keyed on it.
+        # Writes from other processes are only picked up once entries expire.
+        self.index_generation = 0
+        self.retrieval_cache = LRUCache(
+            settings.RETRIEVAL_CACHE_BYTES,
+            ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS
+        )
+        self.retrieval_executor = RetrievalExecutor(
+            workers=settings.RETRIEVAL_WORKERS,
+            max_concurrency=settings.RETRIEVAL_MAX_CONCURRENCY,
+            max_queue=settings.RETRIEVAL_MAX_QUEUE
+        )
+        self.query_batcher = QueryBatcher(
+            self._encode_queries,
+            window_ms=settings.QUERY_BATCH_WINDOW_MS,
+            max_batch_size=settings.QUERY_BATCH_MAX_SIZE
+        )
+        self.indexing_pipeline: Optional[IndexingPipeline] = None
+        self.indexing = False
+        self.deduplicator: Optional[Deduplicator] = None
+        self._dedup_seeded = False
+        # The staging system of a running rebuild
+        self.building: Optional["TherapyRAG"] = None
+        self._bind_version(index_version or self.index_aliases.live)
 
-    async def load_and_index_datasets(self) -> None:
-        """Load and index all configured datasets"""
-        try:
-            total_documents = 0
-            
-            for dataset_name in tqdm(TherapyDatasetProcessor.DATASET_CONFIGS.keys()):
-                self.logger.info(f"Processing dataset: {dataset_name}")
-                
-                # Load and process dataset
-                documents = self.dataset_processor.load_dataset(dataset_name)
-                if not documents:
-                    continue
-                
-                # Process in batches
-                batch_size = settings.BATCH_SIZE
-                for i in range(0, len(documents), batch_size):
-                    batch = documents[i:i + batch_size]
-                    
-                    # Prepare batch data
-                    texts = [doc["text"] for doc in batch]
-                    ids = [f"{dataset_name}-{i+j}" for j in range(len(batch))]
-                    metadatas = [doc["metadata"] for doc in batch]
-                    
-                    # Generate embeddings
-                    embeddings = self.embedding_model.encode(texts)
-                    
-                    # Add to ChromaDB
-                    self.collection.add(
-                        documents=texts,
-                        embeddings=embeddings.tolist(),
-                        ids=ids,
-                        metadatas=metadatas
+    def _version_paths(self, version: str) -> Tuple[str, str, str]:
+        """Collection name, lexical index path and manifest path of an index version"""
+        if version == LEGACY_VERSION:
+            collection_name, manifest_name = self.base_collection_name, "index_manifest.json"
+        else:
+            collection_name, manifest_name = f"{self.base_collection_name}_{version}", f"index_manifest_{version}.json"
+        return (
+            collection_name,
+            os.path.join(self.vector_db_path, "lexical", f"{collection_name}.sqlite3"),
+            os.path.join(self.vector_db_path, manifest_name)
+        )
+
+    def _bind_version(self, version: str) -> None:
+        """Point the system at an index version; its vector store opens on next use"""
+        self.index_version = version
+        self.collection_name, lexical_path, manifest_path = self._version_paths(version)
+        # BM25 inverted index built alongside the vector index at ingest time
+        self.lexical_index = LexicalIndex(lexical_path)
+        self.manifest = IndexManifest(manifest_path)
+        # MinHash signatures of the stored documents, saved by the last completed indexing run
+        self.dedup_state_path = f"{os.path.splitext(manifest_path)[0]}_dedup.npz"
+        self._vector_store = None
+
+    @property
+    def chroma_client(self):
+        """ChromaDB client, opened on first use (only needed by the chroma backend)"""
+        if self._chroma_client is None and settings.VECTOR_STORE_BACKEND == "chroma":
+            with self._store_lock:
+                if self._chroma_client is None:
+                    self._chroma_client = chromadb.PersistentClient(
+                        path=self.vector_db_path,
+                        settings=ChromaSettings(
+                            anonymized_telemetry=False,
+                            allow_reset=True
+                        )
                     )
-                    
-                    total_documents += len(batch)
-                    
-            self.logger.info(f"Successfully indexed {total_documents} documents")
+        return self._chroma_client
+
+    @property
+    def vector_store(self) -> VectorStore:
+        """The collection's vector store, or one per partition, opened on first use"""
+        if self._vector_store is None:
+            with self._store_lock:
+                if self._vector_store is None:
+                    if settings.PARTITIONED_INDEX:
+                        self._vector_store = PartitionedVectorStore(
+                            lambda partition: self._create_vector_store(f"{self.collection_name}_{_slug(partition)}"),
+                            TherapyDatasetProcessor.partition_routes()
+                        )
+                    else:
+                        self._vector_store = self._create_vector_store(self.collection_name)
+        return self._vector_store
+
+    @vector_store.setter
+    def vector_store(self, store: VectorStore) -> None:
+        self._vector_store = store
+
+    @property
+    def embedding_model(self) -> SentenceTransformer:
+        """Sentence transformer, loaded on first use"""
+        if self._embedding_model is None:
+            with self._model_lock:
+                if self._embedding_model is None:
+                    self._embedding_model = SentenceTransformer(settings.EMBEDDING_MODEL)
+        return self._embedding_model
+
+    @embedding_model.setter
+    def embedding_model(self, model: SentenceTransformer) -> None:
+        self._embedding_model = model
+
+    @property
+    def ready(self) -> bool:
+        return self.warm_up_state == "ready"
+
+    def warm_up(self) -> None:
+        """
+        Open the vector store and load the embedding model ahead of the first query (blocking)
+
+        A dummy encode runs the model's first forward pass, which is much
+        slower than later ones. Failures are recorded in warm_up_state and
+        warm_up_error rather than raised, so a background warm-up cannot
+        take the process down.
+        """
+        started = time.perf_counter()
+        self.warm_up_state = "warming"
+        try:
+            self.vector_store.count()
+            self.embedding_model.encode(["warm-up"])
+        except Exception as e:
+            self.warm_up_state = "failed"
+            self.warm_up_error = str(e)
+            self.logger.error(f"Warm-up failed: {str(e)}")
+            return
+        self.warm_up_seconds = round(time.perf_counter() - started, 2)
+        self.warm_up_state = "ready"
+        self.logger.info(f"Warm-up finished in {self.warm_up_seconds}s")
+
+    def _create_vector_store(self, name: str) -> VectorStore:
+        hnsw = settings.HNSW_PROFILES.get(settings.HNSW_PROFILE)
+        if hnsw is None:
+            raise ValueError(f"Unknown HNSW profile: {settings.HNSW_PROFILE}")
+        return create_vector_store(
+            settings.VECTOR_STORE_BACKEND,
+            name,
+            self.vector_db_path,
+            chroma_client=self.chroma_client,
+            dtype=settings.VECTOR_STORE_DTYPE,
+            rescore=settings.VECTOR_STORE_RESCORE,
+            rescore_factor=settings.VECTOR_STORE_RESCORE_FACTOR,
+            hnsw=hnsw,
+            search_ef=self.search_ef or hnsw.get("search_ef"),
+            read_only=self.read_only
+        )
+
+    def set_search_ef(self, search_ef: int, drain_timeout: float = 10.0) -> None:
+        """
+        Change HNSW search ef of the live index without rebuilding it
+
+        Chroma only reads ef when it loads an index, so the client is closed
+        and reopened and the stores apply the new ef as they are recreated.
+        Only one Chroma system is open on the directory at a time: new
+        queries wait on the store lock while in-flight retrievals drain (up
+        to `drain_timeout` seconds), then the old client's system is
+        stopped. Refused while this process is indexing, since the pipeline
+        writes through the old client, and in a read-only system, which
+        queues a "search_ef" ingest job instead.
+        """
+        if settings.VECTOR_STORE_BACKEND != "chroma":
+            raise ValueError(f"The {settings.VECTOR_STORE_BACKEND} backend has no search ef")
+        self._check_writable()
+        with self._store_lock:
+            if self.indexing:
+                raise RuntimeError("Cannot change search ef while indexing is running")
+            self.search_ef = search_ef
+            self._reopen_vector_store(drain_timeout)
+        # Results at the old ef are no longer what a fresh query returns
+        self.index_generation += 1
+
+    def reload(self, drain_timeout: float = 10.0) -> None:
+        """
+        Reopen the index from disk after another process (the ingest worker) wrote to it
+
+        The alias is resolved again, so a version swapped live (or rolled
+        back) elsewhere is picked up. The vector store is reopened as in
+        set_search_ef, the lexical index and manifest are read again, and
+        cached retrievals are invalidated.
+        """
+        with self._store_lock:
+            if self.indexing:
+                raise RuntimeError("Cannot reload the index while indexing is running")
+            self.lexical_index.close()
+            self._bind_version(self.index_aliases.live)
+            self._reopen_vector_store(drain_timeout)
+        self.index_generation += 1
+
+    def _reopen_vector_store(self, drain_timeout: float) -> None:
+        """Close the vector store and Chroma client once in-flight retrievals drain, and open them again (store lock held)"""
+        client = self._chroma_client
+        self._vector_store = None
+        deadline = time.monotonic() + drain_timeout
+        while self.retrieval_executor.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        if client is not None:
+            # Stops the system once this was its last client, so the
+            # reopened client loads the index again from disk
+            client.close()
+        self._chroma_client = None
+        self.vector_store.count()
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise RuntimeError("The index is open read-only; writes go through the ingest worker")
+
+    async def load_and_index_datasets(
+        self,
+        embedding_workers: Optional[int] = None,
+        datasets: Optional[List[str]] = None
+    ) -> None:
+        """Stream, embed and index the configured datasets (all, or only `datasets`) through the indexing pipeline"""
+        self._check_writable()
+        with self._store_lock:
+            if self.indexing:
+                raise RuntimeError("Indexing is already running")
+            self.indexing = True
+        workers = embedding_workers or settings.EMBEDDING_WORKERS
+        pool = None
+        try:
+            pool = EmbeddingPool(settings.EMBEDDING_MODEL, workers) if workers > 1 else None
+            # A wiped or recreated collection invalidates every checkpoint
+            if self.vector_store.count() == 0:
+                self.manifest.reset()
+            elif self.lexical_index.count() < self.vector_store.count():
+                await asyncio.to_thread(self._backfill_lexical_index)
+
+            self.deduplicator = self._new_deduplicator()
+            self._dedup_seeded = False
+
+            encode = pool.submit if pool else self._encode_texts
+            if self.embedding_cache:
+                encode = partial(self.embedding_cache.encode, encoder=encode)
+            pipeline = IndexingPipeline(
+                encode=encode,
+                write=self._write_batch,
+                queue_size=settings.PIPELINE_QUEUE_SIZE,
+                # Keep every worker busy plus one queued batch each
+                max_in_flight=workers * 2 if pool else 1
+            )
+            self.indexing_pipeline = pipeline
+
+            # Run the worker threads off the event loop and wait for them to drain
+            await asyncio.to_thread(pipeline.run, self._iter_batches(datasets))
+
+            if self.deduplicator:
+                self.deduplicator.log_report()
+                # Every registered document is now stored, so the next run can load them
+                if self._dedup_seeded:
+                    await asyncio.to_thread(self.deduplicator.save, self.dedup_state_path, self.vector_store.count())
+
+            total_documents = pipeline.stats["persist"].items
+            peak_rss = peak_rss_mb()
+            self.logger.info(
+                f"Successfully indexed {total_documents} documents"
+                + (f" (peak RSS {peak_rss:.1f} MB)" if peak_rss is not None else "")
+            )
             
         except Exception as e:
             self.logger.error(f"Error in load_and_index_datasets: {str(e)}")
             raise
+        finally:
+            if pool:
+                pool.close()
+            if self.embedding_cache:
+                self.embedding_cache.flush()
+            self.indexing = False
+
+    def _backfill_lexical_index(self) -> None:
+        """Add documents indexed before the lexical index existed (re-adds are no-ops)"""
+        self.logger.info("Backfilling lexical index from the vector store")
+        for ids, documents, metadatas in self.vector_store.iter_documents(settings.BATCH_SIZE * 10):
+            self.lexical_index.add(ids, documents, [metadata.get("source") for metadata in metadatas])
+        self.logger.info(f"Lexical index holds {self.lexical_index.count()} documents")
+
+    def _new_deduplicator(self) -> Optional[Deduplicator]:
+        return Deduplicator(
+            threshold=settings.DEDUP_SIMILARITY_THRESHOLD,
+            num_perm=settings.DEDUP_NUM_PERM,
+            shingle_size=settings.DEDUP_SHINGLE_SIZE
+        ) if settings.DEDUP_ENABLED else None
+
+    def _seed_deduplicator(self) -> None:
+        """
+        Register every stored document, so datasets indexed by earlier runs count as seen
+
+        The signatures saved by the last completed run are loaded when they
+        still stand for every stored document; otherwise (a first run, or
+        one after an interrupted or undeduplicated run) they are computed
+        from the stored texts.
+        """
+        indexed = self.vector_store.count()
+        loaded = self.deduplicator.load(self.dedup_state_path, indexed)
+        if loaded is not None:
+            self.logger.info(f"Loaded deduplicator signatures of {loaded} stored documents")
+        else:
+            seeded = 0
+            for _, documents, metadatas in self.vector_store.iter_documents(settings.BATCH_SIZE * 10):
+                seeded += self.deduplicator.seed(documents, [metadata.get("source") for metadata in metadatas])
+            self.logger.info(f"Seeded deduplicator with {seeded} stored documents")
+        self._dedup_seeded = True
+
+    def _fingerprint(self, dataset_name: str) -> str:
+        # The base collection name, not the versioned one, so checkpoints stay valid when copied to a new version
+        return config_fingerprint(
+            TherapyDatasetProcessor.DATASET_CONFIGS[dataset_name],
+            settings.EMBEDDING_MODEL,
+            self.base_collection_name,
+            settings.CHUNKING_ENABLED and (settings.CHUNK_TOKENS, settings.CHUNK_OVERLAP_TOKENS)
+        )
+
+    def _stale(self, dataset_name: str) -> bool:
+        """Whether a dataset is not fully indexed with the current config in this version"""
+        entry = self.manifest.get(dataset_name)
+        return not entry or entry.get("fingerprint") != self._fingerprint(dataset_name) or not entry.get("completed")
+
+    def _resumable(self, version: str, datasets: List[str]) -> bool:
+        """Whether an unfinished version's checkpoints for `datasets` were made with the current config"""
+        manifest = IndexManifest(self._version_paths(version)[2])
+        return all(
+            (manifest.get(name) or {}).get("fingerprint", self._fingerprint(name)) == self._fingerprint(name)
+            for name in datasets
+        )
 
-    async def retrieve(self, query: str, n_results: int = None) -> List[Dict[str, Any]]:
-        """Retrieve similar documents for a query"""
+    async def rebuild(
+        self,
+        embedding_workers: Optional[int] = None,
+        datasets: Optional[List[str]] = None,
+        force: bool = False
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Index a new version of the index beside the live one and swap it live once it validates
+
+        The datasets re-indexed are those (of `datasets`, or of every
+        configured dataset) not fully indexed with the current config, or
+        all of them with `force`. Documents of the other datasets are copied
+        from the live version with their embeddings, so only the re-indexed
+        datasets are encoded again. The new version is checked by
+        validate_index; if it passes, the alias is swapped, this system
+        serves the new version, the old live version is kept for rollback
+        and the one before it is deleted. If it fails, IndexValidationError
+        is raised, the new version is deleted and the live index is left
+        untouched. A build that is interrupted (or cancelled) resumes on the
+        next rebuild of the same datasets. Returns the validation report, or
+        None when there was nothing to re-index.
+        """
+        self._check_writable()
+        with self._store_lock:
+            if self.indexing:
+                raise RuntimeError("Indexing is already running")
+            self.indexing = True
+        staging = None
+        try:
+            candidates = list(TherapyDatasetProcessor.DATASET_CONFIGS) if datasets is None else datasets
+            reindex = sorted(name for name in candidates if force or self._stale(name))
+            if not reindex:
+                self.logger.info("Every dataset is already indexed; nothing to rebuild")
+                return None
+
+            building = self.index_aliases.building
+            # A build resumed under another config would restart its datasets on top of their old documents
+            if building and building["datasets"] == reindex and self._resumable(building["version"], reindex):
+                version = building["version"]
+                self.logger.info(f"Resuming build of index version {version}")
+            else:
+                if building:
+                    self.logger.info(f"Discarding unfinished index version {building['version']}")
+                    self._delete_version(building["version"])
+                version = self.index_aliases.start_build(reindex)
+            # A build interrupted before its copy finished starts over
+            if not IndexManifest(self._version_paths(version)[2]).to_dict().get("copied_from"):
+                self._delete_version(version)
+
+            staging = TherapyRAG(self.vector_db_path, index_version=version)
+            staging._chroma_client = self.chroma_client
+            staging._embedding_model = self._embedding_model
+            staging.search_ef = self.search_ef
+            staging.embedding_cache = self.embedding_cache
+            self.building = staging
+            if not staging.manifest.to_dict().get("copied_from"):
+                await asyncio.to_thread(self._copy_into, staging, reindex)
+
+            self.logger.info(f"Building index version {version} (re-indexing {', '.join(reindex)})")
+            await staging.load_and_index_datasets(embedding_workers=embedding_workers, datasets=reindex)
+
+            report = await asyncio.to_thread(staging.validate_index, self.vector_store.count())
+            if report["failures"]:
+                self.logger.error(f"Index version {version} failed validation: {report['failures']}")
+                staging.lexical_index.close()
+                self._delete_version(version)
+                self.index_aliases.abandon_build()
+                raise IndexValidationError(report)
+
+            retired = self.index_aliases.swap(version)
+            with self._store_lock:
+                self.lexical_index.close()
+                self.index_version = version
+                self.collection_name = staging.collection_name
+                self._vector_store = staging.vector_store
+                self.lexical_index = staging.lexical_index
+                self.manifest = staging.manifest
+                self.dedup_state_path = staging.dedup_state_path
+            self.index_generation += 1
+            if retired:
+                self._delete_version(retired)
+            return report
+        finally:
+            if staging is not None:
+                staging.retrieval_executor.shutdown()
+            self.building = None
+            self.indexing = False
+
+    async def rebuild_partition(self, partition: str, embedding_workers: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Re-index only the datasets routed to one partition, in a new version built beside the live one"""
+        if not settings.PARTITIONED_INDEX:
+            raise ValueError("Partition rebuilds require PARTITIONED_INDEX")
+        routes = TherapyDatasetProcessor.partition_routes()
+        if partition not in set(routes.values()) | {"default"}:
+            raise ValueError(f"Unknown partition: {partition}")
+        datasets = [name for name, target in routes.items() if target == partition]
+        return await self.rebuild(embedding_workers=embedding_workers, datasets=datasets, force=True)
+
+    def rollback(self, drain_timeout: float = 10.0) -> str:
+        """Make the previous index version live again; returns its name"""
+        with self._store_lock:
+            if self.indexing:
+                raise RuntimeError("Cannot roll back while indexing is running")
+            version = self.index_aliases.rollback()
+        self.reload(drain_timeout)
+        return version
+
+    def _copy_into(self, staging: "TherapyRAG", reindex: List[str]) -> None:
+        """Copy the live documents, lexical entries and checkpoints of datasets not being re-indexed"""
+        copied = 0
+        for ids, documents, metadatas in self.vector_store.iter_documents(settings.BATCH_SIZE * 10):
+            keep = [doc_id for doc_id, metadata in zip(ids, metadatas) if metadata.get("source") not in reindex]
+            stored = self.vector_store.get(keep, include_embeddings=True)
+            if stored:
+                staging.vector_store.add(
+                    ids=[doc["id"] for doc in stored],
+                    documents=[doc["text"] for doc in stored],
+                    embeddings=np.stack([doc["embedding"] for doc in stored]),
+                    metadatas=[doc["metadata"] for doc in stored]
+                )
+                copied += len(stored)
+
+        if self.lexical_index.count() < self.vector_store.count():
+            self._backfill_lexical_index()
+        staging.lexical_index.close()
+        self.lexical_index.copy_to(staging.lexical_index.path)
+        staging.lexical_index = LexicalIndex(staging.lexical_index.path)
+        staging.lexical_index.remove_sources(reindex)
+
+        # Signatures of the copied documents carry over, so the build does not recompute them
+        deduplicator = self._new_deduplicator()
+        if deduplicator and deduplicator.load(self.dedup_state_path, self.vector_store.count(), reindex) is not None:
+            deduplicator.save(staging.dedup_state_path, staging.vector_store.count())
+
+        entries = self.manifest.to_dict()["datasets"]
+        staging.manifest.restore({
+            "datasets": {name: entry for name, entry in entries.items() if name not in reindex},
+            "copied_from": self.index_version
+        })
+        self.logger.info(f"Copied {copied} documents from index version {self.index_version} to {staging.index_version}")
+
+    def validate_index(self, reference_count: int = 0) -> Dict[str, Any]:
+        """
+        Check this version before it is swapped live
+
+        Fails when the index is empty, the lexical and vector indexes
+        disagree on the document count, it holds fewer than
+        INDEX_MIN_COUNT_RATIO of `reference_count` (the live count), a
+        dataset is left unfinished, or fewer than INDEX_MIN_SAMPLE_RECALL of
+        a sample of stored vectors are found among their own
+        INDEX_VALIDATION_K nearest neighbours.
+        """
+        count = self.vector_store.count()
+        manifest = self.manifest.to_dict()["datasets"]
+        incomplete = sorted(name for name, entry in manifest.items() if not entry.get("completed"))
+
+        stores = list(self.vector_store.partitions.values()) if isinstance(self.vector_store, PartitionedVectorStore) \
+            else [self.vector_store]
+        per_store = max(1, settings.INDEX_VALIDATION_SAMPLES // len(stores))
+        sample_ids = [doc_id for store in stores for doc_id in (store.peek(per_store)["ids"] or [])]
+        found = 0
+        for doc in self.vector_store.get(sample_ids, include_embeddings=True):
+            results = self.vector_store.query(doc["embedding"], settings.INDEX_VALIDATION_K)
+            found += any(result["id"] == doc["id"] for result in results)
+        sample_recall = found / len(sample_ids) if sample_ids else 0.0
+
+        failures = []
+        if count == 0:
+            failures.append("index is empty")
+        if self.lexical_index.count() != count:
+            failures.append(f"lexical index holds {self.lexical_index.count()} documents, vector index {count}")
+        if count < settings.INDEX_MIN_COUNT_RATIO * reference_count:
+            failures.append(f"{count} documents is below {settings.INDEX_MIN_COUNT_RATIO:.0%} of the live {reference_count}")
+        if incomplete:
+            failures.append(f"unfinished datasets: {', '.join(incomplete)}")
+        if sample_ids and sample_recall < settings.INDEX_MIN_SAMPLE_RECALL:
+            failures.append(f"sample recall {sample_recall:.2f} is below {settings.INDEX_MIN_SAMPLE_RECALL}")
+        return {
+            "version": self.index_version,
+            "documents": count,
+            "lexical_documents": self.lexical_index.count(),
+            "reference_documents": reference_count,
+            "incomplete_datasets": incomplete,
+            "sample_size": len(sample_ids),
+            "sample_recall": round(sample_recall, 4),
+            "failures": failures
+        }
+
+    def _delete_version(self, version: str) -> None:
+        """Delete every collection (or partition), the lexical index and the manifest of a version"""
+        if version == self.index_version:
+            raise ValueError(f"Cannot delete the index version in use: {version}")
+        collection_name, lexical_path, manifest_path = self._version_paths(version)
+        partitions = set(TherapyDatasetProcessor.partition_routes().values()) | {"default"}
+        for name in [collection_name] + [f"{collection_name}_{_slug(partition)}" for partition in sorted(partitions)]:
+            delete_vector_store(settings.VECTOR_STORE_BACKEND, name, self.vector_db_path, chroma_client=self.chroma_client)
+        dedup_state_path = f"{os.path.splitext(manifest_path)[0]}_dedup.npz"
+        for path in (lexical_path, f"{lexical_path}-wal", f"{lexical_path}-shm", manifest_path, dedup_state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.logger.info(f"Deleted index version {version}")
+
+    def _iter_batches(self, datasets: Optional[List[str]] = None) -> Iterator[DocumentBatch]:
+        """
+        Clean stage: stream every configured dataset as fixed-size document batches
+
+        Datasets already fully indexed with the current config are skipped
+        and a partially indexed dataset resumes from its manifest checkpoint.
+        A dataset with documents stored under a different config is skipped
+        too: the stores cannot drop a source in place, so it is re-indexed
+        by `rebuild`, which leaves its old documents out of the new version.
+        With PREP_WORKERS > 1 the remaining datasets are downloaded and
+        cleaned in parallel by a DatasetPrepPool while earlier ones are being
+        embedded. Exact/near duplicates of stored documents or earlier
+        documents in this run, as well as documents whose content-addressed
+        id is already stored, are dropped before they reach the embedding
+        stage. A dataset that fails to load is skipped without completing
+        its checkpoint.
+        """
+        batch_size = settings.BATCH_SIZE
+        pending = []
+        for dataset_name in TherapyDatasetProcessor.DATASET_CONFIGS:
+            if datasets is not None and dataset_name not in datasets:
+                continue
+            entry = self.manifest.get(dataset_name)
+            if entry and entry.get("documents") and entry.get("fingerprint") != self._fingerprint(dataset_name):
+                self.logger.warning(f"Skipping {dataset_name}: indexed with a different config; rebuild to re-index it")
+                continue
+            start_row = self.manifest.resume_row(dataset_name, self._fingerprint(dataset_name))
+            if start_row is None:
+                self.logger.info(f"Skipping {dataset_name}: already indexed")
+                continue
+            pending.append((dataset_name, start_row))
+        if not pending:
+            return
+
+        # Start every download and clean now; they are consumed in config order
+        prep_pool = DatasetPrepPool(
+            settings.PREP_WORKERS,
+            os.path.join(self.vector_db_path, "prepared"),
+            num_proc=settings.PREP_NUM_PROC
+        ) if settings.PREP_WORKERS > 1 else None
+        try:
+            futures = {name: prep_pool.submit(name, start_row) for name, start_row in pending} if prep_pool else {}
+            if self.deduplicator:
+                self._seed_deduplicator()
+
+            for dataset_name, start_row in tqdm(pending):
+                self.logger.info(
+                    f"Processing dataset: {dataset_name}"
+                    + (f" (resuming at row {start_row})" if start_row else "")
+                )
+                try:
+                    prepared = DatasetPrepPool.result(futures[dataset_name]) if prep_pool else \
+                        self.dataset_processor.prepare(dataset_name, start_row=start_row, num_proc=settings.PREP_NUM_PROC)
+                except Exception as e:
+                    # Left unfinished in the manifest, so the next run retries it
+                    self.logger.error(f"Error processing dataset {dataset_name}: {str(e)}")
+                    continue
+
+                # Stream documents so memory is bounded by the batch size
+                documents = TherapyDatasetProcessor.iter_prepared(prepared) if prepared is not None else iter(())
+                new_documents = 0
+                rows_end = start_row
+                for batch in _batched(documents, batch_size):
+                    # A row is only done once its last chunk is in a batch
+                    last = batch[-1]
+                    last_chunk = last["metadata"].get("chunk_index", 0) + 1 == last["metadata"].get("chunk_count", 1)
+                    rows_end = last["row"] + 1 if last_chunk else last["row"]
+                    if self.deduplicator:
+                        batch = self.deduplicator.filter(batch)
+                    batch = self._drop_indexed(batch)
+                    new_documents += len(batch)
+                    yield DocumentBatch(dataset_name=dataset_name, documents=batch, rows_end=rows_end)
+
+                # Marker batch: persisted after everything above, completes the checkpoint
+                yield DocumentBatch(dataset_name=dataset_name, documents=[], rows_end=rows_end, completed=True)
+                self.logger.info(f"Queued {new_documents} new entries from {dataset_name}")
+        finally:
+            if prep_pool:
+                prep_pool.close()
+
+    def _drop_indexed(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Assign content-addressed ids and drop documents already in the collection"""
+        unique: Dict[str, Dict[str, Any]] = {}
+        for doc in batch:
+            doc["id"] = document_id(doc["text"], doc["metadata"]["source"])
+            unique.setdefault(doc["id"], doc)
+        if not unique:
+            return []
+
+        existing = self.vector_store.existing_ids(list(unique))
+        return [doc for doc_id, doc in unique.items() if doc_id not in existing]
+
+    def _write_batch(self, batch: DocumentBatch) -> None:
+        """Persist stage: add an embedded batch to the vector store and checkpoint the manifest"""
+        if batch.documents:
+            self.vector_store.add(
+                ids=[doc["id"] for doc in batch.documents],
+                documents=[doc["text"] for doc in batch.documents],
+                embeddings=batch.embeddings,
+                metadatas=[doc["metadata"] for doc in batch.documents]
+            )
+            self.lexical_index.add(
+                [doc["id"] for doc in batch.documents],
+                [doc["text"] for doc in batch.documents],
+                [doc["metadata"]["source"] for doc in batch.documents]
+            )
+            self.index_generation += 1
+        self.manifest.checkpoint(
+            batch.dataset_name,
+            rows_done=batch.rows_end,
+            documents=len(batch.documents),
+            completed=batch.completed
+        )
+
+    async def retrieve(
+        self,
+        query: str,
+        n_results: int = None,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Retrieve similar documents for a query
+
+        RETRIEVAL_MODE selects dense vector search ("vector"), BM25 over the
+        lexical index ("lexical"), or both fused by reciprocal rank
+        ("hybrid"). In hybrid mode, queries that arrive while the retrieval
+        executor is saturated, or that it rejects, are answered from the
+        lexical index alone so they skip the transformer pass.
+
+        With MMR_ENABLED, n_results * MMR_CANDIDATE_FACTOR candidates are
+        fetched with their embeddings and a diverse n_results are picked by
+        maximal marginal relevance, so near-identical paraphrases do not
+        crowd out other examples. Lexical-only retrieval skips this stage.
+
+        `sources` limits results to those datasets; with PARTITIONED_INDEX
+        only the partitions holding them are searched.
+
+        Chunks of the same parent document are collapsed to the best-ranked
+        one, over-fetching by CHUNK_CANDIDATE_FACTOR to make up for them.
+        """
         try:
             if n_results is None:
                 n_results = settings.RAG_N_RESULTS
-                
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode(query)
-            
-            # Query ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding.tolist()],
-                n_results=n_results,
-                include=["documents", "metadatas", "distances"]
+            mode = settings.RETRIEVAL_MODE
+            diversify = settings.MMR_ENABLED
+            fetch_n = n_results * (settings.CHUNK_CANDIDATE_FACTOR if settings.CHUNKING_ENABLED else 1)
+
+            # Results are tagged with the generation they were read from, so
+            # any index write makes older entries unreachable
+            sources = sorted(set(sources)) if sources else None
+            cache_key = (
+                self.index_generation, mode, diversify, normalize_query(query), n_results,
+                tuple(sources) if sources else None
             )
+            cached = self.retrieval_cache.get(cache_key)
+            if cached is not None:
+                return list(cached)
+
+            if mode == "lexical":
+                results = await asyncio.to_thread(self._lexical_search, query, fetch_n, False, sources)
+                formatted_results = collapse_chunks(results)[:n_results]
+            elif mode == "hybrid":
+                if self.retrieval_executor.saturated:
+                    return await self._lexical_fallback(query, n_results, fetch_n, sources)
+                candidates = max(n_results * settings.HYBRID_CANDIDATE_FACTOR, fetch_n)
+                if diversify:
+                    candidates = max(candidates, n_results * settings.MMR_CANDIDATE_FACTOR)
+                vector_search, lexical_results = await asyncio.gather(
+                    self._vector_search(query, candidates, diversify, sources),
+                    asyncio.to_thread(self._lexical_search, query, candidates, diversify, sources),
+                    return_exceptions=True
+                )
+                if isinstance(lexical_results, Exception):
+                    raise lexical_results
+                if isinstance(vector_search, RetrievalOverloadedError):
+                    self.lexical_fallbacks += 1
+                    return self._strip_embeddings(collapse_chunks(lexical_results)[:n_results])
+                if isinstance(vector_search, Exception):
+                    raise vector_search
+                query_embedding, vector_results = vector_search
+                fused = collapse_chunks(reciprocal_rank_fusion([vector_results, lexical_results], k=settings.RRF_K))
+                if diversify:
+                    formatted_results = self._diversify(query_embedding, fused[:candidates], n_results)
+                else:
+                    formatted_results = fused[:n_results]
+            elif diversify:
+                query_embedding, candidates = await self._vector_search(
+                    query, n_results * settings.MMR_CANDIDATE_FACTOR, True, sources
+                )
+                formatted_results = self._diversify(query_embedding, collapse_chunks(candidates), n_results)
+            else:
+                _, results = await self._vector_search(query, fetch_n, sources=sources)
+                formatted_results = collapse_chunks(results)[:n_results]
+
+            self.retrieval_cache.put(cache_key, formatted_results)
+            return list(formatted_results)
             
-            # Format results
-            formatted_results = []
-            for i in range(len(results["documents"][0])):
-                formatted_results.append({
-                    "text": results["documents"][0][i],
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i]
-                })
-                
-            return formatted_results
-            
+        except RetrievalOverloadedError as e:
+            self.logger.warning(f"Skipping retrieval: {str(e)}")
+            return []
         except Exception as e:
             self.logger.error(f"Error in retrieve: {str(e)}")
             return []
 
+    async def _vector_search(
+        self,
+        query: str,
+        n_results: int,
+        include_embeddings: bool = False,
+        sources: Optional[List[str]] = None
+    ) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+        """Embed a query and search the vector store, returning the embedding and results"""
+        query_embedding = await self._embed_query(query)
+        # Vector search blocks, so keep it off the event loop
+        results = await self.retrieval_executor.run(
+            self._search, query_embedding, n_results, include_embeddings, sources
+        )
+        return query_embedding, results
+
+    async def _lexical_fallback(
+        self,
+        query: str,
+        n_results: int,
+        fetch_n: int,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Lexical-only results for a saturated executor; not cached as hybrid results"""
+        self.lexical_fallbacks += 1
+        results = await asyncio.to_thread(self._lexical_search, query, fetch_n, False, sources)
+        return collapse_chunks(results)[:n_results]
+
+    def _search(
+        self,
+        query_embedding: np.ndarray,
+        n_results: int,
+        include_embeddings: bool = False,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search the vector store with a query embedding (blocking)"""
+        return self.vector_store.query(
+            query_embedding, n_results, include_embeddings=include_embeddings, sources=sources
+        )
+
+    def _lexical_search(
+        self,
+        query: str,
+        n_results: int,
+        include_embeddings: bool = False,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """BM25 search of the lexical index, hydrated from the vector store (blocking)"""
+        hits = self.lexical_index.search(query, n_results, sources=sources)
+        scores = dict(hits)
+        documents = self.vector_store.get([doc_id for doc_id, _ in hits], include_embeddings=include_embeddings)
+        return [{**doc, "distance": None, "score": scores[doc["id"]]} for doc in documents]
+
+    def _diversify(
+        self,
+        query_embedding: np.ndarray,
+        candidates: List[Dict[str, Any]],
+        n_results: int
+    ) -> List[Dict[str, Any]]:
+        """Select a diverse subset of candidates by maximal marginal relevance"""
+        candidates = [c for c in candidates if c.get("embedding") is not None]
+        if not candidates:
+            return []
+        selected = maximal_marginal_relevance(
+            query_embedding,
+            np.stack([c["embedding"] for c in candidates]),
+            n_results,
+            lambda_mult=settings.MMR_LAMBDA
+        )
+        return self._strip_embeddings([candidates[i] for i in selected])
+
+    @staticmethod
+    def _strip_embeddings(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in result.items() if k != "embedding"} for result in results]
+
+    async def _embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a query, serving repeated queries from the LRU cache
+
+        Cache misses go through the micro-batcher, which coalesces concurrent
+        queries into one encode call on the retrieval executor.
+        """
+        key = normalize_query(query)
+        embedding = self.query_embedding_cache.get(key)
+        if embedding is None:
+            embedding = await self.query_batcher.encode(query)
+            self.query_embedding_cache.put(key, embedding)
+        return embedding
+
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        # The lazy model is resolved here, in the calling worker thread, so a cold
+        # load never blocks the event loop and a rebuild served from the embedding
+        # cache never loads it
+        return self.embedding_model.encode(texts)
+
+    async def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        """Encode a batch of queries on the retrieval executor"""
+        if self.embedding_cache:
+            return await self.retrieval_executor.run(
+                self.embedding_cache.encode, queries, self._encode_texts, settings.EMBEDDING_CACHE_QUERIES
+            )
+        return await self.retrieval_executor.run(self._encode_texts, queries)
+
     async def get_context_for_llm(self, query: str, n_results: int = None) -> str:
         """Format retrieved context for LLM prompting"""
         results = await self.retrieve(query, n_results)
@@ -205,12 +916,32 @@ class TherapyRAG:
     def get_stats(self) -> Dict[str, Any]:
         """Get database statistics"""
         try:
-            count = self.collection.count()
+            count = self.vector_store.count()
             return {
                 "total_documents": count,
                 "collection_name": self.collection_name,
+                "index_version": self.index_version,
                 "embedding_model": settings.EMBEDDING_MODEL,
-                "last_updated": datetime.now()
+                "vector_store": self.vector_store.backend,
+                "partitions": (
+                    self.vector_store.counts() if isinstance(self.vector_store, PartitionedVectorStore) else None
+                ),
+                "last_updated": datetime.now(),
+                "indexing_pipeline": self.indexing_pipeline.get_stats() if self.indexing_pipeline else None,
+                "deduplication": self.deduplicator.get_stats() if self.deduplicator else None,
+                "query_embedding_cache": self.query_embedding_cache.get_stats(),
+                "embedding_cache": self.embedding_cache.get_stats() if self.embedding_cache else None,
+                "retrieval_cache": {
+                    **self.retrieval_cache.get_stats(),
+                    "index_generation": self.index_generation
+                },
+                "retrieval_executor": self.retrieval_executor.get_stats(),
+                "query_batcher": self.query_batcher.get_stats(),
+                "lexical_index": {
+                    **self.lexical_index.get_stats(),
+                    "retrieval_mode": settings.RETRIEVAL_MODE,
+                    "lexical_fallbacks": self.lexical_fallbacks
+                }
             }
         except Exception as e:
             self.logger.error(f"Error in get_stats: {str(e)}")
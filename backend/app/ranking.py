@@ -0,0 +1,76 @@
+from typing import Any, Dict, List
+
+import numpy as np
+
+def reciprocal_rank_fusion(rankings: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+    """
+    Merge ranked result lists by reciprocal rank fusion
+
+    Each document scores sum(1 / (k + rank)) over the lists it appears in
+    (rank starting at 1), so fusion needs no calibration between BM25
+    scores and cosine distances. Results are matched on "id"; the first
+    list a document appears in supplies its fields, and "score" is set to
+    the fused score.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking, 1):
+            doc_id = result["id"]
+            if doc_id not in fused:
+                fused[doc_id] = result
+                scores[doc_id] = 0.0
+            scores[doc_id] += 1.0 / (k + rank)
+
+    ordered = sorted(fused, key=lambda doc_id: scores[doc_id], reverse=True)
+    return [{**fused[doc_id], "score": scores[doc_id]} for doc_id in ordered]
+
+def collapse_chunks(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Keep only the best-ranked chunk of each parent document, preserving order"""
+    seen = set()
+    collapsed = []
+    for result in results:
+        key = (result.get("metadata") or {}).get("parent_id") or result["id"]
+        if key not in seen:
+            seen.add(key)
+            collapsed.append(result)
+    return collapsed
+
+def maximal_marginal_relevance(
+    query_embedding: np.ndarray,
+    candidate_embeddings: np.ndarray,
+    k: int,
+    lambda_mult: float = 0.5
+) -> List[int]:
+    """
+    Pick `k` candidate indices balancing relevance against redundancy
+
+    Each step selects the candidate maximizing
+    lambda * sim(query, c) - (1 - lambda) * max(sim(c, selected)), with
+    cosine similarities. The candidate-candidate similarity matrix is
+    computed once, and the running max similarity to the selected set is
+    updated with one vector op per step, so selection is k NumPy
+    operations over the candidate axis rather than pairwise Python loops.
+    """
+    candidates = np.asarray(candidate_embeddings, dtype=np.float32)
+    if not len(candidates) or k <= 0:
+        return []
+    candidates = candidates / np.maximum(np.linalg.norm(candidates, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32).reshape(-1)
+    query = query / (np.linalg.norm(query) or 1.0)
+
+    relevance = lambda_mult * (candidates @ query)
+    similarity = (1 - lambda_mult) * (candidates @ candidates.T)
+    redundancy = np.full(len(candidates), -np.inf, dtype=np.float32)
+    available = np.ones(len(candidates), dtype=bool)
+
+    selected = []
+    for _ in range(min(k, len(candidates))):
+        # No redundancy penalty before the first pick
+        scores = relevance - redundancy if selected else relevance.copy()
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return selected
@@ -0,0 +1,87 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from .utils.logger import rag_logger
+
+class RetrievalOverloadedError(Exception):
+    """Raised when the retrieval queue is full"""
+
+class RetrievalExecutor:
+    """
+    Dedicated, size-bounded thread pool for blocking retrieval work
+
+    Embedding and vector search run here instead of on the event loop, so
+    other requests keep being served while a query is encoded. At most
+    `max_concurrency` calls run at once; callers beyond that wait on a
+    semaphore, and once `max_queue` callers are already waiting new calls are
+    rejected with RetrievalOverloadedError rather than piling up.
+    """
+
+    def __init__(self, workers: int = 4, max_concurrency: Optional[int] = None, max_queue: int = 64):
+        self.logger = rag_logger.getChild("RetrievalExecutor")
+        self.workers = workers
+        self.max_concurrency = max_concurrency or workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="retrieval")
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        # Queue-depth and latency metrics
+        self.in_flight = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    @property
+    def saturated(self) -> bool:
+        """True when every slot is busy and callers are queueing"""
+        return self.waiting > 0
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run a blocking function in the pool, respecting the concurrency cap"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise RetrievalOverloadedError(f"Retrieval queue full ({self.waiting} waiting)")
+
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        queued = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        started = time.perf_counter()
+        self.total_wait_seconds += started - queued
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_run_seconds += time.perf_counter() - started
+            self._semaphore.release()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 3) if self.completed else 0.0,
+            "avg_run_ms": round(self.total_run_seconds / self.completed * 1000, 3) if self.completed else 0.0
+        }
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -6,13 +6,15 @@ from threading import Lock
 from .utils.logger import session_logger
 from .config import settings
 from .therapist import GeminiTherapist
+from .rag_system import TherapyRAG
 from .db import create_session_row, delete_session as db_delete_session, increment_message_count as db_increment_message_count, update_session_activity, get_messages
 
 class SessionManager:
     """Manages therapy sessions and conversation state"""
 
-    def __init__(self):
+    def __init__(self, rag_system: Optional[TherapyRAG] = None):
         self.logger = session_logger.getChild("SessionManager")
+        self.rag_system = rag_system
         self.sessions: Dict[str, GeminiTherapist] = {}
         self.session_metadata: Dict[str, Dict[str, Any]] = {}
         self._lock = Lock()
@@ -30,6 +32,7 @@ class SessionManager:
                 # Initialize therapist instance (pass session_id for persistence)
                 self.sessions[session_id] = GeminiTherapist(
                     gemini_api_key=settings.GEMINI_API_KEY,
+                    rag_system=self.rag_system,
                     session_id=session_id
                 )
                 
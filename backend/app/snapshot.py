@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import shutil
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from .config import settings
+from .utils.logger import rag_logger
+
+logger = rag_logger.getChild("snapshot")
+
+FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+# Columnar files of a snapshot bundle, one row per document in the same order
+IDS_FILE = "ids.txt"                    # newline-separated document ids
+TEXTS_FILE = "texts.bin"                # concatenated UTF-8 texts
+TEXT_OFFSETS_FILE = "text_offsets.u64"  # count + 1 little-endian byte offsets into texts.bin
+METADATAS_FILE = "metadatas.jsonl"      # one JSON object per line
+EMBEDDINGS_FILE = "embeddings.f32"      # count x dim little-endian float32 matrix
+INDEX_MANIFEST_FILE = "index_manifest.json"
+DATA_FILES = (IDS_FILE, TEXTS_FILE, TEXT_OFFSETS_FILE, METADATAS_FILE, EMBEDDINGS_FILE, INDEX_MANIFEST_FILE)
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def export_snapshot(rag: Any, path: str, batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Write the indexed collection of `rag` to a snapshot bundle directory
+
+    The bundle holds ids, texts, metadata and float32 embeddings as columnar
+    files plus the index manifest checkpoints, described by manifest.json
+    with per-file SHA-256 checksums. It is written to a temporary directory
+    and renamed into place, so `path` never holds a partial bundle.
+    """
+    if os.path.exists(path):
+        raise ValueError(f"Snapshot path already exists: {path}")
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    store = rag.vector_store
+    count, dim, offset = 0, None, 0
+    sources: Counter = Counter()
+    with open(os.path.join(tmp_path, IDS_FILE), "w", encoding="utf-8") as ids_file, \
+            open(os.path.join(tmp_path, TEXTS_FILE), "wb") as texts_file, \
+            open(os.path.join(tmp_path, TEXT_OFFSETS_FILE), "wb") as offsets_file, \
+            open(os.path.join(tmp_path, METADATAS_FILE), "w", encoding="utf-8") as metadatas_file, \
+            open(os.path.join(tmp_path, EMBEDDINGS_FILE), "wb") as embeddings_file:
+        offsets_file.write(np.asarray([0], dtype="<u8").tobytes())
+        for ids, _, _ in store.iter_documents(batch_size):
+            documents = store.get(ids, include_embeddings=True)
+            if len(documents) != len(ids):
+                raise RuntimeError("Collection changed during export")
+            embeddings = np.stack([doc["embedding"] for doc in documents]).astype("<f4")
+            dim = dim or embeddings.shape[1]
+
+            encoded = [doc["text"].encode("utf-8") for doc in documents]
+            ends = offset + np.cumsum([len(text) for text in encoded], dtype=np.uint64)
+            offset = int(ends[-1])
+
+            ids_file.writelines(f"{doc['id']}\n" for doc in documents)
+            texts_file.write(b"".join(encoded))
+            offsets_file.write(ends.astype("<u8").tobytes())
+            metadatas_file.writelines(json.dumps(doc["metadata"]) + "\n" for doc in documents)
+            embeddings_file.write(embeddings.tobytes())
+            sources.update((doc["metadata"] or {}).get("source") for doc in documents)
+            count += len(documents)
+
+    with open(os.path.join(tmp_path, INDEX_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(rag.manifest.to_dict(), f, indent=2)
+
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "created_at": datetime.now().isoformat(),
+        "collection_name": rag.collection_name,
+        "embedding_model": settings.EMBEDDING_MODEL,
+        "count": count,
+        "dim": dim,
+        "sources": dict(sources),
+        "files": {
+            name: {
+                "bytes": os.path.getsize(os.path.join(tmp_path, name)),
+                "sha256": _sha256(os.path.join(tmp_path, name))
+            }
+            for name in DATA_FILES
+        }
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    logger.info(f"Exported {count} documents to {path}")
+    return manifest
+
+def verify_snapshot(path: str) -> Dict[str, Any]:
+    """Load a bundle's manifest, checking its format, file sizes and checksums"""
+    with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format: {manifest.get('format_version')}")
+    for name, expected in manifest["files"].items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) != expected["bytes"]:
+            raise ValueError(f"Snapshot file {name} is missing or truncated")
+        if _sha256(file_path) != expected["sha256"]:
+            raise ValueError(f"Snapshot file {name} failed its checksum")
+    return manifest
+
+def _iter_bundle(path: str, manifest: Dict[str, Any], batch_size: int) -> Iterator[Tuple[List[str], List[str], np.ndarray, List[Dict[str, Any]]]]:
+    """Yield (ids, texts, embeddings, metadatas) batches from a verified bundle"""
+    count, dim = manifest["count"], manifest["dim"]
+    if not count:
+        return
+    offsets = np.fromfile(os.path.join(path, TEXT_OFFSETS_FILE), dtype="<u8")
+    texts = np.memmap(os.path.join(path, TEXTS_FILE), dtype=np.uint8, mode="r")
+    embeddings = np.memmap(os.path.join(path, EMBEDDINGS_FILE), dtype="<f4", mode="r", shape=(count, dim))
+    with open(os.path.join(path, IDS_FILE), "r", encoding="utf-8") as ids_file, \
+            open(os.path.join(path, METADATAS_FILE), "r", encoding="utf-8") as metadatas_file:
+        for start in range(0, count, batch_size):
+            end = min(start + batch_size, count)
+            ids = [ids_file.readline().rstrip("\n") for _ in range(start, end)]
+            metadatas = [json.loads(metadatas_file.readline()) for _ in range(start, end)]
+            batch_texts = [
+                texts[offsets[i]:offsets[i + 1]].tobytes().decode("utf-8") for i in range(start, end)
+            ]
+            yield ids, batch_texts, np.asarray(embeddings[start:end], dtype=np.float32), metadatas
+
+def import_snapshot(rag: Any, path: str, batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Bulk-load a snapshot bundle into the empty collection of `rag`
+
+    Embeddings are inserted as stored, so no model is loaded and nothing is
+    downloaded. The lexical index and index manifest are rebuilt from the
+    bundle, so a later load_and_index_datasets skips the imported datasets.
+    """
+    manifest = verify_snapshot(path)
+    if manifest["embedding_model"] != settings.EMBEDDING_MODEL:
+        raise ValueError(
+            f"Snapshot was embedded with {manifest['embedding_model']}, "
+            f"but EMBEDDING_MODEL is {settings.EMBEDDING_MODEL}"
+        )
+    if rag.vector_store.count():
+        raise ValueError("Snapshots can only be imported into an empty collection")
+
+    imported = 0
+    for ids, texts, embeddings, metadatas in _iter_bundle(path, manifest, batch_size):
+        rag.vector_store.add(ids=ids, documents=texts, embeddings=embeddings, metadatas=metadatas)
+        rag.lexical_index.add(ids, texts, [metadata.get("source") for metadata in metadatas])
+        imported += len(ids)
+        logger.info(f"Imported {imported}/{manifest['count']} documents")
+
+    with open(os.path.join(path, INDEX_MANIFEST_FILE), "r", encoding="utf-8") as f:
+        rag.manifest.restore(json.load(f))
+    rag.index_generation += 1
+    return manifest
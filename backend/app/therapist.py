@@ -8,6 +8,9 @@ from .utils.logger import therapist_logger
 from .config import settings
 from .rag_system import TherapyRAG
 from .db import add_message
+from .prompt_packer import PackedPrompt, PromptPacker, load_token_counter
+
+CLOSING_INSTRUCTION = "Respond as a compassionate therapist while following all guidelines above."
 
 class GeminiTherapist:
     """AI Therapist using Gemini API with RAG support"""
@@ -41,9 +44,12 @@ class GeminiTherapist:
         
         # Start chat
         self.chat_session = self.model.start_chat(history=[])
+        self.prompt_packer = PromptPacker(
+            settings.PROMPT_TOKEN_BUDGET, load_token_counter(settings.PROMPT_TOKENIZER)
+        )
 
-    def _build_system_prompt(self, context: str = "") -> str:
-        """Build system prompt with RAG context"""
+    def _build_system_prompt(self) -> str:
+        """Build the base system prompt"""
         base_prompt = """You are a compassionate and empathetic AI therapist who speaks in a warm, natural, and conversational tone. 
             Your goal is to make the user feel heard, supported, and understood — not analyzed or lectured.
 
@@ -72,17 +78,22 @@ class GeminiTherapist:
             Reference Example Style:
             > “That sounds really rough. It makes sense you’d feel that way after trying so hard. Want to tell me a bit more about what’s been going on? We can take it one step at a time.”
         """
-
-        if context:
-            base_prompt += f"\n{context}"
-        
-        if self.conversation_history:
-            base_prompt += f"\n\nConversation History:\n{self._format_conversation_history()}"
-            
-        base_prompt += "\n\nRespond as a compassionate therapist while following all guidelines above."
-        
         return base_prompt
 
+    def _build_prompt(self, user_message: str, examples: List[str]) -> PackedPrompt:
+        """Pack the system prompt, recent turns and retrieved examples into the token budget"""
+        history = [
+            f"{'User' if msg['role'] == 'user' else 'Therapist'}: {msg['content']}"
+            for msg in self.conversation_history[-settings.MAX_CONVERSATION_HISTORY:]
+        ]
+        return self.prompt_packer.pack(
+            self._build_system_prompt(),
+            user_message,
+            history,
+            [f"Example {i}:\n{text}" for i, text in enumerate(examples, 1)],
+            instruction=CLOSING_INSTRUCTION
+        )
+
     def _format_conversation_history(self) -> str:
         """Format conversation history for context"""
         if not self.conversation_history:
@@ -99,26 +110,25 @@ class GeminiTherapist:
         self,
         user_message: str,
         use_rag: bool = True,
-        n_examples: int = 3
+        n_examples: int = 3,
+        sources: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """Generate a response to user message"""
         try:
             # Get RAG context if enabled
-            context = ""
-            sources_used = []
+            retrieved = []
             if use_rag and self.rag_system:
-                retrieved = await self.rag_system.retrieve(user_message, n_examples)
-                if retrieved:
-                    context_parts = []
-                    for i, result in enumerate(retrieved, 1):
-                        context_parts.append(f"Example {i}:\n{result['text']}")
-                        sources_used.append(result['metadata']['source'])
-                    context = "\n\n".join(context_parts)
-
-            # Build the complete message with context and guidelines
-            system_prompt = self._build_system_prompt(context)
-            complete_message = f"{system_prompt}\n\nUser: {user_message}"
-            
+                retrieved = await self.rag_system.retrieve(user_message, n_examples, sources=sources) or []
+
+            # Build the complete message within the prompt token budget
+            prompt = self._build_prompt(user_message, [result['text'] for result in retrieved])
+            sources_used = [retrieved[i]['metadata']['source'] for i in prompt.context_used]
+            self.logger.info(
+                f"Prompt tokens: {prompt.tokens}/{self.prompt_packer.budget_tokens} "
+                f"(history {prompt.history_used}, dropped {prompt.history_dropped}; "
+                f"examples {len(prompt.context_used)}, dropped {prompt.context_dropped})"
+            )
+
             # Add user message to history
             user_ts = datetime.utcnow().isoformat()
             self.conversation_history.append({
@@ -139,7 +149,9 @@ class GeminiTherapist:
             response = None
             while True:
                 try:
-                    response = self.chat_session.send_message(complete_message)
+                    # The packed prompt already carries the history, so it is sent
+                    # statelessly rather than appended to the chat session's turns
+                    response = self.model.generate_content(prompt.text)
                     break
                 except Exception as e:
                     msg = str(e)
@@ -201,6 +213,7 @@ class GeminiTherapist:
             return {
                 "response": response.text,
                 "sources_used": sources_used if sources_used else None,
+                "prompt_tokens": prompt.tokens,
                 "timestamp": datetime.now()
             }
 
@@ -0,0 +1,24 @@
+import sys
+from typing import Optional
+
+def peak_rss_mb() -> Optional[float]:
+    """
+    Return the peak resident set size (max RSS) of the current process in MB
+
+    Uses `resource.getrusage` where available and falls back to psutil's
+    peak working set on Windows. Returns None if neither is available.
+    """
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+        except Exception:
+            return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        return max_rss / (1024 * 1024)
+    return max_rss / 1024
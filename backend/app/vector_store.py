@@ -0,0 +1,835 @@
+import json
+import os
+import sqlite3
+import shutil
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .utils.logger import rag_logger
+
+class VectorStore(ABC):
+    """
+    Storage and similarity search for embedded documents
+
+    Query results are lists of dicts with "id", "text", "metadata" and
+    "distance" (cosine distance, lower is closer), matching what
+    TherapyRAG.retrieve returns. With `include_embeddings`, results also
+    carry the stored "embedding". With `sources`, only documents whose
+    metadata "source" is in the list are searched.
+    """
+
+    backend: str = ""
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        embeddings: np.ndarray,
+        metadatas: List[Dict[str, Any]]
+    ) -> None:
+        """Store a batch of documents with their embeddings"""
+
+    @abstractmethod
+    def query(
+        self,
+        embedding: np.ndarray,
+        n_results: int,
+        include_embeddings: bool = False,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Return the `n_results` documents closest to `embedding`"""
+
+    @abstractmethod
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        """Return the subset of `ids` that are already stored"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Number of stored documents"""
+
+    @abstractmethod
+    def peek(self, n: int) -> Dict[str, List[Any]]:
+        """Small sample of stored documents as {"ids", "documents", "metadatas"}"""
+
+    @abstractmethod
+    def get(self, ids: List[str], include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        """Fetch stored documents as {"id", "text", "metadata"} in the order of `ids`"""
+
+    @abstractmethod
+    def iter_documents(
+        self,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        """Yield (ids, documents, metadatas) for every stored document in batches"""
+
+    @abstractmethod
+    def iter_metadatas(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Dict[str, Any]]]]:
+        """Yield (ids, metadatas) for every stored document in batches"""
+
+    @abstractmethod
+    def replace_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        """Overwrite the metadata of stored documents; keys not given are removed"""
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore backed by a ChromaDB collection (HNSW index in SQLite)"""
+
+    backend = "chroma"
+
+    def __init__(
+        self,
+        client: Any,
+        name: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        hnsw: Optional[Dict[str, int]] = None,
+        search_ef: Optional[int] = None,
+        read_only: bool = False
+    ):
+        """
+        `hnsw` holds M, construction_ef and search_ef, which only take effect
+        when the collection is created. `search_ef` is applied to an existing
+        collection as well, since it can change without rebuilding the graph.
+
+        A `read_only` store never creates or modifies the collection: it
+        reads whatever configuration the writer persisted, and a collection
+        that does not exist yet reads as empty.
+        """
+        self.logger = rag_logger.getChild("ChromaVectorStore")
+        self.client = client
+        self.name = name
+        self.read_only = read_only
+        if read_only:
+            try:
+                self.collection = client.get_collection(name)
+            except Exception:
+                # NotFoundError (ValueError on older chromadb): nothing indexed yet
+                self.collection = None
+            return
+        self.collection = client.get_or_create_collection(
+            name=name,
+            metadata=metadata or {
+                "hnsw:space": "cosine",
+                **{f"hnsw:{key}": value for key, value in (hnsw or {}).items()}
+            }
+        )
+        if search_ef and self.hnsw_config().get("ef_search") != search_ef:
+            self.set_search_ef(search_ef)
+
+    def hnsw_config(self) -> Dict[str, Any]:
+        """The collection's current HNSW configuration"""
+        configuration = getattr(self.collection, "configuration", None)
+        # Older chromadb versions expose no configuration dict
+        if not isinstance(configuration, dict):
+            return {}
+        return dict(configuration.get("hnsw") or {})
+
+    def set_search_ef(self, search_ef: int) -> None:
+        """
+        Persist a new query-time candidate list size for the existing index
+
+        Chroma applies it when the index is next loaded, i.e. by a new
+        client; see TherapyRAG.set_search_ef.
+        """
+        self._check_writable()
+        self.collection.modify(configuration={"hnsw": {"ef_search": search_ef}})
+        self.logger.info(f"Set search ef of {self.name} to {search_ef}")
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise RuntimeError(f"Collection {self.name} is open read-only")
+
+    def add(self, ids, documents, embeddings, metadatas) -> None:
+        self._check_writable()
+        self.collection.add(
+            documents=documents,
+            embeddings=np.asarray(embeddings).tolist(),
+            ids=ids,
+            metadatas=metadatas
+        )
+
+    def query(
+        self,
+        embedding: np.ndarray,
+        n_results: int,
+        include_embeddings: bool = False,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        if self.collection is None:
+            return []
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        results = self.collection.query(
+            query_embeddings=[np.asarray(embedding).tolist()],
+            n_results=n_results,
+            where={"source": {"$in": list(sources)}} if sources else None,
+            include=include
+        )
+
+        formatted_results = []
+        for i in range(len(results["documents"][0])):
+            formatted_results.append({
+                "id": results["ids"][0][i] if results.get("ids") else None,
+                "text": results["documents"][0][i],
+                "metadata": results["metadatas"][0][i],
+                "distance": results["distances"][0][i]
+            })
+            if include_embeddings:
+                formatted_results[-1]["embedding"] = np.asarray(results["embeddings"][0][i], dtype=np.float32)
+        return formatted_results
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        if not ids or self.collection is None:
+            return set()
+        return set(self.collection.get(ids=ids, include=[])["ids"])
+
+    def count(self) -> int:
+        return self.collection.count() if self.collection is not None else 0
+
+    def peek(self, n: int) -> Dict[str, List[Any]]:
+        if self.collection is None:
+            return {"ids": [], "documents": [], "metadatas": []}
+        try:
+            sample = self.collection.peek(n, include=["documents", "metadatas"])
+        except TypeError:
+            # some chromadb versions may not accept include for peek
+            sample = self.collection.peek(n)
+        return {key: sample.get(key) for key in ("ids", "documents", "metadatas")}
+
+    def get(self, ids: List[str], include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        if not ids or self.collection is None:
+            return []
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        fetched = self.collection.get(ids=ids, include=include)
+        by_id = {}
+        for i, doc_id in enumerate(fetched["ids"]):
+            by_id[doc_id] = {"id": doc_id, "text": fetched["documents"][i], "metadata": fetched["metadatas"][i]}
+            if include_embeddings:
+                by_id[doc_id]["embedding"] = np.asarray(fetched["embeddings"][i], dtype=np.float32)
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def _iter_batches(self, batch_size: int, include: List[str]) -> Iterator[Dict[str, Any]]:
+        offset = 0
+        while self.collection is not None:
+            batch = self.collection.get(limit=batch_size, offset=offset, include=include)
+            if not batch["ids"]:
+                return
+            yield batch
+            offset += len(batch["ids"])
+
+    def iter_documents(
+        self,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        for batch in self._iter_batches(batch_size, ["documents", "metadatas"]):
+            yield batch["ids"], batch["documents"], batch["metadatas"]
+
+    def iter_metadatas(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Dict[str, Any]]]]:
+        for batch in self._iter_batches(batch_size, ["metadatas"]):
+            yield batch["ids"], batch["metadatas"]
+
+    def replace_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        self._check_writable()
+        # Chroma merges metadata on update; dropped keys have to be set to None
+        current = self.collection.get(ids=ids, include=["metadatas"])
+        existing = dict(zip(current["ids"], current["metadatas"]))
+        updates = []
+        for doc_id, metadata in zip(ids, metadatas):
+            removed = {key: None for key in (existing.get(doc_id) or {}) if key not in metadata}
+            updates.append({**removed, **metadata})
+        self.collection.update(ids=ids, metadatas=updates)
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process brute-force vector index over a memory-mapped matrix
+
+    Layout under `path`:
+      - embeddings.f32 / .f16 / .i8: append-only row-major matrix of
+        L2-normalized embeddings in the storage dtype, memory-mapped for search
+      - embeddings.f32 alongside a quantized matrix when full-precision
+        rescoring is enabled
+      - store.json: dimension, storage dtype and int8 scales
+      - documents.sqlite3: side table mapping matrix row -> id, text, metadata
+
+    Queries are a matrix-vector product (in fixed-size chunks for quantized
+    matrices) followed by an argpartition top-k, so there is no per-query
+    graph traversal or SQLite scan beyond fetching the k winning rows.
+
+    float16 halves and int8 quarters the matrix size on disk. int8 uses
+    symmetric per-dimension scales calibrated on the first batch written;
+    later values outside that range are clipped. numpy has no fast float16
+    product (decoding a chunk costs ~10x the float32 product itself), so a
+    float16 store scores against a float32 working set decoded once and
+    extended as rows are appended: it saves disk and page cache, not
+    resident memory. With `rescore`, the best
+    `n_results * rescore_factor` candidates from the quantized matrix are
+    re-ranked against the float32 copy, which is only paged in for those rows.
+    The storage dtype is fixed when the store is created.
+    """
+
+    backend = "numpy"
+    EMBEDDINGS_FILES = {"float32": "embeddings.f32", "float16": "embeddings.f16", "int8": "embeddings.i8"}
+    # Rows converted to float32 at a time when scoring a quantized matrix
+    SCORE_CHUNK_ROWS = 4096
+
+    def __init__(self, path: str, dtype: str = "float32", rescore: bool = False, rescore_factor: int = 4):
+        self.logger = rag_logger.getChild("NumpyVectorStore")
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._lock = threading.Lock()
+        self._meta_path = os.path.join(path, "store.json")
+        self._meta: Dict[str, Any] = {"dim": None, "dtype": dtype, "scales": None, "full_precision": False}
+        if os.path.exists(self._meta_path):
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                self._meta.update(json.load(f))
+            if self._meta["dtype"] != dtype:
+                self.logger.warning(
+                    f"Store at {path} was created as {self._meta['dtype']}; ignoring requested dtype {dtype}"
+                )
+        else:
+            if dtype not in self.EMBEDDINGS_FILES:
+                raise ValueError(f"Unsupported vector store dtype: {dtype}")
+            self._meta["full_precision"] = rescore and dtype != "float32"
+
+        self.dtype = self._meta["dtype"]
+        self.rescore = rescore and self._meta["full_precision"]
+        if rescore and not self.rescore and self.dtype != "float32":
+            self.logger.warning(f"Store at {path} has no full-precision copy; rescoring disabled")
+        self.rescore_factor = max(1, rescore_factor)
+        self._embeddings_path = os.path.join(path, self.EMBEDDINGS_FILES[self.dtype])
+        self._full_path = os.path.join(path, self.EMBEDDINGS_FILES["float32"]) if self._meta["full_precision"] else None
+
+        self._conn = sqlite3.connect(os.path.join(path, "documents.sqlite3"), check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE,
+                text TEXT,
+                metadata TEXT
+            )
+            """
+        )
+        self._conn.commit()
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        self._truncate_orphaned_rows()
+        # (matrix, full-precision matrix or None), replaced as a pair so readers
+        # holding one snapshot never see it change under them
+        self._matrices: Optional[Tuple[np.ndarray, Optional[np.ndarray]]] = None
+        self._source_masks: Dict[Tuple[str, ...], np.ndarray] = {}
+        # float32 decode of a float16 matrix's first rows, replaced (never mutated) as it grows
+        self._working_set: Optional[np.ndarray] = None
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._meta["dim"]
+
+    def _files(self) -> List[Tuple[str, str]]:
+        files = [(self._embeddings_path, self.dtype)]
+        if self._full_path:
+            files.append((self._full_path, "float32"))
+        return files
+
+    def _truncate_orphaned_rows(self) -> None:
+        """Drop embedding rows written before a crash but never committed to the side table"""
+        if self.dim is None:
+            return
+        for path, dtype in self._files():
+            if not os.path.exists(path):
+                continue
+            expected = self._rows * self.dim * np.dtype(dtype).itemsize
+            if os.path.getsize(path) > expected:
+                self.logger.warning(f"Truncating uncommitted embedding rows in {path}")
+                with open(path, "r+b") as f:
+                    f.truncate(expected)
+
+    def _save_meta(self) -> None:
+        tmp_path = f"{self._meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._meta, f)
+        os.replace(tmp_path, self._meta_path)
+
+    def _quantize(self, vectors: np.ndarray) -> np.ndarray:
+        """Convert normalized float32 vectors to the storage dtype"""
+        if self.dtype == "int8":
+            scales = np.asarray(self._meta["scales"], dtype=np.float32)
+            return np.clip(np.rint(vectors / scales), -127, 127).astype(np.int8)
+        return vectors.astype(self.dtype)
+
+    def add(self, ids, documents, embeddings, metadatas) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim == 1:
+            vectors = vectors[None, :]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+
+        with self._lock:
+            if self.dim is None:
+                self._meta["dim"] = int(vectors.shape[1])
+                if self.dtype == "int8":
+                    # Symmetric per-dimension scales calibrated on the first batch
+                    max_abs = np.abs(vectors).max(axis=0)
+                    self._meta["scales"] = (np.where(max_abs == 0, 1.0, max_abs) / 127).tolist()
+                self._save_meta()
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {self.dim}")
+
+            # Like Chroma, ids already stored (or repeated in this batch) are ignored
+            placeholders = ",".join("?" * len(ids))
+            seen = {
+                row[0] for row in self._conn.execute(f"SELECT id FROM documents WHERE id IN ({placeholders})", list(ids))
+            } if ids else set()
+            keep = []
+            for i, doc_id in enumerate(ids):
+                if doc_id not in seen:
+                    seen.add(doc_id)
+                    keep.append(i)
+            if not keep:
+                return
+            if len(keep) < len(ids):
+                ids, documents, metadatas = [ids[i] for i in keep], [documents[i] for i in keep], [metadatas[i] for i in keep]
+                vectors = vectors[keep]
+
+            # Embeddings first: rows past the committed count are truncated on reopen
+            with open(self._embeddings_path, "ab") as f:
+                f.write(self._quantize(vectors).tobytes())
+            if self._full_path:
+                with open(self._full_path, "ab") as f:
+                    f.write(vectors.tobytes())
+            rows = range(self._rows, self._rows + len(ids))
+            try:
+                self._conn.executemany(
+                    "INSERT INTO documents (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                    [
+                        (row, doc_id, text, json.dumps(metadata))
+                        for row, doc_id, text, metadata in zip(rows, ids, documents, metadatas)
+                    ]
+                )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                self._truncate_orphaned_rows()
+                raise
+            self._rows += len(ids)
+            self._matrices = None
+            self._source_masks.clear()
+
+    def _load_matrix(self) -> Optional[Tuple[np.ndarray, Optional[np.ndarray]]]:
+        """Snapshot of the (matrix, full-precision matrix) memory maps, or None when empty"""
+        with self._lock:
+            if self._matrices is None and self._rows and self.dim:
+                full_matrix = None
+                if self._full_path:
+                    full_matrix = np.memmap(self._full_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+                self._matrices = (
+                    np.memmap(self._embeddings_path, dtype=self.dtype, mode="r", shape=(self._rows, self.dim)),
+                    full_matrix
+                )
+            return self._matrices
+
+    def _scores(self, matrix: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Approximate cosine similarity of every stored row to a normalized query"""
+        if self.dtype == "float32":
+            return matrix @ query
+        if self.dtype == "float16":
+            return self._float16_working_set(matrix)[:len(matrix)] @ query
+        if self.dtype == "int8":
+            # (q * s) . x_int8 == q . (s * x_int8)
+            query = query * np.asarray(self._meta["scales"], dtype=np.float32)
+        scores = np.empty(len(matrix), dtype=np.float32)
+        for start in range(0, len(matrix), self.SCORE_CHUNK_ROWS):
+            chunk = matrix[start:start + self.SCORE_CHUNK_ROWS]
+            scores[start:start + len(chunk)] = chunk.astype(np.float32) @ query
+        return scores
+
+    def _float16_working_set(self, matrix: np.ndarray) -> np.ndarray:
+        """float32 copy of at least the rows of `matrix`, decoding only rows appended since the last call"""
+        working = self._working_set
+        if working is None or len(working) < len(matrix):
+            done = 0 if working is None else len(working)
+            decoded = np.empty((len(matrix), matrix.shape[1]), dtype=np.float32)
+            if done:
+                decoded[:done] = working
+            for start in range(done, len(matrix), self.SCORE_CHUNK_ROWS):
+                decoded[start:start + self.SCORE_CHUNK_ROWS] = matrix[start:start + self.SCORE_CHUNK_ROWS]
+            # Concurrent queries may both decode; either result is complete
+            working = self._working_set = decoded
+        return working
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _embeddings(self, matrices: Tuple[np.ndarray, Optional[np.ndarray]], rows: List[int]) -> np.ndarray:
+        """Stored embeddings for matrix rows, in float32 (dequantized if needed)"""
+        matrix, full_matrix = matrices
+        if full_matrix is not None:
+            return np.asarray(full_matrix[rows])
+        vectors = matrix[rows].astype(np.float32)
+        if self.dtype == "int8":
+            vectors *= np.asarray(self._meta["scales"], dtype=np.float32)
+        return vectors
+
+    def _source_mask(self, sources: List[str], rows: int) -> np.ndarray:
+        """Boolean mask of matrix rows whose source is in `sources` (cached until the next add)"""
+        key = tuple(sorted(set(sources)))
+        with self._lock:
+            mask = self._source_masks.get(key)
+            if mask is None or len(mask) != rows:
+                placeholders = ",".join("?" * len(key))
+                mask = np.zeros(rows, dtype=bool)
+                matched = [
+                    row for (row,) in self._conn.execute(
+                        f"SELECT row FROM documents WHERE json_extract(metadata, '$.source') IN ({placeholders})",
+                        key
+                    )
+                    if row < rows
+                ]
+                mask[matched] = True
+                self._source_masks[key] = mask
+            return mask
+
+    def query(
+        self,
+        embedding: np.ndarray,
+        n_results: int,
+        include_embeddings: bool = False,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        matrices = self._load_matrix()
+        if matrices is None or n_results <= 0:
+            return []
+        matrix, full_matrix = matrices
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+
+        scores = self._scores(matrix, query)
+        if sources:
+            mask = self._source_mask(sources, len(matrix))
+            n_results = min(n_results, int(mask.sum()))
+            if n_results <= 0:
+                return []
+            scores[~mask] = -np.inf
+        if self.rescore and full_matrix is not None:
+            candidates = self._top_k(scores, n_results * self.rescore_factor)
+            candidates = candidates[np.isfinite(scores[candidates])]
+            candidates.sort()  # sequential reads from the memory map
+            exact = full_matrix[candidates] @ query
+            order = self._top_k(exact, n_results)
+            rows, top_scores = candidates[order], exact[order]
+        else:
+            rows = self._top_k(scores, n_results)
+            top_scores = scores[rows]
+        return self._fetch_rows(rows.tolist(), top_scores.tolist(), matrices if include_embeddings else None)
+
+    def close(self) -> None:
+        with self._lock:
+            self._matrices = None
+            self._working_set = None
+            self._conn.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        matrix_bytes = self._rows * (self.dim or 0) * np.dtype(self.dtype).itemsize
+        return {
+            "dtype": self.dtype,
+            "rescore": self.rescore,
+            "rows": self._rows,
+            "matrix_mb": round(matrix_bytes / (1024 * 1024), 2),
+            "working_set_mb": round(self._working_set.nbytes / (1024 * 1024), 2) if self._working_set is not None else 0.0
+        }
+
+    def _fetch_rows(
+        self,
+        rows: List[int],
+        scores: List[float],
+        matrices: Optional[Tuple[np.ndarray, Optional[np.ndarray]]] = None
+    ) -> List[Dict[str, Any]]:
+        """Documents for matrix rows, with embeddings read from `matrices` when given"""
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        with self._lock:
+            fetched = {
+                row: (doc_id, text, metadata)
+                for row, doc_id, text, metadata in self._conn.execute(
+                    f"SELECT row, id, text, metadata FROM documents WHERE row IN ({placeholders})",
+                    rows
+                )
+            }
+        results = [
+            {
+                "id": fetched[row][0],
+                "text": fetched[row][1],
+                "metadata": json.loads(fetched[row][2]),
+                "distance": 1.0 - float(score)
+            }
+            for row, score in zip(rows, scores)
+            if row in fetched
+        ]
+        if matrices is not None:
+            kept = [row for row in rows if row in fetched]
+            for result, vector in zip(results, self._embeddings(matrices, kept)):
+                result["embedding"] = vector
+        return results
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        if not ids:
+            return set()
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            return {
+                row[0] for row in self._conn.execute(
+                    f"SELECT id FROM documents WHERE id IN ({placeholders})", ids
+                )
+            }
+
+    def count(self) -> int:
+        return self._rows
+
+    def peek(self, n: int) -> Dict[str, List[Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, text, metadata FROM documents ORDER BY row LIMIT ?", (n,)
+            ).fetchall()
+        return {
+            "ids": [r[0] for r in rows],
+            "documents": [r[1] for r in rows],
+            "metadatas": [json.loads(r[2]) for r in rows]
+        }
+
+    def get(self, ids: List[str], include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            fetched = self._conn.execute(
+                f"SELECT row, id, text, metadata FROM documents WHERE id IN ({placeholders})", ids
+            ).fetchall()
+        by_id = {
+            doc_id: {"id": doc_id, "text": text, "metadata": json.loads(metadata)}
+            for _, doc_id, text, metadata in fetched
+        }
+        # Snapshot after the lookup: every row it returned is already in the matrix
+        matrices = self._load_matrix() if include_embeddings and fetched else None
+        if matrices is not None:
+            for (_, doc_id, _, _), vector in zip(fetched, self._embeddings(matrices, [r[0] for r in fetched])):
+                by_id[doc_id]["embedding"] = vector
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def _iter_rows(self, columns: str, batch_size: int) -> Iterator[List[Tuple[Any, ...]]]:
+        last_row = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT row, id, {columns} FROM documents WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_row = rows[-1][0]
+
+    def iter_documents(
+        self,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        for rows in self._iter_rows("text, metadata", batch_size):
+            yield [r[1] for r in rows], [r[2] for r in rows], [json.loads(r[3]) for r in rows]
+
+    def iter_metadatas(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Dict[str, Any]]]]:
+        for rows in self._iter_rows("metadata", batch_size):
+            yield [r[1] for r in rows], [json.loads(r[2]) for r in rows]
+
+    def replace_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE documents SET metadata = ? WHERE id = ?",
+                [(json.dumps(metadata), doc_id) for doc_id, metadata in zip(ids, metadatas)]
+            )
+            self._conn.commit()
+
+class PartitionedVectorStore(VectorStore):
+    """
+    VectorStore split into one child store per partition of sources
+
+    `routes` maps a document's metadata "source" to its partition; sources
+    without a route go to `default_partition`. Writes are split by
+    partition, and a query is sent only to the partitions holding the
+    requested sources (all partitions when none are given). Those partitions
+    are searched in parallel and merged by distance. Each partition is a
+    separate, smaller index (its own Chroma collection or numpy directory)
+    that can be dropped and rebuilt on its own.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[str], VectorStore],
+        routes: Dict[str, str],
+        default_partition: str = "default"
+    ):
+        self.logger = rag_logger.getChild("PartitionedVectorStore")
+        self._factory = factory
+        self.routes = dict(routes)
+        self.default_partition = default_partition
+        names = sorted(set(self.routes.values()) | {default_partition})
+        self.partitions: Dict[str, VectorStore] = {name: factory(name) for name in names}
+        self.backend = self.partitions[default_partition].backend
+        self._executor = ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="partition")
+
+    def partition_of(self, source: str) -> str:
+        return self.routes.get(source, self.default_partition)
+
+    def route(self, sources: Optional[List[str]] = None) -> List[str]:
+        """Partitions that can hold documents from `sources`"""
+        if not sources:
+            return list(self.partitions)
+        return sorted({self.partition_of(source) for source in sources})
+
+    def _needs_filter(self, partition: str, sources: Optional[List[str]]) -> bool:
+        """Whether a partition also holds sources that were not requested"""
+        if not sources:
+            return False
+        if partition == self.default_partition:
+            return True
+        held = {source for source, name in self.routes.items() if name == partition}
+        return not held <= set(sources)
+
+    def add(self, ids, documents, embeddings, metadatas) -> None:
+        embeddings = np.asarray(embeddings)
+        groups: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            groups.setdefault(self.partition_of(metadata.get("source", "")), []).append(i)
+        for partition, indices in groups.items():
+            self.partitions[partition].add(
+                [ids[i] for i in indices],
+                [documents[i] for i in indices],
+                embeddings[indices],
+                [metadatas[i] for i in indices]
+            )
+
+    def query(
+        self,
+        embedding: np.ndarray,
+        n_results: int,
+        include_embeddings: bool = False,
+        sources: Optional[List[str]] = None
+    ) -> List[Dict[str, Any]]:
+        targets = [name for name in self.route(sources) if self.partitions[name].count() > 0]
+        if not targets:
+            return []
+        futures = [
+            self._executor.submit(
+                self.partitions[name].query,
+                embedding,
+                n_results,
+                include_embeddings,
+                sources if self._needs_filter(name, sources) else None
+            )
+            for name in targets
+        ]
+        merged = [result for future in futures for result in future.result()]
+        merged.sort(key=lambda result: result["distance"])
+        return merged[:n_results]
+
+    def existing_ids(self, ids: List[str]) -> Set[str]:
+        found: Set[str] = set()
+        for store in self.partitions.values():
+            remaining = [doc_id for doc_id in ids if doc_id not in found]
+            if not remaining:
+                break
+            found |= store.existing_ids(remaining)
+        return found
+
+    def count(self) -> int:
+        return sum(store.count() for store in self.partitions.values())
+
+    def counts(self) -> Dict[str, int]:
+        return {name: store.count() for name, store in self.partitions.items()}
+
+    def peek(self, n: int) -> Dict[str, List[Any]]:
+        sample: Dict[str, List[Any]] = {"ids": [], "documents": [], "metadatas": []}
+        for store in self.partitions.values():
+            remaining = n - len(sample["ids"])
+            if remaining <= 0:
+                break
+            part = store.peek(remaining)
+            for key in sample:
+                sample[key].extend(part.get(key) or [])
+        return sample
+
+    def get(self, ids: List[str], include_embeddings: bool = False) -> List[Dict[str, Any]]:
+        by_id = {}
+        for store in self.partitions.values():
+            remaining = [doc_id for doc_id in ids if doc_id not in by_id]
+            if not remaining:
+                break
+            by_id.update((doc["id"], doc) for doc in store.get(remaining, include_embeddings))
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def iter_documents(
+        self,
+        batch_size: int = 1000
+    ) -> Iterator[Tuple[List[str], List[str], List[Dict[str, Any]]]]:
+        for store in self.partitions.values():
+            yield from store.iter_documents(batch_size)
+
+    def iter_metadatas(self, batch_size: int = 1000) -> Iterator[Tuple[List[str], List[Dict[str, Any]]]]:
+        for store in self.partitions.values():
+            yield from store.iter_metadatas(batch_size)
+
+    def replace_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]) -> None:
+        updates = dict(zip(ids, metadatas))
+        for store in self.partitions.values():
+            held = store.existing_ids(list(updates))
+            if held:
+                store.replace_metadatas(list(held), [updates[doc_id] for doc_id in held])
+
+    def drop_partition(self, name: str) -> None:
+        """Delete a partition's index and start it again empty"""
+        store = self.partitions[name]
+        if isinstance(store, ChromaVectorStore):
+            store.client.delete_collection(store.name)
+        elif isinstance(store, NumpyVectorStore):
+            store.close()
+            shutil.rmtree(store.path, ignore_errors=True)
+        self.partitions[name] = self._factory(name)
+
+def create_vector_store(
+    backend: str,
+    name: str,
+    base_path: str,
+    chroma_client: Any = None,
+    dtype: str = "float32",
+    rescore: bool = False,
+    rescore_factor: int = 4,
+    hnsw: Optional[Dict[str, int]] = None,
+    search_ef: Optional[int] = None,
+    read_only: bool = False
+) -> VectorStore:
+    """Instantiate the configured vector store backend (`read_only` applies to chroma)"""
+    if backend == "chroma":
+        return ChromaVectorStore(chroma_client, name, hnsw=hnsw, search_ef=search_ef, read_only=read_only)
+    if backend == "numpy":
+        return NumpyVectorStore(
+            os.path.join(base_path, "numpy", name),
+            dtype=dtype,
+            rescore=rescore,
+            rescore_factor=rescore_factor
+        )
+    raise ValueError(f"Unknown vector store backend: {backend}")
+
+def delete_vector_store(backend: str, name: str, base_path: str, chroma_client: Any = None) -> None:
+    """Delete a store's data created by create_vector_store; a missing store is not an error"""
+    if backend == "chroma":
+        if name in {collection.name for collection in chroma_client.list_collections()}:
+            chroma_client.delete_collection(name)
+    elif backend == "numpy":
+        shutil.rmtree(os.path.join(base_path, "numpy", name), ignore_errors=True)
+    else:
+        raise ValueError(f"Unknown vector store backend: {backend}")
@@ -0,0 +1,85 @@
+"""Measure bulk-indexing embedding throughput as EmbeddingPool workers scale.
+
+Encodes the same sample of documents with 1, 2, 4, ... N worker processes and
+prints docs/sec and speedup for each worker count.
+
+    cd backend
+    python benchmarks/embedding_scaling.py --max-workers 8 --docs 4000
+    python benchmarks/embedding_scaling.py --dataset Amod/mental_health_counseling_conversations
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from itertools import islice
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.embedding_pool import EmbeddingPool
+from app.rag_system import TherapyDatasetProcessor, _batched
+
+WORDS = (
+    "I feel anxious tired overwhelmed lonely hopeful sad stressed about work family sleep "
+    "school friends therapy panic breathing coping support today tomorrow again really"
+).split()
+
+def synthetic_texts(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(WORDS, k=rng.randint(20, 120))) for _ in range(count)]
+
+def worker_counts(max_workers: int):
+    counts, n = [], 1
+    while n < max_workers:
+        counts.append(n)
+        n *= 2
+    counts.append(max_workers)
+    return counts
+
+def measure(texts, workers: int, batch_size: int) -> float:
+    with EmbeddingPool(settings.EMBEDDING_MODEL, workers) as pool:
+        # Warm every worker so model loading is excluded from the timing
+        list(pool.map([texts[:8]] * workers))
+        started = time.perf_counter()
+        for _ in pool.map(_batched(texts, batch_size)):
+            pass
+        elapsed = time.perf_counter() - started
+    return len(texts) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=settings.BATCH_SIZE)
+    parser.add_argument("--dataset", help="Sample documents from a configured dataset instead of synthetic text")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    if args.dataset:
+        documents = TherapyDatasetProcessor().iter_documents(args.dataset)
+        texts = [doc["text"] for doc in islice(documents, args.docs)]
+    else:
+        texts = synthetic_texts(args.docs)
+
+    results = []
+    baseline = None
+    for workers in worker_counts(args.max_workers):
+        docs_per_sec = measure(texts, workers, args.batch_size)
+        baseline = baseline or docs_per_sec
+        results.append({
+            "workers": workers,
+            "docs_per_sec": round(docs_per_sec, 1),
+            "speedup": round(docs_per_sec / baseline, 2)
+        })
+        if not args.json:
+            print(f"workers={workers:<3} {docs_per_sec:10.1f} docs/s  speedup x{docs_per_sec / baseline:.2f}")
+
+    if args.json:
+        print(json.dumps({"model": settings.EMBEDDING_MODEL, "docs": len(texts), "results": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
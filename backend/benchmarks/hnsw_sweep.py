@@ -0,0 +1,72 @@
+"""Sweep HNSW parameters and print the recall/latency frontier.
+
+Runs the retrieval benchmark (synthetic corpus, deterministic embedder,
+exact ground truth) over a grid of M, construction_ef and search_ef, or over
+the named HNSW_PROFILES with --profiles. Search ef is changed on each built
+index rather than rebuilding it. Every run is listed, followed by the
+Pareto frontier: runs no other run beats on both recall@k and p95 latency.
+
+    cd backend
+    python benchmarks/hnsw_sweep.py --sizes 20000 --m 8 16 32 --construction-ef 64 100 200 --search-ef 10 20 50 100 200
+    python benchmarks/hnsw_sweep.py --profiles --sizes 20000 --output sweep.json
+"""
+
+import argparse
+import os
+import sys
+from typing import List
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from retrieval import add_arguments, print_table, run, write_results
+
+def frontier(results: List[dict]) -> List[dict]:
+    """Runs not dominated on (higher recall@k, lower p95) within the same index size"""
+    kept = []
+    for r in results:
+        dominated = any(
+            other is not r
+            and other["documents"] == r["documents"]
+            and other["recall_at_k"] >= r["recall_at_k"]
+            and other["p95_ms"] <= r["p95_ms"]
+            and (other["recall_at_k"] > r["recall_at_k"] or other["p95_ms"] < r["p95_ms"])
+            for other in results
+        )
+        if not dominated:
+            kept.append(r)
+    return sorted(kept, key=lambda r: (r["documents"], r["p95_ms"]))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    parser.add_argument("--profiles", action="store_true", help="Sweep the HNSW_PROFILES from Settings instead of a grid")
+    args = parser.parse_args()
+    args.backend = "chroma"
+
+    if args.profiles:
+        from app.config import settings
+
+        results = []
+        for name, profile in settings.HNSW_PROFILES.items():
+            args.m = [profile["M"]]
+            args.construction_ef = [profile["construction_ef"]]
+            args.search_ef = [profile["search_ef"]]
+            results.extend({"profile": name, **r} for r in run(args))
+    else:
+        results = run(args)
+
+    if args.output:
+        write_results(args.output, args, results)
+
+    print_table(results)
+    print("\nRecall/latency frontier:")
+    for r in frontier(results):
+        label = f" [{r['profile']}]" if "profile" in r else ""
+        print(
+            f"  docs={r['documents']} M={r['M']} construction_ef={r['construction_ef']} "
+            f"search_ef={r['search_ef']}: recall@k={r['recall_at_k']} p95={r['p95_ms']} ms{label}"
+        )
+
+if __name__ == "__main__":
+    main()
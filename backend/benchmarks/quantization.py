@@ -0,0 +1,127 @@
+"""Measure recall@k, memory and latency of quantized numpy vector storage.
+
+Every configuration is compared against an exact float32 brute-force
+search over the same vectors. The corpus is clustered random unit vectors
+(so neighbours are meaningfully closer than the rest), and queries are
+perturbed corpus points, so no model or network access is needed.
+
+    cd backend
+    python benchmarks/quantization.py --docs 100000 --dim 384 --k 10
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+CONFIGS = (
+    ("float32", False),
+    ("float16", False),
+    ("float16", True),
+    ("int8", False),
+    ("int8", True),
+)
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def clustered_corpus(count: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.normal(size=(clusters, dim)).astype(np.float32))
+    labels = rng.integers(0, clusters, size=count)
+    return normalize(centers[labels] + 0.35 * rng.normal(size=(count, dim)).astype(np.float32))
+
+def run_config(dtype: str, rescore: bool, vectors: np.ndarray, queries: np.ndarray, truth, args) -> dict:
+    from app.vector_store import NumpyVectorStore
+
+    path = tempfile.mkdtemp(prefix=f"bench-{dtype}-")
+    try:
+        store = NumpyVectorStore(path, dtype=dtype, rescore=rescore, rescore_factor=args.rescore_factor)
+        for start in range(0, len(vectors), args.batch_size):
+            chunk = vectors[start:start + args.batch_size]
+            ids = [str(i) for i in range(start, start + len(chunk))]
+            store.add(ids, [""] * len(chunk), chunk, [{}] * len(chunk))
+
+        # Warms the memory map (and decodes the float16 working set)
+        started = time.perf_counter()
+        store.query(queries[0], args.k)
+        first_ms = (time.perf_counter() - started) * 1000
+        latencies, recalls = [], []
+        for query, expected in zip(queries, truth):
+            started = time.perf_counter()
+            results = store.query(query, args.k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            recalls.append(len(expected & {int(r["id"]) for r in results}) / args.k)
+
+        stats = store.get_stats()
+        return {
+            "dtype": dtype,
+            "rescore": rescore,
+            "recall_at_k": round(float(np.mean(recalls)), 4),
+            "matrix_mb": stats["matrix_mb"],
+            "working_set_mb": stats["working_set_mb"],
+            "disk_mb": round(dir_size_mb(path), 1),
+            "first_query_ms": round(first_ms, 3),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3)
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    vectors = clustered_corpus(args.docs, args.dim, args.clusters, seed=0)
+    rng = np.random.default_rng(1)
+    picks = rng.integers(0, args.docs, size=args.queries)
+    queries = normalize(vectors[picks] + 0.1 * rng.normal(size=(args.queries, args.dim)).astype(np.float32))
+    truth = [set(np.argsort(-(vectors @ query))[:args.k].tolist()) for query in queries]
+
+    results = [run_config(dtype, rescore, vectors, queries, truth, args) for dtype, rescore in CONFIGS]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(
+        f"{'dtype':<8} {'rescore':>7} {'recall@k':>9} {'matrix MB':>10} {'working MB':>11} {'disk MB':>8} "
+        f"{'first ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+    )
+    for r in results:
+        print(
+            f"{r['dtype']:<8} {str(r['rescore']):>7} {r['recall_at_k']:>9} {r['matrix_mb']:>10} "
+            f"{r['working_set_mb']:>11} {r['disk_mb']:>8} {r['first_query_ms']:>9} "
+            f"{r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}"
+        )
+    print(
+        "\nfloat16 queries score a float32 working set decoded on the first query (first ms) and held in "
+        "memory (working MB),\nso float16 saves disk and page cache but not resident memory. int8 decodes "
+        "per query in chunks: smaller in memory, slower than float32."
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Measure recall@k and latency of TherapyRAG.retrieve across index sizes and HNSW parameters.
+
+The corpus is synthetic topical text and the embedding model is replaced by
+a deterministic hashing embedder, so runs need no model download or network
+and are reproducible across machines. Ground truth is the exact top-k by
+cosine similarity over the same embeddings, computed with NumPy; recall@k is
+the fraction of it that retrieve returns. Latency is the wall time of each
+retrieve call (embedding, search and formatting), with caches disabled.
+
+    cd backend
+    python benchmarks/retrieval.py --sizes 1000 10000 50000 --m 16 32 --search-ef 10 50 100
+    python benchmarks/retrieval.py --backend numpy --output results.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+class HashingEmbedder:
+    """
+    Deterministic stand-in for the sentence transformer
+
+    Each word maps to a fixed random unit vector seeded by its hash, and a
+    text embeds to the normalized sum of its word vectors, so texts sharing
+    words are close in cosine distance.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self._vectors: Dict[str, np.ndarray] = {}
+
+    def _word_vector(self, word: str) -> np.ndarray:
+        vector = self._vectors.get(word)
+        if vector is None:
+            seed = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector = np.random.default_rng(seed).normal(size=self.dim).astype(np.float32)
+            self._vectors[word] = vector
+        return vector
+
+    def encode(self, texts: List[str], **kwargs) -> np.ndarray:
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.split():
+                embeddings[row] += self._word_vector(word)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.maximum(norms, 1e-12)
+
+def synthetic_corpus(count: int, topics: int, words_per_doc: int, seed: int) -> List[str]:
+    """Documents drawing most words from one topic's vocabulary and the rest from a shared one"""
+    rng = np.random.default_rng(seed)
+    shared = [f"common{i}" for i in range(500)]
+    vocabularies = [[f"topic{t}word{i}" for i in range(60)] for t in range(topics)]
+    documents = []
+    for _ in range(count):
+        vocabulary = vocabularies[rng.integers(topics)]
+        topical = rng.choice(vocabulary, size=int(words_per_doc * 0.7))
+        general = rng.choice(shared, size=words_per_doc - len(topical))
+        words = np.concatenate([topical, general])
+        rng.shuffle(words)
+        documents.append(" ".join(words))
+    return documents
+
+def sample_queries(documents: List[str], count: int, words: int, seed: int) -> List[str]:
+    """Short queries made of words from randomly chosen documents"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for index in rng.integers(0, len(documents), size=count):
+        doc_words = documents[index].split()
+        queries.append(" ".join(rng.choice(doc_words, size=min(words, len(doc_words)), replace=False)))
+    return queries
+
+def ground_truth(embeddings: np.ndarray, query_embeddings: np.ndarray, k: int) -> List[set]:
+    """Exact top-k document indices per query by brute-force cosine similarity"""
+    truth = []
+    for start in range(0, len(query_embeddings), 256):
+        scores = query_embeddings[start:start + 256] @ embeddings.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        truth.extend(set(row.tolist()) for row in top)
+    return truth
+
+def build_rag(path: str, backend: str, hnsw: Dict[str, int], embedder: HashingEmbedder):
+    from app.config import settings
+    from app.rag_system import TherapyRAG
+    from app.vector_store import ChromaVectorStore
+
+    # Measure the index, not the caches: every entry is larger than 0 bytes
+    settings.VECTOR_STORE_BACKEND = backend
+    settings.RETRIEVAL_MODE = "vector"
+    settings.MMR_ENABLED = False
+    settings.CHUNKING_ENABLED = False
+    settings.QUERY_EMBEDDING_CACHE_BYTES = 0
+    settings.RETRIEVAL_CACHE_BYTES = 0
+    # Sequential queries: no batching window in the measured latency
+    settings.QUERY_BATCH_WINDOW_MS = 0
+
+    rag = TherapyRAG(path)
+    rag.embedding_model = embedder
+    if backend == "chroma":
+        rag.vector_store = ChromaVectorStore(rag.chroma_client, rag.collection_name, hnsw=hnsw)
+    return rag
+
+async def measure(rag, queries: List[str], truth: List[set], k: int) -> Dict[str, float]:
+    await rag.retrieve(queries[0], k)  # warm up
+    latencies, recalls = [], []
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        results = await rag.retrieve(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(len(expected & {int(r["id"]) for r in results}) / k)
+    return {
+        "recall_at_k": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3)
+    }
+
+def run_size(size: int, documents: List[str], embeddings: np.ndarray, queries: List[str], args) -> List[dict]:
+    """Index the first `size` documents once per build configuration and measure every search ef"""
+    query_embeddings = args.embedder.encode(queries)
+    truth = ground_truth(embeddings[:size], query_embeddings, args.k)
+
+    if args.backend == "chroma":
+        builds = [
+            {"M": m, "construction_ef": construction_ef}
+            for m, construction_ef in itertools.product(args.m, args.construction_ef)
+        ]
+        search_efs = args.search_ef
+    else:
+        builds, search_efs = [{}], [None]
+
+    results = []
+    for build in builds:
+        path = tempfile.mkdtemp(prefix="bench-retrieval-")
+        try:
+            rag = build_rag(path, args.backend, build, args.embedder)
+            started = time.perf_counter()
+            for start in range(0, size, args.batch_size):
+                end = min(start + args.batch_size, size)
+                rag.vector_store.add(
+                    ids=[str(i) for i in range(start, end)],
+                    documents=documents[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=[{"source": "synthetic"}] * (end - start)
+                )
+            build_seconds = time.perf_counter() - started
+            for search_ef in search_efs:
+                # Search ef changes on the built index; no rebuild per value
+                if search_ef is not None:
+                    rag.set_search_ef(search_ef)
+                result = {
+                    "backend": args.backend,
+                    "documents": size,
+                    **build,
+                    **({"search_ef": search_ef} if search_ef is not None else {}),
+                    "build_s": round(build_seconds, 2),
+                    **asyncio.run(measure(rag, queries, truth, args.k))
+                }
+                results.append(result)
+                print(json.dumps(result), file=sys.stderr)
+            rag.retrieval_executor.shutdown()
+        finally:
+            shutil.rmtree(path, ignore_errors=True)
+    return results
+
+def run(args) -> List[dict]:
+    """Run the benchmark for every size in `args.sizes`"""
+    args.embedder = HashingEmbedder(args.dim)
+    documents = synthetic_corpus(max(args.sizes), args.topics, args.words_per_doc, seed=args.seed)
+    embeddings = args.embedder.encode(documents)
+
+    results = []
+    for size in sorted(args.sizes):
+        # Queries come from the first `size` documents so every size has relevant matches
+        queries = sample_queries(documents[:size], args.queries, args.query_words, seed=args.seed + 1)
+        results.extend(run_size(size, documents, embeddings, queries, args))
+    return results
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--backend", choices=["chroma", "numpy"], default="chroma")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--m", type=int, nargs="+", default=[16])
+    parser.add_argument("--construction-ef", type=int, nargs="+", default=[100])
+    parser.add_argument("--search-ef", type=int, nargs="+", default=[10, 50, 100])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--words-per-doc", type=int, default=40)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--query-words", type=int, default=8)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+
+def write_results(path: str, args, results: List[dict]) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "parameters": {key: value for key, value in vars(args).items() if key != "embedder"},
+            "results": results
+        }, f, indent=2)
+
+def print_table(results: List[dict]) -> None:
+    print(f"{'docs':>8} {'M':>4} {'c_ef':>5} {'s_ef':>5} {'recall@k':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for r in results:
+        print(
+            f"{r['documents']:>8} {r.get('M', '-'):>4} {r.get('construction_ef', '-'):>5} {r.get('search_ef', '-'):>5} "
+            f"{r['recall_at_k']:>9} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['p99_ms']:>8}"
+        )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    results = run(args)
+    if args.output:
+        write_results(args.output, args, results)
+    print_table(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Compare query latency, memory and disk use of the vector store backends.
+
+Each backend is benchmarked in its own subprocess so peak RSS is attributable
+to that backend alone. The corpus is random unit vectors, so no model or
+network access is needed.
+
+    cd backend
+    python benchmarks/vector_store_backends.py --docs 100000 --dim 384
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+BACKENDS = ("chroma", "numpy")
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+def random_unit_vectors(count: int, dim: int, seed: int) -> np.ndarray:
+    vectors = np.random.default_rng(seed).normal(size=(count, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def run_backend(args) -> dict:
+    """Build and query one backend in this process and return its measurements"""
+    import chromadb
+    from chromadb.config import Settings as ChromaSettings
+    from app.utils.memory import peak_rss_mb
+    from app.vector_store import create_vector_store
+
+    path = tempfile.mkdtemp(prefix=f"bench-{args.backend}-")
+    try:
+        client = None
+        if args.backend == "chroma":
+            client = chromadb.PersistentClient(path=path, settings=ChromaSettings(anonymized_telemetry=False))
+        store = create_vector_store(args.backend, "bench_collection", path, chroma_client=client)
+
+        vectors = random_unit_vectors(args.docs, args.dim, seed=0)
+        started = time.perf_counter()
+        for start in range(0, args.docs, args.batch_size):
+            chunk = vectors[start:start + args.batch_size]
+            ids = [str(i) for i in range(start, start + len(chunk))]
+            store.add(ids, [f"document {i}" for i in ids], chunk, [{"source": "bench"}] * len(chunk))
+        build_seconds = time.perf_counter() - started
+        del vectors
+
+        queries = random_unit_vectors(args.queries, args.dim, seed=1)
+        store.query(queries[0], args.k)  # warm caches / memory map
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            store.query(query, args.k)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+        return {
+            "backend": args.backend,
+            "docs": args.docs,
+            "dim": args.dim,
+            "build_seconds": round(build_seconds, 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+            "peak_rss_mb": round(peak_rss_mb() or 0.0, 1),
+            "disk_mb": round(dir_size_mb(path), 1)
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--backend", choices=BACKENDS, help=argparse.SUPPRESS)
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    if args.backend:
+        print(json.dumps(run_backend(args)))
+        return
+
+    results = []
+    for backend in BACKENDS:
+        command = [sys.executable, os.path.abspath(__file__), "--backend", backend] + [
+            f"--{name.replace('_', '-')}={getattr(args, name)}"
+            for name in ("docs", "dim", "queries", "k", "batch_size")
+        ]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'backend':<8} {'build s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>8} {'disk MB':>8}")
+    for r in results:
+        print(
+            f"{r['backend']:<8} {r['build_seconds']:>8} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+            f"{r['p99_ms']:>8} {r['peak_rss_mb']:>8} {r['disk_mb']:>8}"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Report the hit rate of the persistent embedding cache, or compact it.
+
+The cache under EMBEDDING_CACHE_PATH holds one append-only matrix per
+embedding model. Compaction rewrites the current model's matrix; with
+--keep-indexed it keeps only texts stored in the live or previous index
+version (dropping, for example, chunks of an old chunking setting), and
+--drop-other-models deletes the caches of every other model.
+
+    cd backend
+    python scripts/embedding_cache.py report
+    python scripts/embedding_cache.py compact --keep-indexed --drop-other-models
+"""
+
+import argparse
+import os
+import shutil
+import sys
+from typing import Iterator
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import settings
+from app.embedding_cache import EmbeddingCache
+from app.rag_system import TherapyRAG
+
+def indexed_texts(rag: TherapyRAG) -> Iterator[str]:
+    """Texts of every document in the live and previous index versions"""
+    versions = [rag.index_aliases.live, rag.index_aliases.previous]
+    for version in dict.fromkeys(version for version in versions if version):
+        store = TherapyRAG(rag.vector_db_path, index_version=version).vector_store
+        for _, documents, _ in store.iter_documents(settings.BATCH_SIZE * 10):
+            yield from documents
+
+def report() -> None:
+    models = EmbeddingCache.models(settings.EMBEDDING_CACHE_PATH)
+    if not models:
+        print(f"No embedding cache under {settings.EMBEDDING_CACHE_PATH}")
+    for model in models.values():
+        stats = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, model).get_stats()
+        current = " (current model)" if model == settings.EMBEDDING_MODEL else ""
+        print(
+            f"{model}{current}: {stats['entries']} embeddings, dim {stats['dim']}, {stats['size_mb']} MB, "
+            f"hit rate {stats['total_hit_rate']:.1%} ({stats['total_hits']} hits, {stats['total_misses']} misses)"
+        )
+
+def compact(keep_indexed: bool, drop_other_models: bool) -> None:
+    cache = EmbeddingCache(settings.EMBEDDING_CACHE_PATH, settings.EMBEDDING_MODEL)
+    result = cache.compact(indexed_texts(TherapyRAG()) if keep_indexed else None)
+    print(
+        f"{settings.EMBEDDING_MODEL}: {result['entries_before']} -> {result['entries']} embeddings, "
+        f"{result['bytes_before'] / (1024 * 1024):.1f} -> {result['bytes'] / (1024 * 1024):.1f} MB"
+    )
+    if drop_other_models:
+        for path, model in EmbeddingCache.models(settings.EMBEDDING_CACHE_PATH).items():
+            if model != settings.EMBEDDING_MODEL:
+                shutil.rmtree(path)
+                print(f"Deleted the cache of {model}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["report", "compact"])
+    parser.add_argument(
+        "--keep-indexed",
+        action="store_true",
+        help="Keep only embeddings of texts in the live or previous index version"
+    )
+    parser.add_argument(
+        "--drop-other-models",
+        action="store_true",
+        help="Delete the caches of models other than EMBEDDING_MODEL"
+    )
+    args = parser.parse_args()
+
+    if args.command == "report":
+        report()
+    else:
+        compact(args.keep_indexed, args.drop_other_models)
+
+if __name__ == "__main__":
+    main()
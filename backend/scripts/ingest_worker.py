@@ -0,0 +1,32 @@
+"""Run the ingest worker: process indexing jobs queued through the API.
+
+The API starts a worker process itself unless INGEST_WORKER_ENABLED=false;
+set that and run this script to host the worker separately (e.g. on its
+own container with its own CPU limits). Both sides must use the same
+INGEST_QUEUE_PATH and VECTOR_DB_PATH. Stop with Ctrl+C; the running job is
+cancelled after its current batch and resumes on the next start.
+
+    cd backend
+    python scripts/ingest_worker.py
+"""
+
+import argparse
+import os
+import signal
+import sys
+import threading
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.ingest_worker import run_ingest_worker
+
+def main():
+    argparse.ArgumentParser(description=__doc__.splitlines()[0]).parse_args()
+    stop = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+    run_ingest_worker(stop)
+
+if __name__ == "__main__":
+    main()
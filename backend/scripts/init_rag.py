@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import sys
 import os
@@ -7,22 +8,65 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.rag_system import TherapyRAG
 from app.utils.logger import rag_logger
+from app.utils.memory import peak_rss_mb
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download and index all configured therapy datasets")
+    parser.add_argument(
+        "--max-rss",
+        action="store_true",
+        help="Report the peak resident memory of the process after each stage"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Embedding worker processes (defaults to EMBEDDING_WORKERS)"
+    )
+    parser.add_argument(
+        "--rebuild-partition",
+        metavar="NAME",
+        help="Re-index a single partition into a new index version (requires PARTITIONED_INDEX)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Re-index every dataset, not only those indexed with different settings"
+    )
+    return parser.parse_args()
+
+def report_rss(label: str) -> None:
+    peak = peak_rss_mb()
+    if peak is None:
+        print(f"📈 Peak RSS ({label}): unavailable on this platform")
+    else:
+        print(f"📈 Peak RSS ({label}): {peak:.1f} MB")
 
 async def main():
+    args = parse_args()
+
     print("🚀 Starting RAG Initialization...")
     print("This process will download and index all configured datasets.")
     print("You can continue using the AI Therapist app while this runs.")
     print("-" * 50)
-    
+
     try:
         rag = TherapyRAG()
-        await rag.load_and_index_datasets()
-        
+        if args.max_rss:
+            report_rss("after model load")
+
+        if args.rebuild_partition:
+            await rag.rebuild_partition(args.rebuild_partition, embedding_workers=args.workers)
+        else:
+            await rag.rebuild(embedding_workers=args.workers, force=args.force)
+
         stats = rag.get_stats()
         print("\n✅ RAG Initialization Complete!")
         print(f"Total Documents: {stats['total_documents']}")
-        print(f"Collection: {stats['collection_name']}")
-        
+        print(f"Collection: {stats['collection_name']} (index version {stats['index_version']})")
+        if args.max_rss:
+            report_rss("after indexing")
+
     except Exception as e:
         print(f"\n❌ Error during initialization: {str(e)}")
         rag_logger.error(f"Initialization error: {str(e)}")
@@ -0,0 +1,112 @@
+"""Slim the metadata of an existing index down to the per-dataset projection.
+
+Documents indexed before DATASET_CONFIGS declared `metadata_fields` carry
+every raw dataset column in their metadata. This rewrites each document's
+metadata in place with TherapyDatasetProcessor.project_metadata (no
+re-embedding), vacuums the SQLite files, and prints on-disk size and query
+latency before and after. The store is opened through TherapyRAG, so a
+PARTITIONED_INDEX store is migrated partition by partition.
+
+    cd backend
+    python scripts/slim_metadata.py
+    python scripts/slim_metadata.py --dry-run
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+import time
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from app.config import settings
+from app.rag_system import TherapyDatasetProcessor, TherapyRAG
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total / (1024 * 1024)
+
+def embedding_dim(store) -> int:
+    ids, _ = next(store.iter_metadatas(1))
+    return len(store.get(ids[:1], include_embeddings=True)[0]["embedding"])
+
+def measure(store, queries: np.ndarray, k: int) -> dict:
+    store.query(queries[0], k)  # warm caches
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        store.query(query, k)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "disk_mb": round(dir_size_mb(settings.VECTOR_DB_PATH), 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3)
+    }
+
+def slim(store, batch_size: int, dry_run: bool) -> tuple:
+    """Rewrite every document's metadata with the configured projection"""
+    scanned = changed = 0
+    for ids, metadatas in store.iter_metadatas(batch_size):
+        updated_ids, updated = [], []
+        for doc_id, metadata in zip(ids, metadatas):
+            metadata = metadata or {}
+            source = metadata.get("source", "")
+            config = TherapyDatasetProcessor.DATASET_CONFIGS.get(source, {})
+            projected = TherapyDatasetProcessor.project_metadata(
+                metadata, config, source, metadata.get("split", "")
+            )
+            if projected != metadata:
+                updated_ids.append(doc_id)
+                updated.append(projected)
+        if updated and not dry_run:
+            store.replace_metadatas(updated_ids, updated)
+        scanned += len(ids)
+        changed += len(updated)
+    return scanned, changed
+
+def vacuum(path: str) -> None:
+    """Reclaim the pages freed by the smaller metadata rows"""
+    for db_file in glob.glob(os.path.join(path, "**", "*.sqlite3"), recursive=True):
+        conn = sqlite3.connect(db_file)
+        try:
+            conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=100, help="Random queries used to measure latency")
+    parser.add_argument("--k", type=int, default=settings.RAG_N_RESULTS)
+    parser.add_argument("--dry-run", action="store_true", help="Count documents that would change without writing")
+    args = parser.parse_args()
+
+    store = TherapyRAG().vector_store
+    if store.count() == 0:
+        print("Collection is empty, nothing to migrate.")
+        return
+
+    queries = np.random.default_rng(0).normal(size=(args.queries, embedding_dim(store))).astype(np.float32)
+    before = measure(store, queries, args.k)
+
+    scanned, changed = slim(store, args.batch_size, args.dry_run)
+    print(f"Scanned {scanned} documents, {'would slim' if args.dry_run else 'slimmed'} {changed}")
+    if args.dry_run:
+        return
+
+    vacuum(settings.VECTOR_DB_PATH)
+    after = measure(store, queries, args.k)
+
+    print(f"{'':<8} {'disk MB':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for label, result in (("before", before), ("after", after)):
+        print(f"{label:<8} {result['disk_mb']:>8} {result['p50_ms']:>8} {result['p95_ms']:>8}")
+
+if __name__ == "__main__":
+    main()
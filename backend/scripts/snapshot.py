@@ -0,0 +1,49 @@
+"""Export the indexed collection to a snapshot bundle, or import one.
+
+A snapshot holds every document's id, text, metadata and embedding, so a new
+replica can be populated without downloading datasets or running the
+embedding model. Import requires an empty collection under VECTOR_DB_PATH
+and the same EMBEDDING_MODEL the snapshot was built with.
+
+    cd backend
+    python scripts/snapshot.py export /backups/therapy-2024-06-01
+    python scripts/snapshot.py verify /backups/therapy-2024-06-01
+    VECTOR_DB_PATH=/data/therapy_vector_db python scripts/snapshot.py import /backups/therapy-2024-06-01
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the parent directory to sys.path to allow importing app modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.rag_system import TherapyRAG
+from app.snapshot import export_snapshot, import_snapshot, verify_snapshot
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("command", choices=["export", "import", "verify"])
+    parser.add_argument("path", help="Snapshot bundle directory")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "verify":
+        manifest = verify_snapshot(args.path)
+    elif args.command == "export":
+        manifest = export_snapshot(TherapyRAG(), args.path, batch_size=args.batch_size)
+    else:
+        manifest = import_snapshot(TherapyRAG(), args.path, batch_size=args.batch_size)
+
+    size_mb = sum(f["bytes"] for f in manifest["files"].values()) / (1024 * 1024)
+    print(
+        f"{args.command}: {manifest['count']} documents, dim {manifest['dim']}, "
+        f"{size_mb:.1f} MB, {time.perf_counter() - started:.1f}s"
+    )
+    for source, count in sorted(manifest["sources"].items()):
+        print(f"  {source}: {count}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,8 @@
 import pytest
+from unittest.mock import patch
 from fastapi.testclient import TestClient
+from ..app import main
+from ..app.ingest_jobs import IngestJobQueue
 from ..app.main import app
 from ..app.models import (
     ChatRequest,
@@ -92,6 +95,31 @@ def test_rag_stats(test_client):
     assert "collection_name" in data
     assert "embedding_model" in data
 
+def test_initialize_rag_queues_one_job(test_client, tmp_path):
+    with patch.object(main, "_ingest_queue", IngestJobQueue(str(tmp_path / "jobs.sqlite3"))):
+        first = test_client.post("/api/rag/initialize").json()
+        second = test_client.post("/api/rag/initialize").json()
+        assert first["created"] and not second["created"]
+        assert second["job"]["id"] == first["job"]["id"]
+
+        job_id = first["job"]["id"]
+        assert test_client.get(f"/api/rag/jobs/{job_id}").json()["status"] == "queued"
+        assert test_client.post(f"/api/rag/jobs/{job_id}/cancel").json()["status"] == "cancelled"
+        assert test_client.post(f"/api/rag/jobs/{job_id}/cancel").status_code == 409
+        assert test_client.get("/api/rag/jobs/missing").status_code == 404
+        assert test_client.post("/api/rag/initialize?partition=nope").status_code == 400
+
+def test_search_ef_is_queued_for_the_ingest_worker(test_client, tmp_path):
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+    with patch.object(main, "_ingest_queue", queue), patch.object(main.settings, "VECTOR_STORE_BACKEND", "chroma"):
+        response = test_client.post("/api/rag/search-ef?search_ef=77")
+        assert response.status_code == 200
+        job = response.json()["job"]
+        assert (job["kind"], job["params"]) == ("search_ef", {"search_ef": 77})
+        assert queue.claim()["id"] == job["id"]
+        assert test_client.post("/api/rag/search-ef?search_ef=0").status_code == 400
+    assert main.rag_system.read_only
+
 def test_cors_headers(test_client):
     response = test_client.options("/api/health")
     assert "access-control-allow-origin" in response.headers
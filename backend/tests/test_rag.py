@@ -1,6 +1,30 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
 import pytest
+from datasets import Dataset, DatasetDict
 from unittest.mock import Mock, patch
-from ..app.rag_system import TherapyDatasetProcessor, TherapyRAG
+from ..app.config import settings
+from ..app.caching import LRUCache
+from ..app.chunking import TextChunker
+from ..app.dedup import Deduplicator
+from ..app.embedding_cache import EmbeddingCache
+from ..app.index_manifest import IndexManifest, document_id
+from ..app.index_versions import IndexValidationError
+from ..app.indexing_pipeline import DocumentBatch, IndexingPipeline
+from ..app.ingest_jobs import IngestJobQueue
+from ..app.ingest_worker import IngestWorker
+from ..app.lexical_index import LexicalIndex
+from ..app.prompt_packer import PromptPacker
+from ..app.query_batcher import QueryBatcher
+from ..app.ranking import collapse_chunks, maximal_marginal_relevance, reciprocal_rank_fusion
+from ..app.rag_system import TherapyDatasetProcessor, TherapyRAG, _batched
+from ..app.retrieval_executor import RetrievalExecutor, RetrievalOverloadedError
+from ..app.snapshot import export_snapshot, import_snapshot, verify_snapshot
+from ..app.vector_store import ChromaVectorStore, NumpyVectorStore, PartitionedVectorStore
 
 @pytest.fixture
 def mock_sentence_transformer():
@@ -16,6 +40,7 @@ def mock_chromadb():
         mock_instance = Mock()
         mock_collection = Mock()
         mock_collection.count.return_value = 100
+        mock_collection.get.return_value = {"ids": [], "documents": [], "metadatas": []}
         mock_instance.get_or_create_collection.return_value = mock_collection
         mock.return_value = mock_instance
         yield mock
@@ -53,7 +78,7 @@ def test_text_processing():
 @pytest.mark.asyncio
 async def test_load_and_index_datasets_empty(mock_sentence_transformer, mock_chromadb):
     rag = TherapyRAG("./test_db")
-    with patch("datasets.load_dataset") as mock_load:
+    with patch(f"{TherapyDatasetProcessor.__module__}.load_dataset") as mock_load:
         mock_load.return_value = {"train": []}
         await rag.load_and_index_datasets()
         # Should not raise any exceptions
@@ -70,4 +95,863 @@ async def test_get_context_for_llm(mock_sentence_transformer, mock_chromadb):
         ]
         context = rag.get_context_for_llm("test query")
         assert isinstance(context, str)
-        assert "Example conversation" in context
\ No newline at end of file
+        assert "Example conversation" in context
+
+def test_batched_yields_fixed_size_batches():
+    batches = list(_batched(iter(range(7)), 3))
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+def test_iter_documents_is_lazy():
+    processor = TherapyDatasetProcessor()
+    rows = [{"text": f"streamed row number {i}", "label": i} for i in range(5)]
+    with patch(f"{TherapyDatasetProcessor.__module__}.load_dataset") as mock_load:
+        mock_load.return_value = DatasetDict({"train": Dataset.from_list(rows)})
+        documents = processor.iter_documents("dair-ai/emotion")
+        first = next(documents)
+        assert first["text"] == "streamed row number 0"
+        assert first["metadata"]["source"] == "dair-ai/emotion"
+        assert len(list(documents)) == 4
+
+def test_prepare_cleans_splits_in_batches_and_resumes():
+    processor = TherapyDatasetProcessor()
+    dataset = DatasetDict({
+        "train": Dataset.from_list([
+            {"Context": "I cannot sleep at night", "Response": "Try a wind-down routine"},
+            {"Context": None, "Response": None},
+            {"Context": "I feel anxious at work", "Response": "Name the feeling first"}
+        ]),
+        "test": Dataset.from_list([{"Context": "My partner and I argue", "Response": "Take a pause"}])
+    })
+    name = "Amod/mental_health_counseling_conversations"
+    with patch(f"{TherapyDatasetProcessor.__module__}.load_dataset", return_value=dataset), \
+            patch.object(settings, "CHUNKING_ENABLED", False):
+        documents = list(TherapyDatasetProcessor.iter_prepared(processor.prepare(name)))
+        resumed = list(TherapyDatasetProcessor.iter_prepared(processor.prepare(name, start_row=2)))
+        assert processor.prepare(name, start_row=4) is None
+
+    assert [doc["row"] for doc in documents] == [0, 2, 3]
+    assert documents[0]["text"] == "Context: I cannot sleep at night Response: Try a wind-down routine"
+    assert documents[2]["metadata"] == {"source": name, "split": "test"}
+    assert resumed == documents[1:]
+
+def test_indexing_pipeline_persists_all_batches_in_order():
+    written = []
+    pipeline = IndexingPipeline(
+        encode=lambda texts: [len(t) for t in texts],
+        write=lambda batch: written.append((batch.dataset_name, batch.embeddings)),
+        queue_size=1
+    )
+    batches = [
+        DocumentBatch(dataset_name=f"ds{i}", documents=[{"text": "x" * i}])
+        for i in range(1, 6)
+    ]
+    stats = pipeline.run(batches)
+    assert written == [(f"ds{i}", [i]) for i in range(1, 6)]
+    assert stats["persist"].items == 5
+
+def test_indexing_pipeline_propagates_stage_errors():
+    def failing_write(batch):
+        raise RuntimeError("disk full")
+
+    pipeline = IndexingPipeline(encode=lambda texts: texts, write=failing_write)
+    batches = (DocumentBatch(dataset_name="ds", documents=[{"text": "t"}]) for _ in range(50))
+    with pytest.raises(RuntimeError):
+        pipeline.run(batches)
+
+def test_document_id_is_content_addressed():
+    assert document_id("I feel  anxious", "a") == document_id("I feel anxious", "a")
+    assert document_id("I feel anxious", "a") != document_id("I feel anxious", "b")
+
+def test_index_manifest_resume(tmp_path):
+    manifest = IndexManifest(str(tmp_path / "manifest.json"))
+    assert manifest.resume_row("ds", "fp1") == 0
+    manifest.checkpoint("ds", rows_done=200, documents=180)
+
+    reloaded = IndexManifest(str(tmp_path / "manifest.json"))
+    assert reloaded.resume_row("ds", "fp1") == 200
+    reloaded.checkpoint("ds", rows_done=250, documents=40, completed=True)
+    assert reloaded.resume_row("ds", "fp1") is None
+    # A config change restarts the dataset from scratch
+    assert reloaded.resume_row("ds", "fp2") == 0
+
+def test_deduplicator_drops_exact_and_near_duplicates():
+    dedup = Deduplicator(threshold=0.8)
+    text = " ".join(f"word{i}" for i in range(80))
+    assert dedup.check(text, "a") is None
+    assert dedup.check(text.upper(), "b") == "exact"
+    assert dedup.check(text + " word80", "b") == "near"
+    assert dedup.check("a completely different counseling exchange about sleep", "b") is None
+    stats = dedup.get_stats()["sources"]
+    assert stats["b"] == {"kept": 1, "exact": 1, "near": 1}
+
+def test_deduplicator_seed_registers_stored_documents():
+    dedup = Deduplicator(threshold=0.8)
+    text = " ".join(f"word{i}" for i in range(80))
+    assert dedup.seed([text, text.upper()]) == 1
+    assert dedup.check(text + " word80", "a") == "near"
+    assert dedup.get_stats()["sources"]["a"] == {"kept": 0, "exact": 0, "near": 1}
+
+def test_lru_cache_evicts_by_bytes():
+    cache = LRUCache(max_bytes=3000, sizeof=lambda key, value: 1000)
+    for key in ("a", "b", "c"):
+        cache.put(key, key)
+    assert cache.get("a") == "a"
+    cache.put("d", "d")  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    stats = cache.get_stats()
+    assert stats["evictions"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["bytes"] == 3000
+
+@pytest.mark.asyncio
+async def test_retrieve_caches_query_embeddings(mock_sentence_transformer, mock_chromadb):
+    rag = TherapyRAG("./test_db")
+    rag.embedding_model = Mock()
+    rag.embedding_model.encode.return_value = np.array([[0.1, 0.2, 0.3]])
+    await rag.retrieve("I feel anxious", n_results=3)
+    await rag.retrieve("  i feel   ANXIOUS ", n_results=3)
+    assert rag.embedding_model.encode.call_count == 1
+    assert rag.get_stats()["query_embedding_cache"]["hits"] == 1
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(max_bytes=10_000, ttl_seconds=0)
+    cache.put("q", [1, 2, 3])
+    assert cache.get("q") is None
+    assert cache.get_stats()["expirations"] == 1
+
+@pytest.mark.asyncio
+async def test_retrieval_cache_invalidated_by_index_writes(mock_sentence_transformer, mock_chromadb, tmp_path):
+    rag = TherapyRAG(str(tmp_path))
+    rag.embedding_model = Mock()
+    rag.embedding_model.encode.return_value = np.array([[0.1, 0.2, 0.3]])
+    rag.vector_store.collection.query.return_value = {
+        "documents": [["doc"]], "metadatas": [[{"source": "s"}]], "distances": [[0.1]]
+    }
+    await rag.retrieve("I can't sleep", n_results=1)
+    await rag.retrieve("I can't sleep", n_results=1)
+    assert rag.vector_store.collection.query.call_count == 1
+
+    rag._write_batch(DocumentBatch(
+        dataset_name="s",
+        documents=[{"id": "x", "text": "new doc", "metadata": {"source": "s"}}],
+        embeddings=np.zeros((1, 3))
+    ))
+    await rag.retrieve("I can't sleep", n_results=1)
+    assert rag.vector_store.collection.query.call_count == 2
+
+@pytest.mark.asyncio
+async def test_retrieval_executor_caps_concurrency_and_queue():
+    executor = RetrievalExecutor(workers=2, max_concurrency=1, max_queue=1)
+    gate = threading.Event()
+    first = asyncio.ensure_future(executor.run(gate.wait))
+    await asyncio.sleep(0.01)
+    second = asyncio.ensure_future(executor.run(lambda: "queued"))
+    await asyncio.sleep(0.01)
+    assert executor.get_stats()["in_flight"] == 1
+    assert executor.get_stats()["waiting"] == 1
+    with pytest.raises(RetrievalOverloadedError):
+        await executor.run(lambda: "rejected")
+    gate.set()
+    assert await second == "queued"
+    await first
+    assert executor.get_stats()["rejected"] == 1
+
+@pytest.mark.asyncio
+async def test_query_batcher_coalesces_concurrent_queries():
+    calls = []
+
+    async def encode_batch(texts):
+        calls.append(list(texts))
+        return np.array([[float(len(t))] for t in texts])
+
+    batcher = QueryBatcher(encode_batch, window_ms=1000, max_batch_size=8)
+    # The first query finds the batcher idle and is encoded alone, without a window
+    started = time.perf_counter()
+    results = await asyncio.gather(*[batcher.encode(q) for q in ("a", "bb", "a", "ccc")])
+    # The rest queued behind it and were flushed when it finished
+    assert time.perf_counter() - started < 0.5
+    assert calls == [["a"], ["bb", "a", "ccc"]]
+    assert [r[0] for r in results] == [1.0, 2.0, 1.0, 3.0]
+    assert batcher.get_stats()["largest_batch"] == 3
+    assert not batcher._running
+
+def test_numpy_vector_store_query_and_reopen(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "store"))
+    embeddings = np.eye(4, dtype=np.float32)
+    store.add(
+        ids=["a", "b", "c", "d"],
+        documents=["doc a", "doc b", "doc c", "doc d"],
+        embeddings=embeddings,
+        metadatas=[{"source": s} for s in "abcd"]
+    )
+    results = store.query(np.array([0.1, 0.9, 0.0, 0.0]), n_results=2)
+    assert [r["id"] for r in results] == ["b", "a"]
+    assert results[0]["metadata"] == {"source": "b"}
+
+    reopened = NumpyVectorStore(str(tmp_path / "store"))
+    assert reopened.count() == 4
+    assert reopened.existing_ids(["a", "z"]) == {"a"}
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_numpy_vector_store_quantized_rescore(tmp_path, dtype):
+    rng = np.random.default_rng(0)
+    embeddings = rng.normal(size=(200, 16)).astype(np.float32)
+    store = NumpyVectorStore(str(tmp_path / "store"), dtype=dtype, rescore=True)
+    store.add([str(i) for i in range(200)], [""] * 200, embeddings, [{}] * 200)
+
+    normalized = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    expected = np.argsort(-(normalized @ normalized[7]))[:5]
+    reopened = NumpyVectorStore(str(tmp_path / "store"), dtype="float32", rescore=True)
+    assert reopened.dtype == dtype
+    assert [r["id"] for r in reopened.query(embeddings[7], n_results=5)] == [str(i) for i in expected]
+
+def test_project_metadata_keeps_declared_typed_fields():
+    config = {"text_column": "text", "metadata_fields": {"label": int, "speaker": str}}
+    item = {"text": "ignored", "label": "3", "speaker": "x" * 1000, "raw_column": "dropped"}
+
+    metadata = TherapyDatasetProcessor.project_metadata(item, config, "some/dataset", "train")
+
+    assert set(metadata) == {"source", "split", "label", "speaker"}
+    assert metadata["label"] == 3
+    assert len(metadata["speaker"]) == 256
+
+def test_numpy_vector_store_replace_metadatas(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "store"))
+    store.add(["a", "b"], ["doc a", "doc b"], np.eye(2, dtype=np.float32), [{"source": "s", "raw": "x"}] * 2)
+
+    store.replace_metadatas(["a"], [{"source": "s"}])
+
+    assert list(store.iter_metadatas(batch_size=1)) == [
+        (["a"], [{"source": "s"}]),
+        (["b"], [{"source": "s", "raw": "x"}])
+    ]
+
+def test_lexical_index_bm25_prefers_rare_exact_terms(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    index.add(
+        ["a", "b", "c"],
+        [
+            "I feel anxious and cannot sleep at night",
+            "My doctor prescribed sertraline for my anxiety",
+            "I feel sad and tired most days"
+        ]
+    )
+    index.add(["a"], ["already indexed"])
+    assert index.count() == 3
+    assert [doc_id for doc_id, _ in index.search("is sertraline safe?", 2)] == ["b"]
+
+    reopened = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    assert reopened.search("cannot sleep", 1)[0][0] == "a"
+
+def test_lexical_index_remove_sources_matches_fresh_index(tmp_path):
+    texts = {
+        "a": ("I feel anxious and cannot sleep at night", "x"),
+        "b": ("My doctor prescribed sertraline for my anxiety", "y"),
+        "c": ("Anxious thoughts keep me awake at night", "x"),
+        "d": ("I feel sad and cannot sleep", "y")
+    }
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite3"))
+    for doc_id, (text, source) in texts.items():
+        index.add([doc_id], [text], [source])
+    assert index.remove_sources(["x"]) == 2
+
+    fresh = LexicalIndex(str(tmp_path / "fresh.sqlite3"))
+    fresh.add(["b", "d"], [texts["b"][0], texts["d"][0]], ["y", "y"])
+    assert index.count() == 2
+    assert index.search("anxious night sleep sertraline", 5) == fresh.search("anxious night sleep sertraline", 5)
+    assert index.get_stats()["terms"] == fresh.get_stats()["terms"]
+    index.add(["e"], ["sleep diary"], ["x"])
+    assert index.search("diary", 1)[0][0] == "e"
+
+def test_reciprocal_rank_fusion():
+    fused = reciprocal_rank_fusion([
+        [{"id": "a", "distance": 0.1}, {"id": "b", "distance": 0.2}],
+        [{"id": "b", "distance": None}, {"id": "c", "distance": None}]
+    ], k=60)
+    assert [r["id"] for r in fused] == ["b", "a", "c"]
+    assert fused[0]["distance"] == 0.2
+
+@pytest.mark.asyncio
+async def test_hybrid_retrieve_falls_back_to_lexical_when_saturated(mock_sentence_transformer, mock_chromadb, tmp_path):
+    rag = TherapyRAG(str(tmp_path))
+    rag.embedding_model = Mock()
+    rag.lexical_index.add(["b"], ["My doctor prescribed sertraline"])
+    rag.vector_store.collection.get.return_value = {
+        "ids": ["b"], "documents": ["My doctor prescribed sertraline"], "metadatas": [{"source": "s"}]
+    }
+    rag.retrieval_executor.waiting = 1
+
+    with patch.object(settings, "RETRIEVAL_MODE", "hybrid"):
+        results = await rag.retrieve("sertraline side effects", n_results=1)
+
+    assert [r["id"] for r in results] == ["b"]
+    assert rag.lexical_fallbacks == 1
+    rag.embedding_model.encode.assert_not_called()
+
+def test_maximal_marginal_relevance_skips_near_duplicates():
+    query = np.array([1.0, 0.0, 0.0])
+    candidates = np.array([
+        [0.9, 0.1, 0.0],
+        [0.9, 0.11, 0.0],  # paraphrase of the first
+        [0.7, 0.0, 0.7]
+    ])
+    assert maximal_marginal_relevance(query, candidates, 2, lambda_mult=0.5) == [0, 2]
+    assert maximal_marginal_relevance(query, candidates, 2, lambda_mult=1.0) == [0, 1]
+
+@pytest.mark.asyncio
+async def test_retrieve_with_mmr_returns_diverse_results(mock_sentence_transformer, mock_chromadb, tmp_path):
+    rag = TherapyRAG(str(tmp_path))
+    rag.embedding_model = Mock()
+    rag.embedding_model.encode.return_value = np.array([[1.0, 0.0, 0.0]])
+    rag.vector_store = NumpyVectorStore(str(tmp_path / "store"))
+    rag.vector_store.add(
+        ["a", "a2", "b"],
+        ["I cannot sleep", "I can't sleep", "Work stress keeps me up"],
+        np.array([[0.9, 0.1, 0.0], [0.9, 0.11, 0.0], [0.7, 0.0, 0.7]]),
+        [{"source": "s"}] * 3
+    )
+
+    with patch.object(settings, "RETRIEVAL_MODE", "vector"), patch.object(settings, "MMR_ENABLED", True):
+        results = await rag.retrieve("sleep", n_results=2)
+
+    assert [r["id"] for r in results] == ["a", "b"]
+    assert "embedding" not in results[0]
+
+def test_partitioned_vector_store_routes_and_filters(tmp_path):
+    store = PartitionedVectorStore(
+        lambda name: NumpyVectorStore(str(tmp_path / name)),
+        {"counsel_a": "counseling", "counsel_b": "counseling", "emotion": "emotion"}
+    )
+    store.add(
+        ["a", "b", "e"],
+        ["doc a", "doc b", "doc e"],
+        np.array([[1.0, 0.0], [0.9, 0.1], [0.95, 0.05]]),
+        [{"source": "counsel_a"}, {"source": "counsel_b"}, {"source": "emotion"}]
+    )
+    assert store.counts() == {"counseling": 2, "default": 0, "emotion": 1}
+    assert store.route(["counsel_b"]) == ["counseling"]
+
+    query = np.array([1.0, 0.0])
+    assert [r["id"] for r in store.query(query, 3)] == ["a", "e", "b"]
+    assert [r["id"] for r in store.query(query, 3, sources=["counsel_b", "emotion"])] == ["e", "b"]
+
+    store.drop_partition("emotion")
+    assert store.count() == 2
+
+def test_text_chunker_overlapping_windows():
+    chunker = TextChunker(window_tokens=13, overlap_tokens=3)  # 10 words, 2 overlapping
+    text = " ".join(f"w{i}" for i in range(25))
+    chunks = chunker.chunk(text)
+    assert chunks[0] == " ".join(f"w{i}" for i in range(10))
+    assert chunks[1].split()[:2] == ["w8", "w9"]
+    assert chunks[-1].endswith("w24")
+    assert chunker.chunk("a short text") == ["a short text"]
+
+def test_long_documents_become_linked_chunks():
+    processor = TherapyDatasetProcessor()
+    processor._chunker = TextChunker(window_tokens=13, overlap_tokens=3)
+    document = {"text": " ".join(f"word{i}" for i in range(60)), "metadata": {"source": "s", "split": "train"}}
+
+    chunks = processor._chunk_document(document)
+
+    assert len(chunks) > 1
+    assert {c["metadata"]["parent_id"] for c in chunks} == {document_id(document["text"], "s")}
+    assert [c["metadata"]["chunk_index"] for c in chunks] == list(range(len(chunks)))
+    assert collapse_chunks([{"id": c["text"], **c} for c in chunks]) == [{"id": chunks[0]["text"], **chunks[0]}]
+
+def test_prompt_packer_fills_budget_in_priority_order():
+    packer = PromptPacker(budget_tokens=14, count_tokens=lambda text: len(text.split()))
+    history = ["User: old turn here", "Therapist: newer turn", "User: newest"]
+    context = ["best example is far too long to fit", "short example"]
+
+    packed = packer.pack("system prompt", "hello", history, context)
+
+    # 4 fixed tokens, the header and two newest turns (7), then the short example (2)
+    assert (packed.history_used, packed.history_dropped) == (2, 1)
+    assert packed.context_used == [1]
+    assert "old turn" not in packed.text and "short example" in packed.text
+    assert packed.text.endswith("User: hello")
+    assert packed.tokens == len(packed.text.split()) <= packer.budget_tokens
+
+def test_warm_up_loads_lazily_and_reports_readiness(tmp_path):
+    rag = TherapyRAG(str(tmp_path))
+    assert rag._embedding_model is None and rag._vector_store is None
+    assert rag.warm_up_state == "pending" and not rag.ready
+
+    rag.embedding_model = Mock()
+    rag.vector_store = NumpyVectorStore(str(tmp_path / "store"))
+    rag.warm_up()
+    assert rag.ready
+    rag.embedding_model.encode.assert_called_once()
+
+    rag.embedding_model.encode.side_effect = RuntimeError("no model")
+    rag.warm_up()
+    assert rag.warm_up_state == "failed" and rag.warm_up_error == "no model"
+
+def test_snapshot_round_trip(tmp_path):
+    source = TherapyRAG(str(tmp_path / "source"))
+    source.vector_store = NumpyVectorStore(str(tmp_path / "source" / "store"))
+    source.vector_store.add(
+        ids=["a", "b"],
+        documents=["feeling anxious before exams", "sleep has been difficult ✨"],
+        embeddings=np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32),
+        metadatas=[{"source": "s1"}, {"source": "s2"}]
+    )
+    source.manifest.checkpoint("s1", rows_done=1, documents=1, completed=True)
+    export_snapshot(source, str(tmp_path / "bundle"), batch_size=1)
+
+    replica = TherapyRAG(str(tmp_path / "replica"))
+    replica.vector_store = NumpyVectorStore(str(tmp_path / "replica" / "store"))
+    manifest = import_snapshot(replica, str(tmp_path / "bundle"))
+
+    assert manifest["count"] == 2 and manifest["sources"] == {"s1": 1, "s2": 1}
+    assert replica.vector_store.get(["b"])[0]["text"] == "sleep has been difficult ✨"
+    assert replica.vector_store.query(np.array([1.0, 0.0]), 1)[0]["id"] == "a"
+    assert replica.lexical_index.search("exams", 1)[0][0] == "a"
+    assert replica.manifest.get("s1")["completed"]
+
+    with open(tmp_path / "bundle" / "metadatas.jsonl", "a") as f:
+        f.write("\n")
+    with pytest.raises(ValueError):
+        verify_snapshot(str(tmp_path / "bundle"))
+
+def test_chroma_store_applies_hnsw_profile_and_search_ef():
+    import chromadb
+
+    client = chromadb.EphemeralClient()
+    store = ChromaVectorStore(
+        client, "hnsw_profile_test", hnsw={"M": 8, "construction_ef": 64, "search_ef": 20}
+    )
+    assert store.hnsw_config()["max_neighbors"] == 8
+    assert store.hnsw_config()["ef_search"] == 20
+
+    reopened = ChromaVectorStore(client, "hnsw_profile_test", hnsw={"M": 32}, search_ef=150)
+    assert reopened.hnsw_config()["max_neighbors"] == 8
+    assert reopened.hnsw_config()["ef_search"] == 150
+
+def test_numpy_store_queries_with_embeddings_during_concurrent_adds(tmp_path):
+    store = NumpyVectorStore(str(tmp_path))
+    rng = np.random.default_rng(0)
+    store.add(["seed"], [""], rng.normal(size=(1, 8)), [{}])
+
+    def writer():
+        for batch in range(200):
+            store.add([f"{batch}"], [""], rng.normal(size=(1, 8)), [{}])
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        while thread.is_alive():
+            results = store.query(np.ones(8), 3, include_embeddings=True)
+            assert results and all(r["embedding"].shape == (8,) for r in results)
+    finally:
+        thread.join()
+
+def test_numpy_store_rescores_during_concurrent_adds(tmp_path):
+    store = NumpyVectorStore(str(tmp_path), dtype="int8", rescore=True)
+    rng = np.random.default_rng(0)
+    store.add(["seed"], [""], rng.normal(size=(1, 8)), [{}])
+
+    def writer():
+        for batch in range(200):
+            store.add([f"{batch}"], [""], rng.normal(size=(1, 8)), [{}])
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        while thread.is_alive():
+            assert store.query(np.ones(8), 3)
+    finally:
+        thread.join()
+
+def test_project_metadata_keeps_chunk_links():
+    chunk_metadata = {
+        "source": "s", "split": "train", "raw": "dropped",
+        "parent_id": "p", "chunk_index": 1, "chunk_count": 3
+    }
+
+    metadata = TherapyDatasetProcessor.project_metadata(chunk_metadata, {}, "s", "train")
+
+    assert metadata == {"source": "s", "split": "train", "parent_id": "p", "chunk_index": 1, "chunk_count": 3}
+    chunks = [{"id": "c0", "metadata": metadata}, {"id": "c1", "metadata": dict(metadata)}]
+    assert [c["id"] for c in collapse_chunks(chunks)] == ["c0"]
+
+def test_set_search_ef_reopens_chroma_and_refuses_while_indexing(tmp_path):
+    rag = TherapyRAG(str(tmp_path))
+    with patch.object(settings, "VECTOR_STORE_BACKEND", "chroma"):
+        old_client = rag.chroma_client
+        old_system = old_client._system
+        rag.vector_store.add(["a"], ["doc"], np.array([[1.0, 0.0]]), [{"source": "s"}])
+
+        rag.set_search_ef(77)
+
+        assert rag.chroma_client is not old_client
+        assert rag.vector_store.hnsw_config()["ef_search"] == 77
+        assert rag.vector_store.count() == 1
+        assert rag.chroma_client._system is not old_system
+
+        rag.indexing = True
+        with pytest.raises(RuntimeError):
+            rag.set_search_ef(20)
+
+def test_ingest_job_queue_single_flight_claim_and_requeue(tmp_path):
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+    job, created = queue.submit("index")
+    duplicate, duplicate_created = queue.submit("index")
+    assert created and not duplicate_created and duplicate["id"] == job["id"]
+    other, _ = queue.submit("rebuild_partition", {"partition": "emotion"})
+    assert other["id"] != job["id"]
+
+    assert queue.claim()["id"] == job["id"]
+    # Still single flight while running
+    assert queue.submit("index")[0]["id"] == job["id"]
+    assert queue.cancel(other["id"])["status"] == "cancelled"
+    assert queue.cancel(job["id"])["cancel_requested"]
+
+    # A worker restart finishes the cancelled job instead of requeueing it
+    queue.requeue_running()
+    assert queue.get(job["id"])["status"] == "cancelled"
+    assert queue.submit("index")[1]
+
+@pytest.mark.asyncio
+async def test_ingest_worker_reports_progress_and_cancels(tmp_path):
+    queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+    rag = Mock(building=None, index_version="legacy")
+    rag.index_aliases.live = "legacy"
+    staging = Mock(indexing_pipeline=IndexingPipeline(encode=lambda texts: texts, write=lambda batch: None))
+    staging.manifest.to_dict.return_value = {"datasets": {"ds": {"rows_done": 10, "documents": 8, "completed": False}}}
+
+    async def rebuild(datasets=None):
+        rag.building = staging
+        batches = (DocumentBatch("ds", [{"text": "t"}]) for _ in iter(int, 1))
+        await asyncio.to_thread(staging.indexing_pipeline.run, batches)
+
+    rag.rebuild = rebuild
+    worker = IngestWorker(queue, rag=rag, progress_seconds=0.05)
+    job, _ = queue.submit("index")
+    claimed = queue.claim()
+
+    async def cancel_soon():
+        await asyncio.sleep(0.2)
+        queue.cancel(job["id"])
+
+    asyncio.ensure_future(cancel_soon())
+    assert await worker.run_job(claimed) == "cancelled"
+    finished = queue.get(job["id"])
+    assert finished["status"] == "cancelled" and finished["finished_at"]
+    assert finished["progress"]["documents_indexed"] > 0
+    assert finished["progress"]["datasets"]["ds"]["rows_done"] == 10
+    assert queue.finished_since(job["created_at"])[0]["id"] == job["id"]
+
+@pytest.mark.asyncio
+async def test_rebuild_swaps_validated_versions_rolls_back_and_collects_old_ones(tmp_path):
+    emotion, counseling = "dair-ai/emotion", "Amod/mental_health_counseling_conversations"
+    texts = {emotion: [f"emotion example number {i}" for i in range(20)],
+             counseling: [f"counseling example number {i}" for i in range(20)]}
+
+    def prepare(self, dataset_name, start_row=0, num_proc=None):
+        rows = [{"text": text, "metadata": json.dumps({"source": dataset_name, "split": "train"}), "row": i}
+                for i, text in enumerate(texts[dataset_name]) if i >= start_row]
+        return Dataset.from_list(rows, features=TherapyDatasetProcessor.PREPARED_FEATURES) if rows else None
+
+    def encode(batch, **kwargs):
+        return np.stack([np.random.default_rng(abs(hash(text)) % 2**32).normal(size=8) for text in batch])
+
+    with patch.object(settings, "VECTOR_STORE_BACKEND", "numpy"), patch.object(settings, "DEDUP_ENABLED", False), \
+            patch.object(settings, "PREP_WORKERS", 1), patch.object(TherapyDatasetProcessor, "prepare", prepare), \
+            patch.object(settings, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache")):
+        rag = TherapyRAG(str(tmp_path))
+        rag.embedding_model = Mock(encode=Mock(side_effect=encode))
+
+        report = await rag.rebuild(datasets=[emotion, counseling])
+        assert report["failures"] == [] and report["sample_recall"] == 1.0
+        assert rag.index_version == "v1" and rag.vector_store.count() == 40
+        assert await rag.rebuild(datasets=[emotion, counseling]) is None
+
+        # Only the re-indexed dataset is encoded again; the other is copied
+        texts[emotion] = [f"new emotion example number {i}" for i in range(20)]
+        rag.embedding_model.encode.reset_mock()
+        await rag.rebuild(datasets=[emotion], force=True)
+        encoded = [text for call in rag.embedding_model.encode.call_args_list for text in call.args[0]]
+        assert set(encoded) == set(texts[emotion])
+        assert rag.index_version == "v2" and rag.index_aliases.previous == "v1"
+        assert rag.lexical_index.count() == 40
+        assert rag.lexical_index.search("new emotion", 1)
+
+        # Unchanged texts come from the embedding cache
+        rag.embedding_model.encode.reset_mock()
+        await rag.rebuild(datasets=[emotion], force=True)
+        rag.embedding_model.encode.assert_not_called()
+        assert rag.index_aliases.to_dict()["live"] == "v3"
+        assert not (tmp_path / "numpy" / "therapy_conversations_v1").exists()
+        assert (tmp_path / "numpy" / "therapy_conversations_v2").exists()
+
+        # A version that loses documents is rejected and the live one keeps serving
+        texts[emotion] = []
+        with pytest.raises(IndexValidationError) as error:
+            await rag.rebuild(datasets=[emotion], force=True)
+        assert "below" in str(error.value)
+        assert rag.index_version == "v3" and rag.vector_store.count() == 40
+        assert rag.index_aliases.building is None
+        assert not (tmp_path / "numpy" / "therapy_conversations_v4").exists()
+
+        assert rag.rollback() == "v2"
+        assert rag.collection_name == "therapy_conversations_v2" and rag.vector_store.count() == 40
+        assert TherapyRAG(str(tmp_path)).index_version == "v2"
+
+def test_embedding_cache_encodes_only_misses_persists_and_compacts(tmp_path):
+    encoder = Mock(side_effect=lambda texts: np.array([[len(text), 1.0] for text in texts]))
+    cache = EmbeddingCache(str(tmp_path), "test/model")
+    assert cache.lookup(["a"]) == [None] and not (tmp_path / "test_model").exists()
+
+    first = cache.encode(["aa", "b", "aa"], encoder)
+    assert first.tolist() == [[2, 1], [1, 1], [2, 1]]
+    assert cache.encode(["b", "ccc"], encoder).tolist() == [[1, 1], [3, 1]]
+    assert [call.args[0] for call in encoder.call_args_list] == [["aa", "b", "aa"], ["ccc"]]
+    assert cache.encode(["x"], encoder, store=False).tolist() == [[1, 1]]
+
+    future = Future()
+    pending = cache.encode(["dddd", "aa"], lambda texts: future)
+    future.set_result(np.array([[4.0, 1.0]]))
+    assert pending.result().tolist() == [[4, 1], [2, 1]]
+
+    reopened = EmbeddingCache(str(tmp_path), "test/model")
+    assert reopened.encode(["aa", "b", "ccc", "dddd"], encoder).tolist() == [[2, 1], [1, 1], [3, 1], [4, 1]]
+    stats = reopened.get_stats()
+    assert stats["entries"] == 4 and stats["hit_rate"] == 1.0
+    assert stats["total_hits"] == 6 and stats["total_misses"] == 7
+
+    assert reopened.compact(keep_texts=["ccc", "aa"])["entries"] == 2
+    assert [e is not None for e in cache.lookup(["aa", "b", "ccc"])] == [True, False, True]
+    assert cache.lookup(["ccc"])[0].tolist() == [3, 1]
+    assert EmbeddingCache.models(str(tmp_path)) == {str(tmp_path / "test_model"): "test/model"}
+
+@pytest.mark.asyncio
+async def test_cold_query_loads_the_model_off_the_event_loop(tmp_path):
+    loaded_on = []
+
+    def load_model(name):
+        loaded_on.append(threading.get_ident())
+        return Mock(encode=Mock(return_value=np.array([[0.1, 0.2, 0.3]])))
+
+    with patch(f"{TherapyRAG.__module__}.SentenceTransformer", side_effect=load_model), \
+            patch.object(settings, "EMBEDDING_CACHE_PATH", str(tmp_path / "embedding_cache")):
+        rag = TherapyRAG(str(tmp_path))
+        embedding = await rag._embed_query("cold query")
+
+    assert embedding.tolist() == [np.float32(0.1), np.float32(0.2), np.float32(0.3)]
+    assert loaded_on and loaded_on[0] != threading.get_ident()
+
+def test_numpy_vector_store_ignores_duplicate_ids(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "store"))
+    store.add(["a", "b", "a"], ["first", "second", "again"], np.eye(3)[:, :2] + 1, [{"n": 1}, {"n": 2}, {"n": 3}])
+    store.add(["b", "c"], ["second", "third"], np.ones((2, 2)), [{"n": 2}, {"n": 4}])
+    assert store.count() == 3
+    assert [doc["text"] for doc in store.get(["a", "b", "c"])] == ["first", "second", "third"]
+    reopened = NumpyVectorStore(str(tmp_path / "store"))
+    assert reopened.count() == 3 and reopened.query(np.ones(2), 3)
+
+@pytest.mark.asyncio
+async def test_indexing_duplicate_texts_across_batches_without_dedup(tmp_path):
+    name = "dair-ai/emotion"
+    rows = [{"text": f"repeated example text {i % 3}", "metadata": json.dumps({"source": name, "split": "train"}), "row": i}
+            for i in range(12)]
+
+    def prepare(self, dataset_name, start_row=0, num_proc=None):
+        return Dataset.from_list(rows[start_row:], features=TherapyDatasetProcessor.PREPARED_FEATURES)
+
+    # _drop_indexed only sees persisted batches; skip it so duplicates reach the store as in-flight ones do
+    with patch.object(settings, "VECTOR_STORE_BACKEND", "numpy"), patch.object(settings, "DEDUP_ENABLED", False), \
+            patch.object(settings, "BATCH_SIZE", 2), patch.object(settings, "PIPELINE_QUEUE_SIZE", 8), \
+            patch.object(settings, "EMBEDDING_CACHE_ENABLED", False), \
+            patch.object(TherapyDatasetProcessor, "prepare", prepare):
+        rag = TherapyRAG(str(tmp_path))
+        rag.embedding_model = Mock(encode=Mock(side_effect=lambda texts: np.ones((len(texts), 4))))
+        rag._drop_indexed = Mock(side_effect=lambda batch: [
+            {**doc, "id": document_id(doc["text"], doc["metadata"]["source"])} for doc in batch
+        ])
+        await rag.load_and_index_datasets(datasets=[name])
+
+    assert rag.vector_store.count() == 3
+    assert rag.lexical_index.count() == 3
+    assert rag.manifest.get(name)["completed"]
+
+def test_float16_store_extends_its_working_set_as_rows_are_added(tmp_path):
+    store = NumpyVectorStore(str(tmp_path / "store"), dtype="float16")
+    store.add(["a", "b"], ["a", "b"], np.array([[1.0, 0.0], [0.0, 1.0]]), [{}, {}])
+    assert store.query(np.array([1.0, 0.1]), 1)[0]["id"] == "a"
+    decoded = store._working_set
+    store.add(["c"], ["c"], np.array([[1.0, 1.0]]), [{}])
+    assert store.query(np.array([1.0, 1.0]), 1)[0]["id"] == "c"
+    assert len(store._working_set) == 3 and np.array_equal(store._working_set[:2], decoded)
+    assert "working_set_mb" in store.get_stats()
+
+def test_prompt_packer_counts_separators_and_header_at_the_budget_boundary():
+    history = ["User: first", "Therapist: second"]
+    context = ["example one", "example two"]
+    full = PromptPacker(10 ** 6, count_tokens=len).pack("system", "hi", history, context, instruction="Reply.")
+    assert full.history_used == 2 and len(full.context_used) == 2
+
+    exact = PromptPacker(len(full.text), count_tokens=len).pack("system", "hi", history, context, instruction="Reply.")
+    assert exact.text == full.text and exact.tokens == len(full.text)
+
+    for budget in range(len(full.text) - 40, len(full.text)):
+        packer = PromptPacker(budget, count_tokens=len)
+        packed = packer.pack("system", "hi", history, context, instruction="Reply.")
+        assert packed.tokens == len(packed.text) <= budget
+        assert packed.context_dropped + packed.history_dropped > 0
+
+    # A counter that charges joined text more than its parts is caught by the final count
+    packer = PromptPacker(50, count_tokens=lambda text: len(text.split()) ** 2)
+    packed = packer.pack("system", "hi", ["a b", "c d", "e f"], ["g h", "i j"])
+    assert packed.tokens == len(packed.text.split()) ** 2 <= packer.budget_tokens
+    # Examples go first, then the oldest turns
+    assert (packed.context_used, packed.history_used) == ([], 1) and "e f" in packed.text
+
+@pytest.mark.asyncio
+async def test_read_only_system_never_writes_chroma_while_a_job_runs(tmp_path):
+    from chromadb.api.client import Client
+    from chromadb.api.models.Collection import Collection
+
+    def refuse(*args, **kwargs):
+        raise AssertionError("the read-only system wrote to chroma")
+
+    writes = [patch.object(Collection, name, refuse) for name in ("add", "update", "upsert", "delete", "modify")]
+    writes += [patch.object(Client, name, refuse)
+               for name in ("create_collection", "get_or_create_collection", "delete_collection")]
+
+    with patch.object(settings, "VECTOR_STORE_BACKEND", "chroma"), patch.object(settings, "HNSW_SEARCH_EF", 50), \
+            patch.object(settings, "EMBEDDING_CACHE_ENABLED", False):
+        api = TherapyRAG(str(tmp_path), read_only=True)
+        api.embedding_model = Mock(encode=Mock(return_value=np.array([[1.0, 0.0]])))
+        for write in writes:
+            write.start()
+        try:
+            # Nothing indexed yet reads as empty instead of creating the collection
+            assert api.vector_store.count() == 0 and await api.retrieve("query") == []
+        finally:
+            for write in writes:
+                write.stop()
+
+        worker = TherapyRAG(str(tmp_path))
+        worker.vector_store.add(["a"], ["doc"], np.array([[1.0, 0.0]]), [{"source": "s"}])
+        worker.indexing = True
+        for write in writes:
+            write.start()
+        try:
+            api.reload()
+            assert [doc["id"] for doc in await api.retrieve("query", n_results=1)] == ["a"]
+            # The worker's HNSW_SEARCH_EF was applied by the worker, not the API
+            assert api.vector_store.hnsw_config()["ef_search"] == 50
+            with pytest.raises(RuntimeError):
+                api.set_search_ef(77)
+            with pytest.raises(RuntimeError):
+                await api.load_and_index_datasets()
+        finally:
+            for write in writes:
+                write.stop()
+        worker.indexing = False
+
+        # A queued search ef change is written by the worker and read by the API on reload
+        queue = IngestJobQueue(str(tmp_path / "jobs.sqlite3"))
+        job, _ = queue.submit("search_ef", {"search_ef": 77})
+        assert await IngestWorker(queue, rag=worker).run_job(queue.claim()) == "succeeded"
+        api.reload()
+        assert api.vector_store.hnsw_config()["ef_search"] == 77
+        api.retrieval_executor.shutdown()
+        worker.retrieval_executor.shutdown()
+
+@pytest.mark.asyncio
+async def test_config_change_reindexes_through_rebuild_without_old_documents(tmp_path):
+    emotion = "dair-ai/emotion"
+    prepared = []
+
+    def prepare(self, dataset_name, start_row=0, num_proc=None):
+        prepared.append(dataset_name)
+        rows = [{"text": f"emotion example {i} at chunk size {settings.CHUNK_TOKENS}",
+                 "metadata": json.dumps({"source": dataset_name, "split": "train"}), "row": i}
+                for i in range(start_row, 10)]
+        return Dataset.from_list(rows, features=TherapyDatasetProcessor.PREPARED_FEATURES) if rows else None
+
+    def encode(batch, **kwargs):
+        return np.stack([np.random.default_rng(abs(hash(text)) % 2**32).normal(size=8) for text in batch])
+
+    def texts(rag):
+        return sorted(text for _, documents, _ in rag.vector_store.iter_documents() for text in documents)
+
+    with patch.object(settings, "VECTOR_STORE_BACKEND", "numpy"), patch.object(settings, "DEDUP_ENABLED", False), \
+            patch.object(settings, "PREP_WORKERS", 1), patch.object(TherapyDatasetProcessor, "prepare", prepare), \
+            patch.object(settings, "EMBEDDING_CACHE_ENABLED", False), patch.object(settings, "CHUNK_TOKENS", 200):
+        rag = TherapyRAG(str(tmp_path))
+        rag.embedding_model = Mock(encode=Mock(side_effect=encode))
+        await rag.rebuild(datasets=[emotion])
+
+        with patch.object(settings, "CHUNK_TOKENS", 100):
+            # In place, the old documents could not be dropped, so the dataset is left to a rebuild
+            prepared.clear()
+            await rag.load_and_index_datasets(datasets=[emotion])
+            assert prepared == [] and rag.vector_store.count() == 10
+
+            await rag.rebuild(datasets=[emotion])
+            assert rag.vector_store.count() == rag.lexical_index.count() == 10
+            assert all(text.endswith("size 100") for text in texts(rag))
+
+        # An interrupted build whose checkpoints predate a config change starts over
+        version = rag.index_aliases.start_build([emotion])
+        IndexManifest(rag._version_paths(version)[2]).restore({
+            "datasets": {emotion: {"fingerprint": "old", "rows_done": 5, "documents": 5, "completed": False}},
+            "copied_from": rag.index_version
+        })
+        with patch.object(settings, "CHUNK_TOKENS", 120):
+            assert (await rag.rebuild(datasets=[emotion]))["failures"] == []
+            assert rag.index_version != version
+            assert all(text.endswith("size 120") for text in texts(rag)) and rag.vector_store.count() == 10
+
+def test_deduplicator_saves_and_loads_registered_documents(tmp_path):
+    text = " ".join(f"word{i}" for i in range(80))
+    path = str(tmp_path / "dedup.npz")
+    dedup = Deduplicator(threshold=0.8)
+    dedup.seed([text, "a short unrelated note"], ["a", "b"])
+    dedup.save(path, indexed=2)
+
+    # Other parameters, or a store that changed since, fall back to seeding
+    assert Deduplicator(threshold=0.8).load(path, indexed=3) is None
+    assert Deduplicator(threshold=0.7).load(path, indexed=2) is None
+
+    loaded = Deduplicator(threshold=0.8)
+    assert loaded.load(path, indexed=2) == 2
+    assert loaded.check(text + " word80", "c") == "near"
+    assert loaded.check("A short unrelated note", "c") == "exact"
+    without_a = Deduplicator(threshold=0.8)
+    assert without_a.load(path, indexed=2, exclude_sources=["a"]) == 1
+    assert without_a.check(text, "c") is None
+
+@pytest.mark.asyncio
+async def test_rebuild_loads_saved_dedup_signatures_instead_of_reseeding(tmp_path):
+    emotion, counseling = "dair-ai/emotion", "Amod/mental_health_counseling_conversations"
+    shared = " ".join(f"word{i}" for i in range(80))
+    texts = {emotion: [shared] + [f"emotion example number {i}" for i in range(9)],
+             counseling: [shared + " word80"] + [f"counseling example number {i}" for i in range(9)]}
+
+    def prepare(self, dataset_name, start_row=0, num_proc=None):
+        rows = [{"text": text, "metadata": json.dumps({"source": dataset_name, "split": "train"}), "row": i}
+                for i, text in enumerate(texts[dataset_name]) if i >= start_row]
+        return Dataset.from_list(rows, features=TherapyDatasetProcessor.PREPARED_FEATURES) if rows else None
+
+    def encode(batch, **kwargs):
+        return np.stack([np.random.default_rng(abs(hash(text)) % 2**32).normal(size=8) for text in batch])
+
+    with patch.object(settings, "VECTOR_STORE_BACKEND", "numpy"), patch.object(settings, "DEDUP_ENABLED", True), \
+            patch.object(settings, "DEDUP_SIMILARITY_THRESHOLD", 0.8), patch.object(settings, "PREP_WORKERS", 1), \
+            patch.object(TherapyDatasetProcessor, "prepare", prepare), \
+            patch.object(settings, "EMBEDDING_CACHE_ENABLED", False):
+        rag = TherapyRAG(str(tmp_path))
+        rag.embedding_model = Mock(encode=Mock(side_effect=encode))
+        await rag.rebuild(datasets=[emotion, counseling])
+        assert rag.vector_store.count() == 19
+
+        # The copied emotion documents' signatures come from the saved state, not their texts
+        with patch.object(Deduplicator, "seed", side_effect=AssertionError("reseeded from stored texts")):
+            await rag.rebuild(datasets=[counseling], force=True)
+        # The near duplicate of the shared emotion example is still dropped
+        assert rag.vector_store.count() == 19